@@ -6,7 +6,11 @@ from rest_framework.authtoken.admin import TokenProxy
 from backend.forms import ShopForm, OrderItemInLineFormset, OrderForm, UserForm, ContactForm, AddressForm, RatingForm, \
     ProductPhotoInLineFormset
 from backend.models import Order, Category, Product, Parameter, ProductParameter, Contact, Shop, ProductInfo, \
-    OrderItem, User, ConfirmEmailToken, Address, RatingProduct, ProductInfoPhoto
+    OrderItem, User, ConfirmEmailToken, Address, RatingProduct, ProductInfoPhoto, ImportJob, \
+    StockMovement
+from backend.utils.facets import update_parameter_index
+from backend.utils.search import update_search_documents
+from backend.utils.stock import record_movements
 
 # убираем автоматически создаваемую таблицу с токенами, ниже сделаем кастомную
 admin.site.unregister(TokenProxy)
@@ -124,6 +128,34 @@ class CategoryAdmin(admin.ModelAdmin):
     exclude = ['shops']
 
 
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    """Фоновые загрузки прайсов магазинов, только просмотр"""
+    list_display = ['id', 'shop', 'method', 'state', 'total', 'processed', 'loaded', 'failed', 'created_at']
+    list_display_links = ['id', 'shop']
+    list_filter = ['state', 'shop']
+    readonly_fields = ['shop', 'method', 'file', 'state', 'total', 'processed', 'loaded', 'failed', 'checkpoint',
+                       'checkpoint_id', 'attempts', 'errors', 'stats', 'created_at', 'finished_at']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    """Журнал движения остатков товаров, только просмотр: записи не изменяются и не удаляются"""
+    list_display = ['id', 'product_info', 'kind', 'quantity', 'created_at']
+    list_display_links = ['id', 'product_info']
+    list_filter = ['kind']
+    readonly_fields = ['product_info', 'kind', 'quantity', 'created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     """Связь Категория - Наименование продукта"""
@@ -132,6 +164,18 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ['name', 'category']
     list_filter = ['category']
 
+    def save_model(self, request, obj, form, change):
+        """Название продукта входит в поисковые документы его товаров, категория - в индекс характеристик"""
+        super().save_model(request, obj, form, change)
+        if change and {'name', 'category'} & set(form.changed_data):
+            # товары продукта при следующей загрузке прайса перезаписываются
+            obj.product_info.update(content_hash='')
+        if change and 'name' in form.changed_data:
+            update_search_documents(obj.product_info.values_list('id', flat=True))
+        # при переносе продукта в другую категорию его товары переходят в индекс характеристик новой категории
+        if change and 'category' in form.changed_data:
+            update_parameter_index(obj.product_info.values_list('id', flat=True), [form.initial['category']])
+
 
 @admin.register(Parameter)
 class ParameterAdmin(admin.ModelAdmin):
@@ -140,6 +184,13 @@ class ParameterAdmin(admin.ModelAdmin):
     list_display_links = ['id', 'name']
     search_fields = ['name']
 
+    def save_model(self, request, obj, form, change):
+        """Название характеристики входит в поисковые документы товаров с этой характеристикой"""
+        super().save_model(request, obj, form, change)
+        if change and 'name' in form.changed_data:
+            ProductInfo.objects.filter(product_parameters__parameter=obj).update(content_hash='')
+            update_search_documents(obj.product_parameters.values_list('product_id', flat=True))
+
 
 class AddressInline(admin.TabularInline):
     model = Address
@@ -191,6 +242,31 @@ class ProductInfoAdmin(admin.ModelAdmin):
         })
     )
 
+    def save_model(self, request, obj, form, change):
+        """Изменение остатка записывается в журнал движения остатков корректировкой на разницу с текущим остатком"""
+        # текущий остаток блокируется до записи: поставка между открытием формы и сохранением учитывается в разнице
+        previous = ProductInfo.objects.select_for_update().filter(id=obj.id).\
+            values_list('quantity', flat=True).first() if change else 0
+        super().save_model(request, obj, form, change)
+        record_movements({obj.id: obj.quantity - (previous or 0)}, 'correction')
+
+    def save_related(self, request, form, formsets, change):
+        """
+        Пересчет поискового документа и индекса характеристик после сохранения товара с характеристиками:
+        в индексе обновляются только posting lists значений этого товара
+        """
+        super().save_related(request, form, formsets, change)
+        # правка в обход прайса: при следующей загрузке товар перезаписывается
+        ProductInfo.objects.filter(id=form.instance.id).update(content_hash='')
+        update_search_documents([form.instance.id])
+        # при переносе товара к продукту другой категории товар удаляется и из индекса категории, из которой ушел
+        category_ids = {form.instance.product.category_id}
+        if change and 'product' in form.changed_data:
+            category_ids.update(Product.objects.filter(id=form.initial['product'])
+                                .values_list('category_id', flat=True))
+        update_parameter_index([form.instance.id], category_ids)
+        Product.update_offers([form.instance.product_id])
+
 
 # @admin.register(ProductInfoPhoto)   # в инлайне информации о товаре в магазине
 # class ProductInfoPhotoAdmin(admin.ModelAdmin):
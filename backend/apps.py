@@ -5,3 +5,7 @@ class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend'
     verbose_name = 'Магазин'
+
+    def ready(self):
+        # подключаем receivers сигналов моделей (пересчет агрегатов) для всех точек входа: api, админка, celery
+        import backend.signals  # noqa: F401
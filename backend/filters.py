@@ -1,6 +1,15 @@
-from django_filters import CharFilter, NumberFilter, rest_framework
+import re
 
-from backend.models import ProductInfo
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Cast
+from django_filters import BooleanFilter, CharFilter, NumberFilter, rest_framework
+from rest_framework.filters import SearchFilter
+
+from backend.models import Product, ProductInfo
+from backend.utils.facets import filter_by_parameters, parse_parameter_filters
+from backend.utils.search import SEARCH_CONFIG
 
 
 def query_filter_maker(request, param_name: str, lookup: str, lower=False) -> dict:
@@ -46,6 +55,69 @@ class ProductsFilter(rest_framework.FilterSet):
     # фильтр по частичному совпадению названия магазина
     shop_name = CharFilter(field_name='shop__name', lookup_expr='icontains')
 
+    # фильтр по характеристикам товара 'характеристика:значение', параметр можно передать несколько раз
+    param = CharFilter(method='filter_parameters')
+
+    # только самое дешевое предложение по каждому продукту (из агрегата предложений Product.best_offer)
+    best_offer = BooleanFilter(method='filter_best_offer')
+
     class Meta:
         model = ProductInfo
-        fields = ['shop_id', 'category_id', 'price_more', 'price_less', 'shop_name', 'category']
+        fields = ['shop_id', 'category_id', 'price_more', 'price_less', 'shop_name', 'category', 'param', 'best_offer']
+
+    def filter_parameters(self, queryset, name, value):
+        parameters = parse_parameter_filters(self.data.getlist(name))
+        return filter_by_parameters(queryset, parameters, self.data.get('category_id'))
+
+    @staticmethod
+    def filter_best_offer(queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(id__in=Product.objects.filter(best_offer__isnull=False).values('best_offer_id'))
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск товаров по параметру 'search' (поисковый документ ProductInfo.search_document).
+
+    В Postgres каждое слово запроса ищется как префикс в tsvector документа (стемминг russian) или по
+    триграммной похожести слов (опечатки), оба условия обслуживаются GIN индексами. Товары аннотируются
+    релевантностью search_rank, по которой пагинация сортирует выдачу, если не передан 'ordering'.
+
+    В других СУБД (SQLite в тестах) каждое слово ищется вхождением в документ, релевантность постоянна.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        words = [word for term in self.get_search_terms(request) for word in re.findall(r'\w+', term.lower())]
+        if not words:
+            return queryset
+        if connection.vendor == 'postgresql':
+            return self.postgres_search(queryset, words)
+        return self.fallback_search(queryset, words)
+
+    def postgres_search(self, queryset, words: list):
+        """
+        Поиск по tsvector с префиксным tsquery ('слово:* & ...') + триграммная похожесть слов
+
+        :param queryset: queryset товаров
+        :param words: слова запроса в нижнем регистре
+        """
+        phrase = ' '.join(words)
+        vector = SearchVector('search_document', config=SEARCH_CONFIG)
+        query = SearchQuery(' & '.join(f'{word}:*' for word in words), config=SEARCH_CONFIG, search_type='raw')
+        similarity = TrigramWordSimilarity(phrase, 'search_document')
+        return queryset.annotate(search_vector=vector,
+                                 search_rank=Cast(SearchRank(vector, query) + similarity, FloatField())).\
+            filter(Q(search_vector=query) | Q(search_document__trigram_word_similar=phrase))
+
+    @staticmethod
+    def fallback_search(queryset, words: list):
+        """
+        Поиск вхождением каждого слова запроса в поисковый документ (без Postgres)
+
+        :param queryset: queryset товаров
+        :param words: слова запроса в нижнем регистре
+        """
+        for word in words:
+            queryset = queryset.filter(search_document__contains=word)
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
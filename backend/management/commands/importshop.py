@@ -0,0 +1,88 @@
+import json
+
+import yaml
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import URLValidator
+from django.db import IntegrityError, connection
+
+from backend.models import ImportJob, Shop, User
+from backend.utils.bulk_import import run_sharded_import
+from backend.utils.get_data_from_yaml import create_categories
+from backend.utils.import_stats import ImportStats
+from backend.utils.price_list import PriceListError, get_price_list_format, iter_price_list_goods, \
+    read_price_list_header
+
+
+class Command(BaseCommand):
+    """
+    Команда для загрузки прайса магазина из файла в обход API и Celery (первичная загрузка крупного партнера).
+    Прайс разбирается один раз, товары шардируются по артикулу между процессами, каждый процесс записывает
+    свой шард пачками через собственное соединение с БД. Загрузка выполняется так же, как PartnerUpdate:
+    POST - полная замена остатков, PATCH - поставка, суммирующаяся с остатками.
+    """
+
+    help = 'Загрузка прайса магазина из файла несколькими процессами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='файл прайса (.yaml, .csv, .jsonl)')
+        parser.add_argument('--shop', help='название магазина, по умолчанию - из прайса')
+        parser.add_argument('--method', choices=('POST', 'PATCH'), default='POST', help='http-метод загрузки')
+        parser.add_argument('--workers', type=int, default=1, help='количество процессов загрузки')
+        parser.add_argument('--user', help='email менеджера для создания нового магазина (POST)')
+        parser.add_argument('--url', help='url нового магазина (POST)')
+
+    def handle(self, *args, **options):  # python manage.py importshop <file> [--shop] [--method] [--workers N]
+        price_format = get_price_list_format(options['file'])
+        if not price_format:
+            raise CommandError('Поддерживаются прайсы в форматах yaml, csv и jsonl')
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('Количество процессов должно быть не меньше 1')
+        if workers > 1 and connection.vendor == 'sqlite':
+            # SQLite не допускает одновременной записи из нескольких соединений
+            self.stderr.write('SQLite: загрузка выполняется в одном процессе')
+            workers = 1
+
+        stats = ImportStats()
+        try:
+            with stats.capture(), stats.stage('header'), open(options['file'], 'rb') as file:
+                header = read_price_list_header(file, price_format)
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть файл прайса: {error}')
+        except (yaml.YAMLError, PriceListError) as error:
+            raise CommandError(f'Некорректный прайс: {error}')
+
+        shop = self.get_shop(options['shop'] or header.get('shop'), options)
+        errors = {}
+        if header.get('categories'):
+            with stats.capture(), stats.stage('categories'):
+                create_categories(header['categories'], shop, 0, [], errors)
+
+        job = ImportJob.objects.create(shop=shop, method=options['method'], errors=errors, stats=stats.as_dict())
+        with open(options['file'], 'rb') as file:
+            result = run_sharded_import(job, iter_price_list_goods(file, price_format), workers)
+        self.stdout.write(json.dumps({'job_id': job.id, **result}, ensure_ascii=False, indent=2))
+
+    @staticmethod
+    def get_shop(name: str, options: dict) -> Shop:
+        """Магазин загрузки; при POST с --user и --url отсутствующий магазин создается, как в PartnerUpdate.post"""
+        if not name:
+            raise CommandError('Не указан магазин: нет --shop и раздела shop в прайсе')
+        shop = Shop.objects.filter(name=name).first()
+        if shop:
+            return shop
+        if options['method'] != 'POST' or not options['user'] or not options['url']:
+            raise CommandError(f'Магазин "{name}" не найден, для создания укажите --user и --url (POST)')
+
+        user = User.objects.filter(email=options['user'], type='shop').first()
+        if not user:
+            raise CommandError(f'Менеджер магазина {options["user"]} не найден')
+        try:
+            URLValidator()(options['url'])
+        except ValidationError as error:
+            raise CommandError(f'Некорректный url магазина: {error.messages[0]}')
+        try:
+            return Shop.objects.create(name=name, user=user, url=options['url'])
+        except IntegrityError:
+            raise CommandError(f'У менеджера {options["user"]} уже есть магазин')
@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.models import ImportJob
+from backend.tasks import task_import_price_list
+from backend.utils.bulk_import import fail_import_job
+
+
+class Command(BaseCommand):
+    """
+    Команда для возобновления загрузок прайсов, прерванных перезапуском воркера Celery или ошибкой.
+    Загрузка продолжается с контрольной точки - товара, следующего за последней записанной пачкой.
+    Возобновляются загрузки в статусе failed и загрузки в статусе running, прогресс которых не записывался
+    дольше IMPORT_STALE_TIMEOUT (воркер остановлен). Перед постановкой в очередь загрузка захватывается
+    сменой статуса при неизменном времени обновления: параллельно запущенные команды и выполняющийся воркер
+    не возобновляют ее повторно. Загрузка, воркер которой прерывался на каждой из IMPORT_MAX_ATTEMPTS попыток,
+    не возобновляется, а завершается ошибкой (fail_import_job).
+    """
+
+    help = 'Возобновление прерванных загрузок прайсов с контрольной точки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_id', nargs='*', type=int)
+        parser.add_argument('--timeout', type=int, default=settings.IMPORT_STALE_TIMEOUT,
+                            help='сек без записи прогресса, после которых загрузка running считается прерванной')
+
+    def handle(self, *args, **options):  # python manage.py resumeimports [<job_id: int> ...] [--timeout сек]
+        stale = timezone.now() - timedelta(seconds=options['timeout'])
+        jobs = ImportJob.objects.filter(Q(state='failed') | Q(state='running', updated_at__lt=stale)).\
+            exclude(file='').order_by('id')
+        if options['job_id']:
+            jobs = jobs.filter(id__in=options['job_id'])
+
+        for job in jobs:
+            if not job.resumable:  # параллельная загрузка, часть пачек которой записана без контрольной точки
+                self.stdout.write(f'{job}: нет контрольной точки, прайс нужно загрузить заново')
+                continue
+            # загрузка, поставленная в очередь и не начатая воркером, снова станет прерванной через timeout
+            exhausted = job.attempts >= settings.IMPORT_MAX_ATTEMPTS
+            claimed = ImportJob.objects.filter(id=job.id, state=job.state, updated_at=job.updated_at).\
+                update(state='running', updated_at=timezone.now())
+            if not claimed:
+                self.stdout.write(f'{job}: уже возобновлена или выполняется')
+                continue
+            if exhausted:  # воркер прерывался на каждой попытке: загрузка завершается окончательно
+                fail_import_job(job, f'Загрузка прервана, попыток: {job.attempts}')
+                self.stdout.write(f'{job}: исчерпаны попытки загрузки, прайс нужно загрузить заново')
+                continue
+            task_import_price_list.delay(job.id)
+            self.stdout.write(f'{job}: возобновлена с товара {job.checkpoint + 1}')
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.3 on 2026-10-17 04:27
+
+import datetime
+import django.core.validators
+from django.db import migrations, models
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    """Заполнение агрегатов рейтинга для уже выставленных оценок"""
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    RatingProduct = apps.get_model('backend', 'RatingProduct')
+
+    aggregates = {}
+    for product_id, rating in RatingProduct.objects.values_list('product_id', 'rating'):
+        count, total = aggregates.get(product_id, (0, 0))
+        aggregates[product_id] = (count + 1, total + int(rating))
+    for product_id, (count, total) in aggregates.items():
+        ProductInfo.objects.filter(id=product_id).update(rating_count=count, rating_sum=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0018_alter_order_delivery_date_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='productinfo',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='delivery_date',
+            field=models.DateField(blank=True, default=datetime.date(2026, 10, 18), null=True, validators=[django.core.validators.MinValueValidator(datetime.date(2026, 10, 18))], verbose_name='Дата доставки'),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.3 on 2026-10-17 04:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_main_photo(apps, schema_editor):
+    """Заполнение ссылки на главное изображение для уже загруженных изображений товаров"""
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductInfoPhoto = apps.get_model('backend', 'ProductInfoPhoto')
+
+    for photo_id, product_id in ProductInfoPhoto.objects.filter(is_main=True).values_list('id', 'product_id'):
+        ProductInfo.objects.filter(id=product_id).update(main_photo_id=photo_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0019_productinfo_rating_count_productinfo_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='main_photo',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.productinfophoto', verbose_name='Главное изображение'),
+        ),
+        migrations.RunPython(fill_main_photo, migrations.RunPython.noop),
+    ]
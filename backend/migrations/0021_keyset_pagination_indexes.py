@@ -0,0 +1,17 @@
+# Generated by Django 4.1.3 on 2026-10-17 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0020_productinfo_main_photo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['price', 'id'], name='productinfo_price_id_idx'),
+        ),
+    ]
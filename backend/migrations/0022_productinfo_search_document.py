@@ -0,0 +1,61 @@
+# Generated by Django 4.1.3 on 2026-10-17 04:33
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+
+def search_indexes():
+    """GIN индексы поиска: tsvector документа (russian) и триграммы документа"""
+    return [
+        GinIndex(SearchVector('search_document', config='russian'), name='productinfo_search_vector_idx'),
+        GinIndex(fields=['search_document'], name='productinfo_search_trgm_idx', opclasses=['gin_trgm_ops']),
+    ]
+
+
+def fill_search_document(apps, schema_editor):
+    """Заполнение поисковых документов для уже загруженных товаров"""
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+
+    goods = list(ProductInfo.objects.select_related('product').prefetch_related('product_parameters__parameter'))
+    for good in goods:
+        parts = [good.product.name, good.model]
+        for item in good.product_parameters.all():
+            parts.extend([item.parameter.name, str(item.value)])
+        good.search_document = ' '.join(part for part in parts if part).lower()
+    ProductInfo.objects.bulk_update(goods, ['search_document'], batch_size=500)
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    for index in search_indexes():
+        schema_editor.add_index(ProductInfo, index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    for index in search_indexes():
+        schema_editor.remove_index(ProductInfo, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0021_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Поисковый документ'),
+        ),
+        migrations.RunPython(fill_search_document, migrations.RunPython.noop),
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
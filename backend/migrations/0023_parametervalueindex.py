@@ -0,0 +1,46 @@
+# Generated by Django 4.1.3 on 2026-10-17 04:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_parameter_index(apps, schema_editor):
+    """Построение индекса значений характеристик для уже загруженных товаров"""
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    ParameterValueIndex = apps.get_model('backend', 'ParameterValueIndex')
+
+    postings = {}
+    rows = ProductParameter.objects.values_list('product__product__category_id', 'parameter_id', 'value',
+                                                'product_id').order_by('product_id')
+    for category_id, parameter_id, value, product_id in rows:
+        postings.setdefault((category_id, parameter_id, value), []).append(product_id)
+    ParameterValueIndex.objects.bulk_create(
+        [ParameterValueIndex(category_id=category_id, parameter_id=parameter_id, value=value, product_infos=ids)
+         for (category_id, parameter_id, value), ids in postings.items()],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0022_productinfo_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterValueIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('product_infos', models.JSONField(default=list, verbose_name='Товары')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_values', to='backend.category', verbose_name='Категория')),
+                ('parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_values', to='backend.parameter', verbose_name='Параметр')),
+            ],
+            options={
+                'verbose_name': 'Индекс значения параметра',
+                'verbose_name_plural': 'Индекс значений параметров',
+                'unique_together': {('category', 'parameter', 'value')},
+            },
+        ),
+        migrations.RunPython(fill_parameter_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.1.3 on 2026-10-17 04:49
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_offers(apps, schema_editor):
+    """Заполнение агрегата предложений магазинов для уже загруженных продуктов"""
+    Product = apps.get_model('backend', 'Product')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+
+    offers = ProductInfo.objects.filter(product=OuterRef('pk'), shop__state=True, quantity__gt=0)
+    grouped = offers.order_by().values('product')
+    Product.objects.update(
+        min_price=Subquery(grouped.annotate(value=Min('price')).values('value')),
+        max_price=Subquery(grouped.annotate(value=Max('price')).values('value')),
+        offers_count=Coalesce(Subquery(grouped.annotate(value=Count('id')).values('value')), 0),
+        shops_in_stock=Coalesce(Subquery(grouped.annotate(value=Count('shop', distinct=True)).values('value')), 0),
+        best_offer=Subquery(offers.order_by('price', 'id').values('id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0023_parametervalueindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='best_offer',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.productinfo', verbose_name='Лучшее предложение'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='max_price',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Максимальная цена'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_price',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Минимальная цена'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='offers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество предложений'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='shops_in_stock',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Магазинов с товаром в наличии'),
+        ),
+        migrations.RunPython(fill_offers, migrations.RunPython.noop),
+    ]
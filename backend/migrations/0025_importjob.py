@@ -0,0 +1,37 @@
+# Generated by Django 4.1.3 on 2026-10-17 05:03
+
+import backend.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0024_product_offers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=10, verbose_name='Http-метод загрузки')),
+                ('file', models.FileField(storage=backend.models.import_storage, upload_to='price_lists/%Y/%m/%d/', verbose_name='Файл прайса')),
+                ('state', models.CharField(choices=[('new', 'В очереди'), ('running', 'Загружается'), ('done', 'Завершена'), ('failed', 'Ошибка')], default='new', max_length=20, verbose_name='Статус загрузки')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='Товаров в прайсе')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано товаров')),
+                ('loaded', models.PositiveIntegerField(default=0, verbose_name='Загружено/обновлено товаров')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Не удалось загрузить товаров')),
+                ('errors', models.JSONField(blank=True, default=dict, verbose_name='Ошибки загрузки')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата и время создания')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата и время завершения')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Загрузка прайса',
+                'verbose_name_plural': 'Загрузки прайсов',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
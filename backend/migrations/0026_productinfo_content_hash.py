@@ -0,0 +1,33 @@
+# Generated by Django 4.1.3 on 2026-10-17 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0025_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='created',
+            field=models.PositiveIntegerField(default=0, verbose_name='Создано товаров'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='unchanged',
+            field=models.PositiveIntegerField(default=0, verbose_name='Товаров без изменений'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='updated',
+            field=models.PositiveIntegerField(default=0, verbose_name='Обновлено товаров'),
+        ),
+        migrations.AddField(
+            model_name='productinfo',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='Хеш содержимого из прайса'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.3 on 2026-10-17 05:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0026_productinfo_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='checkpoint',
+            field=models.PositiveIntegerField(default=0, verbose_name='Контрольная точка: товаров прайса в записанных пачках'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='checkpoint_id',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Контрольная точка: артикул последнего товара'),
+        ),
+    ]
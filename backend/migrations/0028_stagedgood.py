@@ -0,0 +1,30 @@
+# Generated by Django 4.1.3 on 2026-10-17 05:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0027_importjob_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedGood',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.PositiveIntegerField(verbose_name='Артикул товара')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('content_hash', models.CharField(max_length=32, verbose_name='Хеш содержимого товара')),
+                ('data', models.JSONField(verbose_name='Проверенные данные товара')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_goods', to='backend.importjob', verbose_name='Загрузка прайса')),
+            ],
+            options={
+                'verbose_name': 'Товар загружаемого прайса',
+                'verbose_name_plural': 'Товары загружаемых прайсов',
+                'unique_together': {('job', 'external_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.3 on 2026-10-17 06:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0028_stagedgood'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('receipt', 'Поставка'), ('reset', 'Установка по прайсу'), ('correction', 'Корректировка')], max_length=10, verbose_name='Вид движения')),
+                ('quantity', models.IntegerField(verbose_name='Изменение остатка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата и время движения')),
+                ('product_info', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='backend.productinfo', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Движение остатка',
+                'verbose_name_plural': 'Журнал движения остатков',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
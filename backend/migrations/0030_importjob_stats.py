@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-17 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0029_stockmovement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='stats',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Метрики загрузки'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.3 on 2026-10-17 09:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0030_importjob_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата и время обновления'),
+            preserve_default=False,
+        ),
+    ]
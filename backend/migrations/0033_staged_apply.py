@@ -0,0 +1,66 @@
+# Generated by Django 4.1.3 on 2026-10-17 07:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0032_importjob_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stagedgood',
+            name='description',
+            field=models.TextField(blank=True, null=True, verbose_name='Описание товара'),
+        ),
+        migrations.AddField(
+            model_name='stagedgood',
+            name='model',
+            field=models.CharField(blank=True, max_length=80, verbose_name='Модель'),
+        ),
+        migrations.AddField(
+            model_name='stagedgood',
+            name='price',
+            field=models.PositiveIntegerField(default=0, verbose_name='Цена'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='stagedgood',
+            name='price_rrc',
+            field=models.PositiveIntegerField(default=0, verbose_name='Рекомендуемая розничная цена'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='stagedgood',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.product', verbose_name='Продукт'),
+        ),
+        migrations.AddField(
+            model_name='stagedgood',
+            name='product_info',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.productinfo', verbose_name='Товар'),
+        ),
+        migrations.AddField(
+            model_name='stagedgood',
+            name='search_document',
+            field=models.TextField(blank=True, default='', verbose_name='Поисковый документ'),
+        ),
+        migrations.CreateModel(
+            name='StagedParameter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.PositiveIntegerField(verbose_name='Артикул товара')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_parameters', to='backend.importjob', verbose_name='Загрузка прайса')),
+                ('parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.parameter', verbose_name='Параметр')),
+            ],
+            options={
+                'verbose_name': 'Характеристика товара загружаемого прайса',
+                'verbose_name_plural': 'Характеристики товаров загружаемых прайсов',
+                'unique_together': {('job', 'external_id', 'parameter')},
+            },
+        ),
+    ]
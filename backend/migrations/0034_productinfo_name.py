@@ -0,0 +1,32 @@
+# Generated by Django 4.1.3 on 2026-10-17 08:06
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_name(apps, schema_editor):
+    """Заполнение денормализованного наименования продукта у уже загруженных товаров"""
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    Product = apps.get_model('backend', 'Product')
+
+    ProductInfo.objects.update(name=Subquery(Product.objects.filter(id=OuterRef('product_id')).values('name')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0033_staged_apply'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=80, verbose_name='Наименование продукта'),
+        ),
+        migrations.RunPython(fill_name, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['name', 'id'], name='productinfo_name_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-17 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0034_productinfo_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='Попыток загрузки'),
+        ),
+    ]
@@ -1,7 +1,10 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
-from django.db.models import Sum, F
+from django.db.models import Sum, F, Count, IntegerField, Min, Max, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MinLengthValidator, URLValidator
 from django_rest_passwordreset.tokens import get_token_generator
@@ -39,6 +42,21 @@ DELIVERY_TIME_CHOICES = (
     ('evening_18_22', '18:00 - 22:00')
 )
 
+# Варианты статуса фоновой загрузки прайса
+IMPORT_JOB_STATE_CHOICES = (
+    ('new', 'В очереди'),
+    ('running', 'Загружается'),
+    ('done', 'Завершена'),
+    ('failed', 'Ошибка'),
+)
+
+# Варианты движения остатков товара
+STOCK_MOVEMENT_KIND_CHOICES = (
+    ('receipt', 'Поставка'),
+    ('reset', 'Установка по прайсу'),
+    ('correction', 'Корректировка'),
+)
+
 # Варианты оценки товара
 RATING_PRODUCT_CHOICES = (
     ('1', '1 звезда'),
@@ -238,6 +256,30 @@ class Product(models.Model):
                                  verbose_name='Категория')
     # product_info - м2м связь с магазинами, остатки на складах
 
+    # агрегат предложений магазинов для сравнения цен: товары в наличии в магазинах, принимающих заказы,
+    # пересчитывается в update_offers
+    min_price = models.PositiveIntegerField(null=True,
+                                            blank=True,
+                                            editable=False,
+                                            verbose_name='Минимальная цена')
+    max_price = models.PositiveIntegerField(null=True,
+                                            blank=True,
+                                            editable=False,
+                                            verbose_name='Максимальная цена')
+    offers_count = models.PositiveIntegerField(default=0,
+                                               editable=False,
+                                               verbose_name='Количество предложений')
+    shops_in_stock = models.PositiveIntegerField(default=0,
+                                                 editable=False,
+                                                 verbose_name='Магазинов с товаром в наличии')
+    best_offer = models.ForeignKey('ProductInfo',
+                                   on_delete=models.SET_NULL,
+                                   related_name='+',
+                                   null=True,
+                                   blank=True,
+                                   editable=False,
+                                   verbose_name='Лучшее предложение')
+
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
@@ -247,6 +289,25 @@ class Product(models.Model):
     def __str__(self):
         return f'{self.name}, {self.category}'
 
+    @staticmethod
+    def update_offers(product_ids) -> None:
+        """
+        Пересчет агрегата предложений продуктов одним UPDATE с подзапросами к ProductInfo: минимальная и
+        максимальная цена, количество предложений, количество магазинов и самое дешевое предложение среди товаров
+        в наличии в магазинах, принимающих заказы
+
+        :param product_ids: id продуктов (список или values queryset)
+        """
+        offers = ProductInfo.objects.filter(product=OuterRef('pk'), shop__state=True, quantity__gt=0)
+        grouped = offers.order_by().values('product')
+        Product.objects.filter(id__in=product_ids).update(
+            min_price=Subquery(grouped.annotate(value=Min('price')).values('value')),
+            max_price=Subquery(grouped.annotate(value=Max('price')).values('value')),
+            offers_count=Coalesce(Subquery(grouped.annotate(value=Count('id')).values('value')), 0),
+            shops_in_stock=Coalesce(Subquery(grouped.annotate(value=Count('shop', distinct=True)).values('value')), 0),
+            best_offer=Subquery(offers.order_by('price', 'id').values('id')[:1]),
+        )
+
 
 class ProductInfo(models.Model):
     """
@@ -274,6 +335,40 @@ class ProductInfo(models.Model):
                              verbose_name='Модель')
     price = models.PositiveIntegerField(verbose_name='Цена')
     price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    # денормализованное наименование продукта для keyset-сортировки каталога по названию одним индексом (name, id),
+    # записывается загрузкой прайса и сигналами сохранения товара и продукта
+    name = models.CharField(max_length=80,
+                            blank=True,
+                            default='',
+                            editable=False,
+                            verbose_name='Наименование продукта')
+    # денормализованные агрегаты оценок для каталога, пересчитываются в сигналах при изменении RatingProduct
+    rating_count = models.PositiveIntegerField(default=0,
+                                               editable=False,
+                                               verbose_name='Количество оценок')
+    rating_sum = models.PositiveIntegerField(default=0,
+                                             editable=False,
+                                             verbose_name='Сумма оценок')
+    # поисковый документ товара (название, модель, характеристики), обновляется в backend.utils.search
+    search_document = models.TextField(blank=True,
+                                       default='',
+                                       editable=False,
+                                       verbose_name='Поисковый документ')
+    # хеш содержимого товара из последнего загруженного прайса, неизменившиеся товары при загрузке не перезаписываются
+    # (backend.utils.bulk_import), правки в обход загрузки его сбрасывают
+    content_hash = models.CharField(max_length=32,
+                                    blank=True,
+                                    default='',
+                                    editable=False,
+                                    verbose_name='Хеш содержимого из прайса')
+    # главное изображение товара для иконки в каталоге, поддерживается ProductInfoPhoto.save и сигналом удаления
+    main_photo = models.ForeignKey('ProductInfoPhoto',
+                                   on_delete=models.SET_NULL,
+                                   related_name='+',
+                                   null=True,
+                                   blank=True,
+                                   editable=False,
+                                   verbose_name='Главное изображение')
     # product_parameters - m2m связь с характеристиками
     # ratings - m2m связь с отзывами
     # photos - связь с фотографиями товара
@@ -282,10 +377,43 @@ class ProductInfo(models.Model):
         verbose_name = 'Информация о продукте'
         verbose_name_plural = 'Информация о продуктах в магазинах с характеристиками'
         unique_together = ('shop', 'external_id')
+        indexes = [
+            models.Index(fields=['price', 'id'], name='productinfo_price_id_idx'),  # keyset-пагинация каталога
+            models.Index(fields=['name', 'id'], name='productinfo_name_id_idx'),
+        ]
 
     def __str__(self):  # для админки и писем
         return f'{self.product}, "{self.shop}", цена: {self.price}'
 
+    @property
+    def total_rating(self) -> float | str:
+        """Средняя оценка товара по сохраненным агрегатам, пустая строка при отсутствии оценок"""
+        if not self.rating_count:
+            return ''
+        return round(self.rating_sum / self.rating_count, 1)
+
+    @staticmethod
+    def update_rating(product_id: int) -> None:
+        """
+        Пересчет агрегатов оценок товара по таблице RatingProduct
+
+        :param product_id: id товара на складе ProductInfo
+        """
+        rates = RatingProduct.objects.filter(product_id=product_id).\
+            aggregate(count=Count('id'), total=Sum(Cast('rating', output_field=IntegerField())))
+        ProductInfo.objects.filter(id=product_id).update(rating_count=rates['count'], rating_sum=rates['total'] or 0)
+
+    @staticmethod
+    def update_main_photo(product_id: int) -> None:
+        """
+        Обновление ссылки на главное изображение товара по флагу is_main в таблице ProductInfoPhoto
+
+        :param product_id: id товара на складе ProductInfo
+        """
+        main_photo = ProductInfoPhoto.objects.filter(product_id=product_id, is_main=True).\
+            values_list('id', flat=True).first()
+        ProductInfo.objects.filter(id=product_id).update(main_photo_id=main_photo)
+
 
 class Parameter(models.Model):
     """Перечень возможных характеристик для описания продуктов"""
@@ -328,6 +456,35 @@ class ProductParameter(models.Model):
         return f'{self.parameter}'
 
 
+class ParameterValueIndex(models.Model):
+    """
+    Индекс значений характеристик в категории: значение характеристики -> отсортированный список id товаров
+    ProductInfo (posting list). Используется для фильтров по характеристикам и подсчета фасетов в каталоге,
+    пересобирается в backend.utils.facets
+    """
+
+    category = models.ForeignKey(Category,
+                                 related_name='parameter_values',
+                                 on_delete=models.CASCADE,
+                                 verbose_name='Категория')
+    parameter = models.ForeignKey(Parameter,
+                                  related_name='parameter_values',
+                                  on_delete=models.CASCADE,
+                                  verbose_name='Параметр')
+    value = models.CharField(max_length=100,
+                             verbose_name='Значение')
+    product_infos = models.JSONField(default=list,
+                                     verbose_name='Товары')
+
+    class Meta:
+        verbose_name = 'Индекс значения параметра'
+        verbose_name_plural = 'Индекс значений параметров'
+        unique_together = ('category', 'parameter', 'value')
+
+    def __str__(self):
+        return f'{self.parameter}: {self.value}'
+
+
 class RatingProduct(models.Model):
     """Оценка товара и отзывы от покупателей"""
 
@@ -531,15 +688,18 @@ class ProductInfoPhoto(models.Model):
         """
         Только у одного изображения товара может быть маркировка is_main. Если создается новое фото с такой
         маркировкой, предыдущему главному изображению присваивается значение is_main = False.
+        После сохранения обновляется ссылка на главное изображение у товара (ProductInfo.main_photo).
         """
-        if self.is_main == 'True':
+        if str(self.is_main) == 'True':
             try:
                 item = ProductInfoPhoto.objects.filter(is_main=True, product=self.product)
                 if self != item:
                     item.update(is_main=False)
             except ProductInfoPhoto.DoesNotExist:
                 pass
-        return super(ProductInfoPhoto, self).save(*args, **kwargs)
+        result = super(ProductInfoPhoto, self).save(*args, **kwargs)
+        ProductInfo.update_main_photo(self.product_id)
+        return result
 
     class Meta:
         verbose_name = 'Изображение товара'
@@ -547,3 +707,194 @@ class ProductInfoPhoto(models.Model):
 
     def __str__(self):
         return f'Изображение {self.product.product.name}'
+
+
+def import_storage() -> FileSystemStorage:
+    """Хранилище загруженных прайсов вне MEDIA_ROOT, общее для веб-приложения и воркеров Celery"""
+    return FileSystemStorage(location=settings.IMPORT_ROOT)
+
+
+class ImportJob(models.Model):
+    """
+    Фоновая загрузка прайса магазина (PartnerUpdate). Прогресс и итоги загрузки записываются воркером Celery,
+    партнер получает их по id задачи
+    """
+
+    shop = models.ForeignKey(Shop,
+                             on_delete=models.CASCADE,
+                             related_name='import_jobs',
+                             verbose_name='Магазин')
+    method = models.CharField(max_length=10,
+                              verbose_name='Http-метод загрузки')
+    file = models.FileField(upload_to='price_lists/%Y/%m/%d/',
+                            storage=import_storage,
+                            verbose_name='Файл прайса')
+    state = models.CharField(max_length=20,
+                             choices=IMPORT_JOB_STATE_CHOICES,
+                             default='new',
+                             verbose_name='Статус загрузки')
+    total = models.PositiveIntegerField(null=True,
+                                        blank=True,
+                                        verbose_name='Товаров в прайсе')
+    processed = models.PositiveIntegerField(default=0,
+                                            verbose_name='Обработано товаров')
+    loaded = models.PositiveIntegerField(default=0,
+                                         verbose_name='Загружено/обновлено товаров')
+    failed = models.PositiveIntegerField(default=0,
+                                         verbose_name='Не удалось загрузить товаров')
+    created = models.PositiveIntegerField(default=0,
+                                          verbose_name='Создано товаров')
+    updated = models.PositiveIntegerField(default=0,
+                                          verbose_name='Обновлено товаров')
+    unchanged = models.PositiveIntegerField(default=0,
+                                            verbose_name='Товаров без изменений')
+    checkpoint = models.PositiveIntegerField(default=0,
+                                             verbose_name='Контрольная точка: товаров прайса в записанных пачках')
+    checkpoint_id = models.PositiveIntegerField(null=True,
+                                                blank=True,
+                                                verbose_name='Контрольная точка: артикул последнего товара')
+    # запусков и возобновлений загрузки: после IMPORT_MAX_ATTEMPTS загрузка не возобновляется (fail_import_job)
+    attempts = models.PositiveIntegerField(default=0,
+                                           verbose_name='Попыток загрузки')
+    errors = models.JSONField(default=dict,
+                              blank=True,
+                              verbose_name='Ошибки загрузки')
+    # время, запросы к БД и пик памяти по этапам и пачкам загрузки (backend.utils.import_stats)
+    stats = models.JSONField(default=dict,
+                             blank=True,
+                             verbose_name='Метрики загрузки')
+    created_at = models.DateTimeField(auto_now_add=True,
+                                      verbose_name='Дата и время создания')
+    finished_at = models.DateTimeField(null=True,
+                                       blank=True,
+                                       verbose_name='Дата и время завершения')
+    # обновляется при каждой записи прогресса: загрузка в статусе running без обновлений дольше
+    # IMPORT_STALE_TIMEOUT считается прерванной (команда resumeimports)
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name='Дата и время обновления')
+
+    class Meta:
+        verbose_name = 'Загрузка прайса'
+        verbose_name_plural = 'Загрузки прайсов'
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'Загрузка {self.id} "{self.shop}", {self.get_state_display()}'
+
+    @property
+    def resumable(self) -> bool:
+        """
+        Прерванную загрузку можно продолжить: файл прайса сохранен, а записанные пачки отмечены контрольной точкой
+        (или не записано ни одной пачки)
+        """
+        return self.state in ('running', 'failed') and bool(self.file) and (bool(self.checkpoint) or not self.loaded)
+
+    @property
+    def result(self) -> dict:
+        """Итог загрузки в формате ответа PartnerUpdate"""
+        return {'Status': bool(self.loaded), 'Загружено/обновлено товаров': self.loaded,
+                'Создано товаров': self.created, 'Обновлено товаров': self.updated,
+                'Без изменений': self.unchanged, **self.errors}
+
+
+class StagedGood(models.Model):
+    """
+    Товар POST-прайса в промежуточной таблице: товары загрузки записываются сюда пачками, для новых и изменившихся
+    товаров заранее определяются продукт, поисковый документ и характеристики (StagedParameter), затем разница
+    с остатками магазина применяется к ProductInfo/ProductParameter одной транзакцией (GoodsImporter.apply_staged)
+    """
+
+    job = models.ForeignKey(ImportJob,
+                            on_delete=models.CASCADE,
+                            related_name='staged_goods',
+                            verbose_name='Загрузка прайса')
+    external_id = models.PositiveIntegerField(verbose_name='Артикул товара')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    content_hash = models.CharField(max_length=32,
+                                    verbose_name='Хеш содержимого товара')
+    data = models.JSONField(verbose_name='Проверенные данные товара')
+    model = models.CharField(max_length=80,
+                             blank=True,
+                             verbose_name='Модель')
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    description = models.TextField(blank=True,
+                                   null=True,
+                                   verbose_name='Описание товара')
+    # заполняются при подготовке нового или изменившегося товара к применению
+    product = models.ForeignKey(Product,
+                                on_delete=models.SET_NULL,
+                                related_name='+',
+                                null=True,
+                                blank=True,
+                                verbose_name='Продукт')
+    search_document = models.TextField(blank=True,
+                                       default='',
+                                       verbose_name='Поисковый документ')
+    # товар магазина на момент применения (None - новый товар)
+    product_info = models.ForeignKey(ProductInfo,
+                                     on_delete=models.SET_NULL,
+                                     related_name='+',
+                                     null=True,
+                                     blank=True,
+                                     verbose_name='Товар')
+
+    class Meta:
+        verbose_name = 'Товар загружаемого прайса'
+        verbose_name_plural = 'Товары загружаемых прайсов'
+        unique_together = ('job', 'external_id')
+
+    def __str__(self):
+        return f'{self.job_id}: {self.external_id}'
+
+
+class StagedParameter(models.Model):
+    """Значение характеристики нового или изменившегося товара POST-прайса в промежуточной таблице"""
+
+    job = models.ForeignKey(ImportJob,
+                            on_delete=models.CASCADE,
+                            related_name='staged_parameters',
+                            verbose_name='Загрузка прайса')
+    external_id = models.PositiveIntegerField(verbose_name='Артикул товара')
+    parameter = models.ForeignKey(Parameter,
+                                  on_delete=models.CASCADE,
+                                  related_name='+',
+                                  verbose_name='Параметр')
+    value = models.CharField(max_length=100,
+                             verbose_name='Значение')
+
+    class Meta:
+        verbose_name = 'Характеристика товара загружаемого прайса'
+        verbose_name_plural = 'Характеристики товаров загружаемых прайсов'
+        unique_together = ('job', 'external_id', 'parameter')
+
+    def __str__(self):
+        return f'{self.job_id}: {self.external_id} {self.parameter_id}'
+
+
+class StockMovement(models.Model):
+    """
+    Движение остатка товара в журнале (только добавление записей): поставка PATCH-прайсом, установка остатка
+    POST-прайсом (в том числе обнуление отсутствующих в прайсе) и ручная корректировка остатка в админке.
+    ProductInfo.quantity изменяется вместе с записью журнала атомарным UPDATE quantity = quantity + изменение
+    (backend.utils.stock)
+    """
+
+    product_info = models.ForeignKey(ProductInfo,
+                                     on_delete=models.CASCADE,
+                                     related_name='stock_movements',
+                                     verbose_name='Товар')
+    kind = models.CharField(max_length=10,
+                            choices=STOCK_MOVEMENT_KIND_CHOICES,
+                            verbose_name='Вид движения')
+    quantity = models.IntegerField(verbose_name='Изменение остатка')
+    created_at = models.DateTimeField(auto_now_add=True,
+                                      verbose_name='Дата и время движения')
+
+    class Meta:
+        verbose_name = 'Движение остатка'
+        verbose_name_plural = 'Журнал движения остатков'
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.product_info_id}: {self.get_kind_display()} {self.quantity:+}'
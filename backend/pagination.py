@@ -0,0 +1,128 @@
+import json
+from operator import attrgetter
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination, Cursor
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация каталога товаров (ProductInfoView).
+
+    Курсор хранит значения ключа сортировки последнего/первого товара страницы вместе с id товара, следующая
+    страница выбирается условием (поле, id) > (значение, id) без OFFSET. Сортировки по цене и по названию
+    обслуживают индексы ProductInfo(price, id) и ProductInfo(name, id) - название продукта денормализовано
+    в ProductInfo.name, - и время выборки страницы не зависит от ее глубины. Повторяющиеся цены/названия
+    не приводят к пропускам и дублям.
+
+    Сортировка берется из параметра 'ordering' (OrderingFilter) и дополняется id для однозначности.
+    При поиске без явной сортировки товары упорядочиваются по релевантности (аннотация search_rank).
+    """
+
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    # допустимые варианты сортировки: параметр ordering -> ключ keyset-сортировки
+    keyset_orderings = {
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        'product': ('name', 'id'),
+        '-product': ('-name', '-id'),
+    }
+    ordering = ('price', 'id')
+    search_ordering = ('-search_rank', 'id')
+
+    has_next = False
+    has_previous = False
+    page = None
+
+    def get_ordering(self, request, queryset, view) -> tuple:
+        """Определение keyset-сортировки по провалидированному OrderingFilter параметру 'ordering'"""
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                if ordering and ordering[0] in self.keyset_orderings:
+                    return self.keyset_orderings[ordering[0]]
+        if 'search_rank' in queryset.query.annotations:
+            return self.search_ordering
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        reverse, position = False, None
+        if self.cursor is not None:
+            reverse = self.cursor.reverse
+            try:
+                position = json.loads(self.cursor.position)
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise NotFound(self.invalid_cursor_message)  # курсор от другой сортировки
+
+        # при движении назад выбираем товары в обратном порядке и разворачиваем страницу
+        ordering = self._reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._keyset_filter(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_next_link(self) -> str | None:
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self._position(self.page[-1])))
+
+    def get_previous_link(self) -> str | None:
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self._position(self.page[0])))
+
+    def _position(self, instance) -> str:
+        """Значения ключа сортировки товара для записи в курсор"""
+        return json.dumps([attrgetter(field.lstrip('-').replace('__', '.'))(instance) for field in self.ordering],
+                          ensure_ascii=False)
+
+    @staticmethod
+    def _reverse_ordering(ordering: tuple) -> tuple:
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+    @staticmethod
+    def _keyset_filter(ordering: tuple, position: list) -> Q:
+        """
+        Условие выборки товаров, следующих за позицией курсора в заданной сортировке:
+        (a > x) OR (a = x AND b > y) для возрастания, lt для убывания
+
+        :param ordering: поля сортировки
+        :param position: значения полей сортировки товара, на котором остановилась предыдущая страница
+        """
+        query = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            query |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return query
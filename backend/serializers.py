@@ -3,12 +3,65 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from backend.models import Order, Product, ProductParameter, Shop, ProductInfo, OrderItem, Category, Contact, User, \
-    Address, RatingProduct, ProductInfoPhoto
+    Address, RatingProduct, ProductInfoPhoto, ImportJob
 from backend.utils import reg_patterns
 from .utils.error_text import ValidateError as Error
 from .utils import media
 
 
+class SparseFieldsMixin:
+    """
+    Миксин сериализатора для выборочного вывода полей по параметрам запроса 'fields' и 'exclude' (через запятую).
+
+    В extra_fields перечисляются поля, добавляемые в to_representation, в query_related - select_related и
+    prefetch_related, необходимые полю ответа. get_related() возвращает связи только для выводимых полей, поэтому
+    исключенное поле не подгружается из БД и не вычисляется.
+    """
+
+    extra_fields = []
+    query_related = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested_fields = self.get_requested_fields(self.context.get('request'))
+        for name in set(self.fields) - self.requested_fields:
+            self.fields.pop(name)
+
+    @classmethod
+    def get_requested_fields(cls, request) -> set:
+        """
+        Поля ответа с учетом параметров 'fields' и 'exclude'
+
+        :param request: объект запроса (None - все поля)
+        :return: множество выводимых полей
+        """
+        all_fields = [*cls.Meta.fields, *cls.extra_fields]
+        if request is None:
+            return set(all_fields)
+
+        fields, exclude = ({name.strip() for name in request.query_params.get(param, '').split(',') if name.strip()}
+                           for param in ('fields', 'exclude'))
+        unknown = (fields | exclude) - set(all_fields)
+        if unknown:
+            raise ValidationError({'fields': f'{Error.FIELDS_WRONG.value}: {", ".join(sorted(unknown))}'})
+        return (fields or set(all_fields)) - exclude
+
+    @classmethod
+    def get_related(cls, request) -> tuple:
+        """
+        Связи для select_related и prefetch_related, необходимые выводимым полям
+
+        :param request: объект запроса
+        :return: кортеж (select_related, prefetch_related)
+        """
+        select, prefetch = {}, {}
+        for name in cls.get_requested_fields(request):
+            related = cls.query_related.get(name, ([], []))
+            select.update(dict.fromkeys(related[0]))
+            prefetch.update(dict.fromkeys(related[1]))
+        return list(select), list(prefetch)
+
+
 class AddressSerializer(serializers.ModelSerializer):
     """Адрес в контакте"""
 
@@ -122,34 +175,55 @@ class InnerProductParameterSerializer(serializers.ModelSerializer):
         fields = ['parameter', 'value']
 
 
+class ProductParameterListSerializer(serializers.ListSerializer):
+    """Список товаров: ссылки на иконки главных изображений всех товаров списка берутся из кеша одним запросом"""
+
+    def to_representation(self, data):
+        instances = list(data)
+        if 'photo' in self.child.requested_fields:
+            self.child.spec_urls = media.get_spec_urls((instance.main_photo, 'photo_small')
+                                                       for instance in instances if instance.main_photo)
+        return super().to_representation(instances)
+
+
 # noinspection PyUnresolvedReferences
-class ProductParameterSerializer(serializers.ModelSerializer):
+class ProductParameterSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Информация о товаре с характеристиками на складах"""
 
     # product_parameters = InnerProductParameterSerializer(many=True, read_only=True)
 
     class Meta:
         model = ProductInfo
-        fields = ['model', 'product', 'shop', 'price', 'quantity']
+        fields = ['id', 'model', 'product', 'shop', 'price', 'quantity']
         # fields = ['model', 'product', 'shop', 'price', 'quantity', 'product_parameters']
+        list_serializer_class = ProductParameterListSerializer
+
+    extra_fields = ['total_rating', 'photo']
+    query_related = {
+        'product': (['product__category'], []),
+        'shop': (['shop'], []),
+        'photo': (['main_photo'], []),
+    }
+    # ссылки на иконки, подготовленные ProductParameterListSerializer для всего списка
+    spec_urls = None
 
     def to_representation(self, instance):
         result = super().to_representation(instance)
-        result['product'] = ProductSerializer(instance.product).data
-        all_rates = list(instance.ratings.all().values_list('rating', flat=True))
-        if all_rates:
-            rating = round(sum([int(i) for i in all_rates]) / len(all_rates), 1)
-            result['total_rating'] = rating
-        else:
-            result['total_rating'] = ''
-        result['shop'] = instance.shop.name
-
-        # добавляем в вывод иконку изображения
-        if instance.photos.filter(is_main=True).exists():
-            icon = ProductInfoPhoto.objects.filter(product=instance).first()
-            result['photo'] = icon.photo_small.url
-        else:
-            result['photo'] = media.default_photo_icon  # заглушка для вывода, если не подгружена иконка
+        if 'product' in result:
+            result['product'] = ProductSerializer(instance.product).data
+        if 'total_rating' in self.requested_fields:
+            result['total_rating'] = instance.total_rating  # по сохраненным агрегатам, без запроса оценок
+        if 'shop' in result:
+            result['shop'] = instance.shop.name
+
+        # добавляем в вывод иконку главного изображения (main_photo подгружается в select_related)
+        if 'photo' in self.requested_fields:
+            if instance.main_photo:
+                spec = (instance.main_photo, 'photo_small')
+                spec_urls = self.spec_urls if self.spec_urls is not None else media.get_spec_urls([spec])
+                result['photo'] = spec_urls[instance.main_photo.photo.name, 'photo_small']
+            else:
+                result['photo'] = media.default_photo_icon  # заглушка для вывода, если не подгружена иконка
 
         return result
 
@@ -164,7 +238,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ['buyer', 'rating', 'review']
 
 
-class ProductInfoDetailSerializer(serializers.ModelSerializer):
+class ProductInfoDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Детализация информации по конкретному товару в магазине"""
 
     product = ProductSerializer()
@@ -177,39 +251,69 @@ class ProductInfoDetailSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'description', 'product_parameters', 'price', 'external_id', 'shop', 'quantity',
                   'ratings']
 
+    extra_fields = ['total_rating', 'main_image', 'icons', 'images_large']
+    query_related = {
+        'product': (['product__category'], []),
+        'shop': (['shop'], []),
+        'product_parameters': ([], ['product_parameters__parameter']),
+        'ratings': ([], ['ratings__user']),
+        'main_image': ([], ['photos']),
+        'icons': ([], ['photos']),
+        'images_large': ([], ['photos']),
+    }
+
     def to_representation(self, instance):
         result = super().to_representation(instance)
-        all_rates = list(instance.ratings.all().values_list('rating', flat=True))
-        if all_rates:
-            rating = round(sum([int(i) for i in all_rates]) / len(all_rates), 1)
-            result['total_rating'] = rating
-        else:
-            result['total_rating'] = ''
-
-        # основное изображение в высоком качестве для описания товара
-        if instance.photos.all().exists():
-            image = instance.photos.filter(is_main=True).first().photo_large.url
-            result['main_image'] = image
-        else:
-            result['main_image'] = media.default_photo_large
-
-        # все изображения отображаются ниже иконками, при клике отображаются в высоком качестве во всплывающем окне
-        if instance.photos.all().exists():
-            images = [i.photo_small.url for i in instance.photos.all()]
-        else:
-            images = []
-        result['icons'] = images
-
-        # все изображения в высоком разрешении для вывода на страницу при клике на иконку
-        if instance.photos.all().exists():
-            images = [i.photo_large.url for i in instance.photos.all()]
-        else:
-            images = []
-        result['images_large'] = images
+        if 'total_rating' in self.requested_fields:
+            result['total_rating'] = instance.total_rating
+
+        # изображения собираются за один проход по подгруженным (prefetch_related) фото:
+        # main_image - основное изображение в высоком качестве для описания товара,
+        # icons - все изображения иконками ниже, images_large - они же в высоком качестве для показа при клике
+        photo_fields = {'main_image', 'icons', 'images_large'} & self.requested_fields
+        if photo_fields:
+            main_image = media.default_photo_large
+            icons, images_large = [], []
+            specs = [spec for spec, needed in (('photo_small', 'icons' in photo_fields),
+                                               ('photo_large', bool(photo_fields - {'icons'}))) if needed]
+            spec_urls = media.get_spec_urls((photo, spec) for photo in instance.photos.all() for spec in specs)
+            for photo in instance.photos.all():
+                if 'icons' in photo_fields:
+                    icons.append(spec_urls[photo.photo.name, 'photo_small'])
+                if photo_fields - {'icons'}:
+                    large = spec_urls[photo.photo.name, 'photo_large']
+                    images_large.append(large)
+                    if photo.is_main:
+                        main_image = large
+            for name, value in (('main_image', main_image), ('icons', icons), ('images_large', images_large)):
+                if name in photo_fields:
+                    result[name] = value
 
         return result
 
 
+class OfferSerializer(serializers.ModelSerializer):
+    """Предложение магазина для сравнения цен"""
+
+    shop = serializers.ReadOnlyField(source='shop.name')
+
+    class Meta:
+        model = ProductInfo
+        fields = ['id', 'shop', 'model', 'price', 'price_rrc', 'quantity']
+
+
+class ProductCompareSerializer(serializers.ModelSerializer):
+    """Сравнение цен продукта в магазинах: агрегат предложений + предложения по возрастанию цены"""
+
+    category = serializers.ReadOnlyField(source='category.name')
+    offers = OfferSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'category', 'min_price', 'max_price', 'offers_count', 'shops_in_stock', 'best_offer',
+                  'offers']
+
+
 class InnerProdInfoInOrderSerializer(serializers.ModelSerializer):
     """Инлайн с информацией о товаре в заказе"""
 
@@ -356,3 +460,14 @@ class ShopProductPhotoSerializer(serializers.ModelSerializer):
         result['shop'] = instance.shop.name
         result['product'] = instance.product.name
         return result
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """Прогресс и итоги фоновой загрузки прайса"""
+
+    result = serializers.ReadOnlyField()
+
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'method', 'state', 'total', 'processed', 'loaded', 'failed', 'created', 'updated', 'unchanged',
+                  'created_at', 'finished_at', 'result', 'stats']
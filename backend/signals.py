@@ -3,12 +3,15 @@ from datetime import timedelta
 import csv
 
 from django.core.mail import EmailMultiAlternatives
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver, Signal
 from django.template.loader import get_template
 from django_rest_passwordreset.models import ResetPasswordToken
 from django_rest_passwordreset.signals import reset_password_token_created
 
-from backend.models import ConfirmEmailToken, Order, ORDER_STATE_CHOICES, DELIVERY_TIME_CHOICES, User
+from backend.models import ConfirmEmailToken, Order, ORDER_STATE_CHOICES, DELIVERY_TIME_CHOICES, User, \
+    RatingProduct, ProductInfo, ProductInfoPhoto, Category, Shop, Product
+from backend.utils.cache import bump_cache_version, CATEGORIES_CACHE, SHOPS_CACHE
 from shop_site import settings
 from .tasks import task_send_email
 
@@ -224,3 +227,104 @@ def send_report(signal_kwargs: dict, **kwargs) -> None:
     msg.attach(filename, content.read(), 'text/csv')
 
     msg.send()
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=RatingProduct)
+@receiver(post_delete, sender=RatingProduct)
+def update_product_rating_signal(instance: RatingProduct, **kwargs) -> None:
+    """
+    Пересчет сохраненных агрегатов рейтинга товара при создании/изменении/удалении оценки (RateProduct, админка,
+    каскадное удаление)
+
+    :param instance: объект оценки RatingProduct
+    """
+    ProductInfo.update_rating(instance.product_id)
+
+
+# noinspection PyUnusedLocal
+@receiver(post_delete, sender=ProductInfoPhoto)
+def update_main_photo_signal(instance: ProductInfoPhoto, **kwargs) -> None:
+    """
+    Сброс ссылки на главное изображение товара при удалении изображения (api, инлайн админки, каскадное удаление)
+
+    :param instance: объект изображения ProductInfoPhoto
+    """
+    ProductInfo.update_main_photo(instance.product_id)
+
+
+# noinspection PyUnusedLocal
+@receiver([post_save, post_delete], sender=Category)
+def category_cache_version_signal(**kwargs) -> None:
+    """Новая версия закешированного списка категорий при создании/изменении/удалении категории (загрузка, админка)"""
+    bump_cache_version(CATEGORIES_CACHE)
+
+
+# noinspection PyUnusedLocal
+@receiver([post_save, post_delete], sender=Shop)
+def shop_cache_version_signal(**kwargs) -> None:
+    """Новая версия закешированного списка магазинов при создании/изменении/удалении магазина (загрузка, админка)"""
+    bump_cache_version(SHOPS_CACHE)
+
+
+# noinspection PyUnusedLocal
+@receiver(m2m_changed, sender=Category.shops.through)
+def category_shops_cache_version_signal(action: str, **kwargs) -> None:
+    """
+    Новая версия закешированных списков категорий и магазинов при изменении связи категорий с магазинами
+    (category.shops.add при загрузке накладной, админка): save() категории и магазина при этом не вызывается
+
+    :param action: вид изменения связи (pre_add, post_add, ...)
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_cache_version(CATEGORIES_CACHE, SHOPS_CACHE)
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=Shop)
+def shop_offers_signal(instance: Shop, created: bool, **kwargs) -> None:
+    """
+    Пересчет предложений продуктов магазина для сравнения цен при изменении магазина (статус приема заказов в админке)
+
+    :param instance: объект магазина Shop
+    :param created: магазин создан (товаров еще нет)
+    """
+    if not created:
+        Product.update_offers(ProductInfo.objects.filter(shop=instance).values('product_id'))
+
+
+# noinspection PyUnusedLocal
+@receiver(post_delete, sender=ProductInfo)
+def product_info_offers_signal(instance: ProductInfo, **kwargs) -> None:
+    """
+    Пересчет предложений продукта при удалении товара со склада (админка, каскадное удаление)
+
+    :param instance: объект товара ProductInfo
+    """
+    Product.update_offers([instance.product_id])
+
+
+# noinspection PyUnusedLocal
+@receiver(pre_save, sender=ProductInfo)
+def product_info_name_signal(instance: ProductInfo, **kwargs) -> None:
+    """
+    Денормализованное наименование продукта товара для сортировки каталога по названию (админка, api); загрузка
+    прайса записывает его вместе с товарами
+
+    :param instance: объект товара ProductInfo
+    """
+    if instance.product_id:
+        instance.name = instance.product.name
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=Product)
+def product_name_signal(instance: Product, created: bool, **kwargs) -> None:
+    """
+    Новое наименование продукта в денормализованном наименовании его товаров при изменении продукта (админка)
+
+    :param instance: объект продукта Product
+    :param created: продукт создан (товаров еще нет)
+    """
+    if not created:
+        ProductInfo.objects.filter(product=instance).exclude(name=instance.name).update(name=instance.name)
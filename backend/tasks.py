@@ -1,10 +1,11 @@
-from celery import shared_task
+from celery import shared_task, chord
+from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
 from django.utils.safestring import SafeString
 
-from backend.models import ProductInfo, Shop
-from backend.utils.get_data_from_yaml import get_or_greate_product_object, update_or_create_product_info, \
-    create_parameter_for_product
+from backend.models import ImportJob
+from backend.utils.bulk_import import run_import_job, start_batch_import, import_batch, finish_batch_import, \
+    fail_import_job
 
 
 @shared_task
@@ -37,47 +38,61 @@ def task_send_email(subject: str, from_email: str, to: list, body: str, html: Sa
     msg.send()
 
 
-# noinspection PyUnresolvedReferences
 @shared_task
-def task_load_good_from_yaml(method: str, good: dict, shop_name: str, errors_list: list, errors: dict, counter: int) \
-        -> tuple:
+def task_import_price_list(job_id: int) -> dict | None:
     """
-    Task для PATCH-загрузки информации о товаре из накладной в БД (добавление товаров на остатки)
-
-    :param method: http-метод запроса
-    :param good: информация о товаре
-    :param shop_name: наименование магазина
-    :param errors_list: список ошибок
-    :param errors: словарь со всеми данными ошибок
-    :param counter: счетчик успешных загрузок
-    :return: counter, errors  - кортеж из счетчика загрузок и словаря с ошибками
+    Task фоновой загрузки прайса магазина: прогресс и итоги загрузки записываются в ImportJob.
+    При settings.IMPORT_PARALLEL прайс разбивается на пачки по IMPORT_BATCH_SIZE товаров, пачки записываются
+    параллельно задачами task_import_batch, итоги объединяет callback chord - task_finish_import.
+    Прерванная загрузка с контрольной точкой (см. команду resumeimports) продолжается последовательно
+
+    :param job_id: id задачи загрузки ImportJob
+    :return: итог загрузки в формате ответа PartnerUpdate (при параллельной загрузке - None, итог записывает
+    task_finish_import)
+    """
+    job = ImportJob.objects.select_related('shop').get(id=job_id)
+    if job.state == 'done':  # повторная доставка задачи уже завершенной загрузки
+        return job.result
+    if job.checkpoint or not settings.IMPORT_PARALLEL:
+        return run_import_job(job)
+
+    # в сообщениях передаются только имена файлов пачек, каждая задача читает только свою пачку
+    batches, deferred = start_batch_import(job)
+    callback = task_finish_import.s(job_id, deferred).on_error(task_import_failed.s(job_id))
+    chord(task_import_batch.s(job_id, name) for name in batches)(callback)
+
+
+@shared_task
+def task_import_batch(job_id: int, name: str) -> dict:
+    """
+    Task записи пачки товаров прайса в одной транзакции: пачка читается из своего файла, записанного при разбиении
+    прайса на пачки
+
+    :param job_id: id задачи загрузки ImportJob
+    :param name: имя файла пачки в хранилище прайсов
+    :return: итоги пачки для task_finish_import
+    """
+    return import_batch(ImportJob.objects.select_related('shop').get(id=job_id), name)
+
+
+@shared_task
+def task_finish_import(summaries: list[dict], job_id: int, deferred: list[str]) -> dict:
+    """
+    Task завершения параллельной загрузки прайса (callback chord) после записи всех пачек
+
+    :param summaries: итоги пачек task_import_batch
+    :param job_id: id задачи загрузки ImportJob
+    :param deferred: имена файлов отложенных повторов артикулов, записываемых после всех пачек
+    :return: итог загрузки в формате ответа PartnerUpdate
+    """
+    return finish_batch_import(ImportJob.objects.select_related('shop').get(id=job_id), summaries, deferred)
+
+
+@shared_task
+def task_import_failed(request, exc, traceback, job_id: int) -> None:
+    """
+    Task отметки задачи загрузки как неудачной при ошибке записи пачки (errback chord)
+
+    :param job_id: id задачи загрузки ImportJob
     """
-    product = get_or_greate_product_object(good, errors_list, errors)[0]
-    shop = Shop.objects.filter(name=shop_name).first()
-
-    # определяем количество для товара, исходя из метода запроса
-    new_quantity = None
-    if method == 'PATCH':
-        # суммируем кол-во товара для остатков или устанавливаем из накладной для нового товара
-        shop_product = ProductInfo.objects.filter(shop=shop, external_id=good['id']).first()
-        if shop_product:
-            quantity_now = shop_product.quantity
-            new_quantity = quantity_now + good['quantity']  # суммируем текущее кол-во с накладной
-        else:
-            new_quantity = good['quantity']  # устанавливаем кол-во из накладной
-
-    elif method == 'POST':
-        # определяем количество
-        new_quantity = good['quantity']
-
-    # обновляем количество товара на остатках или добавляем товар на остатки
-    result = update_or_create_product_info(
-        good, product, shop, new_quantity, counter, errors_list, errors)
-    shop_product, counter = result[0], result[1]
-
-    # Переходим к заполнению/обновлению параметров модели
-    if shop_product:
-        parameters = good['parameters']
-        create_parameter_for_product(parameters, shop_product)
-
-    return counter, errors
+    fail_import_job(ImportJob.objects.get(id=job_id), exc)
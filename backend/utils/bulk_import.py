@@ -0,0 +1,1236 @@
+# множественная загрузка товаров из прайса партнера: пачки товаров записываются set-based операциями
+# (bulk_create/bulk_update) вместо отдельных get_or_create/update_or_create на каждый товар и характеристику
+
+import hashlib
+import itertools
+import json
+import multiprocessing
+import queue
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from backend.models import Category, Product, ProductInfo, Parameter, ProductParameter, Shop, ImportJob, StagedGood, \
+    StagedParameter, StockMovement
+from backend.utils.error_text import ValidateError
+from backend.utils.facets import rebuild_parameter_index
+from backend.utils.get_data_from_yaml import create_categories
+from backend.utils.import_stats import ImportStats
+from backend.utils.pg_copy import copy_available, copy_upsert
+from backend.utils.price_list import iter_price_list_goods, get_price_list_format, read_price_list_header
+from backend.utils.search import join_search_document
+from backend.utils.stock import add_stock, record_movements
+
+# количество товаров прайса, записываемых в одной транзакции (и в файле пачки одной задачи Celery
+# при параллельной загрузке)
+IMPORT_CHUNK_SIZE = settings.IMPORT_BATCH_SIZE
+
+# папка файлов пачек параллельной загрузки в хранилище прайсов (рядом с прайсами, общая для воркеров)
+IMPORT_SLICE_DIR = 'price_lists/batches'
+
+# обязательные поля товара и поля, содержащие целые неотрицательные числа
+GOOD_REQUIRED_FIELDS = ('id', 'category', 'name', 'price', 'price_rrc', 'quantity')
+GOOD_INT_FIELDS = ('id', 'category', 'price', 'price_rrc', 'quantity')
+
+# поля ProductInfo, перезаписываемые данными из прайса; внешние ключи указываются по имени столбца,
+# Django 4.1 подставляет имена из update_fields/unique_fields в ON CONFLICT без преобразования
+PRODUCT_INFO_UPDATE_FIELDS = ['product_id', 'name', 'model', 'quantity', 'price', 'price_rrc', 'description',
+                              'search_document', 'content_hash']
+# при PATCH количество не перезаписывается, а прибавляется к остатку атомарным UPDATE (backend.utils.stock)
+PRODUCT_INFO_RECEIPT_UPDATE_FIELDS = [field for field in PRODUCT_INFO_UPDATE_FIELDS if field != 'quantity']
+
+
+def _to_int(value) -> int | None:
+    """Приведение значения поля товара к целому неотрицательному числу, None при некорректном значении"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    return value if isinstance(value, int) and value >= 0 else None
+
+
+def _iter_chunks(goods, size: int):
+    """Разбиение итерируемого набора товаров на пачки по size товаров без чтения всего набора в память"""
+    goods = iter(goods)
+    while chunk := list(itertools.islice(goods, size)):
+        yield chunk
+
+
+def clean_good(good: dict, category_ids: set) -> dict:
+    """
+    Проверка и нормализация товара из прайса: обязательные поля, числовые значения, существование категории,
+    длина наименований и характеристик
+
+    :param good: словарь с данными товара из прайса
+    :param category_ids: id существующих категорий, None - без проверки категории
+    :return: товар с приведенными к int числовыми полями и характеристиками в виде строк
+    :raise ValueError: с текстом ошибки, если товар не может быть загружен
+    """
+    if not isinstance(good, dict):
+        raise ValueError(ValidateError.GOOD_FORMAT_WRONG.value)
+
+    missing = [field for field in GOOD_REQUIRED_FIELDS if good.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f'{ValidateError.GOOD_FIELD_REQUIRED.value}: {", ".join(missing)}')
+
+    cleaned = dict(good)
+    wrong = []
+    for field in GOOD_INT_FIELDS:
+        cleaned[field] = _to_int(good[field])
+        if cleaned[field] is None:
+            wrong.append(field)
+    if wrong:
+        raise ValueError(f'{ValidateError.GOOD_FIELD_WRONG.value}: {", ".join(wrong)}')
+
+    if category_ids is not None and cleaned['category'] not in category_ids:
+        raise ValueError(f'{ValidateError.GOOD_CATEGORY_NOT_FOUND.value}: {cleaned["category"]}')
+
+    cleaned['name'] = str(good['name'])
+    cleaned['model'] = str(good.get('model') or '')
+    if len(cleaned['name']) > 80 or len(cleaned['model']) > 80:
+        raise ValueError(ValidateError.GOOD_NAME_TOO_LONG.value)
+
+    parameters = good.get('parameters') or {}
+    if not isinstance(parameters, dict):
+        raise ValueError(ValidateError.GOOD_PARAMETERS_WRONG.value)
+    cleaned['parameters'] = {str(name): str(value) for name, value in parameters.items()}
+    if any(len(name) > 80 or len(value) > 100 for name, value in cleaned['parameters'].items()):
+        raise ValueError(ValidateError.GOOD_PARAMETERS_WRONG.value)
+
+    description = good.get('description')
+    cleaned['description'] = None if description is None else str(description)
+    return cleaned
+
+
+def check_categories(categories, errors_list: list) -> tuple[set, int]:
+    """
+    Проверка раздела categories прайса без записи в БД: те же конфликты, на которых create_categories получает
+    IntegrityError (id занят другим названием, название - другим id, в том числе повторы внутри прайса).
+    Существующие категории подгружаются одним запросом.
+
+    :param categories: раздел categories прайса
+    :param errors_list: список ошибок, в который добавляются ошибки категорий в формате create_categories
+    :return: id категорий, которые будут существовать после создания категорий прайса, и количество ошибок
+    """
+    if not isinstance(categories, list):
+        categories = [] if categories is None else [categories]
+    entries = [(_to_int(cat.get('id')), cat.get('name')) if isinstance(cat, dict) else (None, None)
+               for cat in categories]
+    ids = {cat_id for cat_id, _ in entries if cat_id is not None}
+    names = {str(name) for _, name in entries if name not in (None, '')}
+    by_id = dict(Category.objects.filter(Q(id__in=ids) | Q(name__in=names)).values_list('id', 'name'))
+    by_name = {name: cat_id for cat_id, name in by_id.items()}
+
+    available, failed = set(), 0
+    for cat_id, name in entries:
+        if cat_id is None or name in (None, ''):
+            error = ValidateError.CATEGORY_FORMAT_WRONG.value
+        elif by_id.get(cat_id, str(name)) != str(name):
+            error = ValidateError.CATEGORY_ID_TAKEN.value
+            available.add(cat_id)  # категория с таким id есть, товары с ней загрузятся
+        elif by_name.get(str(name), cat_id) != cat_id:
+            error = ValidateError.CATEGORY_NAME_TAKEN.value
+        else:
+            available.add(cat_id)
+            by_id[cat_id], by_name[str(name)] = str(name), cat_id
+            continue
+        failed += 1
+        errors_list.append({'category_creation_failed': (cat_id, name, error)})
+    return available, failed
+
+
+def validate_price_list(file, categories, price_format: str = 'yaml') -> dict:
+    """
+    Проверка прайса без записи в БД (dry run). Категории и все товары проверяются за один проход потокового
+    чтения, категории товаров, отсутствующие в прайсе, проверяются в БД одним запросом после прохода.
+
+    :param file: файл прайса (файловый объект, открытый в двоичном режиме)
+    :param categories: раздел categories прайса
+    :param price_format: формат прайса
+    :return: отчет о проверке с ошибками в формате итога загрузки PartnerUpdate
+    """
+    errors_list = []
+    available, category_failed = check_categories(categories, errors_list)
+
+    good_errors = []  # (позиция товара в прайсе, ошибка)
+    unresolved = defaultdict(list)  # id категории, отсутствующей в прайсе -> [(позиция, id, наименование товара)]
+    total = valid = 0
+    for position, good in enumerate(iter_price_list_goods(file, price_format)):
+        total += 1
+        try:
+            good = clean_good(good, None)
+        except ValueError as e:
+            good_id, name = (good.get('id'), good.get('name')) if isinstance(good, dict) else (None, None)
+            good_errors.append((position, (good_id, name, str(e))))
+            continue
+        if good['category'] in available:
+            valid += 1
+        else:
+            unresolved[good['category']].append((position, good['id'], good['name']))
+
+    found = set(Category.objects.filter(id__in=unresolved.keys()).values_list('id', flat=True)) if unresolved \
+        else set()
+    for category_id, goods in unresolved.items():
+        if category_id in found:
+            valid += len(goods)
+            continue
+        error = f'{ValidateError.GOOD_CATEGORY_NOT_FOUND.value}: {category_id}'
+        good_errors.extend((position, (good_id, name, error)) for position, good_id, name in goods)
+
+    errors_list.extend({'product_info_creation_failed': error} for _, error in sorted(good_errors))
+    report = {'Status': not errors_list, 'Товаров в прайсе': total, 'Товаров без ошибок': valid}
+    if errors_list:
+        report['Errors'] = errors_list
+    if category_failed:
+        report['Не удалось создать категорий'] = category_failed
+    if good_errors:
+        report['Не удалось добавить товаров на остатки/обновить'] = len(good_errors)
+    return report
+
+
+def get_content_hash(good: dict) -> str:
+    """
+    Хеш содержимого проверенного товара прайса: продукт (категория, наименование), модель, цены, описание и
+    характеристики. Количество в хеш не входит - оно сравнивается с текущим остатком напрямую.
+
+    :param good: товар, прошедший clean_good
+    :return: md5 в шестнадцатеричном виде
+    """
+    content = [good['category'], good['name'], good['model'], good['price'], good['price_rrc'], good['description'],
+               sorted(good['parameters'].items())]
+    return hashlib.md5(json.dumps(content, ensure_ascii=False).encode('utf-8'), usedforsecurity=False).hexdigest()
+
+
+class GoodsImporter:
+    """
+    Загрузка товаров прайса на остатки магазина.
+
+    Товары обрабатываются пачками по chunk_size в отдельных транзакциях. На пачку выполняется фиксированное
+    количество запросов: предзагрузка существующих продуктов, характеристик и товаров магазина (по артикулу
+    external_id) в словари, создание недостающих продуктов и характеристик через bulk_create, upsert товаров
+    и их характеристик через bulk_create(update_conflicts=True), а на БД без ON CONFLICT - через
+    bulk_create + bulk_update. На PostgreSQL при IMPORT_COPY товары и характеристики пачки передаются через
+    COPY во временную таблицу и переносятся INSERT ... ON CONFLICT (backend.utils.pg_copy).
+
+    POST (полная замена остатков) устанавливает количество из прайса, PATCH (поставка) прибавляет его к текущему
+    атомарным UPDATE quantity = quantity + количество без чтения остатка. Каждое изменение остатка записывается
+    в журнал StockMovement.
+
+    Для параллельной загрузки задачами Celery прайс разбивается на пачки методом split, пачки записываются
+    write_batch в отдельных экземплярах, итоги объединяются merge и загрузка завершается finish.
+
+    Последовательная POST-загрузка по задаче ImportJob (run_import_job) записывает пачки в промежуточную таблицу
+    StagedGood, не затрагивая остатки магазина, а finish применяет разницу с остатками (apply_staged): новые
+    и изменившиеся товары записываются пачками в отдельных транзакциях, остатки товаров с тем же содержимым
+    и обнуление отсутствующих в прайсе - одной короткой транзакцией. Параллельная загрузка (split/write_batch)
+    и шарды importshop пишут пачки сразу в остатки и обнуляют отсутствующие остатки в finish - их остатки
+    во время загрузки обновлены частично.
+    """
+
+    def __init__(self, shop: Shop, method: str, chunk_size: int = None, errors_list: list = None,
+                 on_chunk=None, refresh_offers: bool = True, job: ImportJob = None, stats: ImportStats = None):
+        """
+        :param shop: магазин, остатками которого идет управление
+        :param method: http-метод запроса загрузки прайса (POST/PATCH)
+        :param chunk_size: количество товаров в транзакции, по умолчанию IMPORT_CHUNK_SIZE
+        :param errors_list: список ошибок загрузки, в который добавляются ошибки товаров (например, уже
+        содержащий ошибки создания категорий)
+        :param on_chunk: функция, вызываемая с объектом GoodsImporter после записи каждой пачки (прогресс загрузки)
+        :param refresh_offers: пересчитывать агрегат предложений продуктов в транзакции каждой пачки; при параллельной
+        записи пачек он пересчитывается один раз в finish, чтобы параллельные транзакции не затирали пересчет друг друга
+        :param job: задача загрузки; при POST товары записываются через промежуточную таблицу StagedGood
+        :param stats: сборщик метрик этапов и пачек загрузки, по умолчанию - новый
+        """
+        self.shop = shop
+        self.method = method
+        self.chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+        self.on_chunk = on_chunk
+        self.job = job
+        self.staging = job is not None and method == 'POST'
+        # при записи через промежуточную таблицу предложения пересчитываются при ее применении (apply_staged)
+        self.refresh_offers = refresh_offers and not self.staging
+        self.processed = 0  # счетчик обработанных товаров прайса
+        self.last_id = None  # артикул последнего обработанного товара прайса (контрольная точка загрузки)
+        self.counter = 0  # счетчик успешно загруженных товаров
+        self.created = 0  # из них новых
+        self.updated = 0  # измененных
+        self.unchanged = 0  # не изменившихся и не перезаписанных
+        self.failed = 0  # счетчик товаров, не прошедших проверку
+        self.seen = set()  # артикулы товаров POST-прайса для обнуления остальных остатков
+        self.errors_list = errors_list if errors_list is not None else []
+        self.category_ids = set()  # категории загруженных товаров для пересборки индекса характеристик
+        self.product_ids = set()  # продукты, предложения которых изменились
+        self._known_categories = set()
+        self._parameters = {}  # название характеристики -> id
+        self.stats = stats if stats is not None else ImportStats(job.id if job else None)
+
+    def import_goods(self, goods) -> int:
+        """
+        Загрузка товаров пачками с последующей пересборкой индекса значений характеристик затронутых категорий.
+        При POST после загрузки обнуляются остатки товаров, отсутствующих в прайсе.
+
+        :param goods: итерируемый набор словарей с данными товаров
+        :return: количество загруженных/обновленных товаров
+        """
+        for chunk in self.stats.iterate('parse', _iter_chunks(goods, self.chunk_size)):
+            self.import_chunk(chunk)
+
+        self.finish()
+        return self.counter
+
+    def skip(self, goods, offset: int, last_id: int | None):
+        """
+        Пропуск товаров прайса, записанных до прерывания загрузки (возобновление с контрольной точки).
+        Пропущенные товары проверяются без записи: при POST их артикулы нужны для обнуления остатков, отсутствующих
+        в прайсе, категории - для пересборки индекса характеристик. Их ошибки уже записаны в задачу загрузки.
+
+        :param goods: итерируемый набор словарей с данными товаров
+        :param offset: количество товаров прайса в записанных пачках
+        :param last_id: артикул последнего из них - проверка, что прайс тот же, что и до прерывания
+        :return: итератор оставшихся товаров
+        """
+        goods = iter(goods)
+        failed, errors_list, self.errors_list = self.failed, self.errors_list, []
+        for chunk in _iter_chunks(itertools.islice(goods, offset), self.chunk_size):
+            self.processed += len(chunk)
+            self.last_id = _to_int(chunk[-1].get('id')) if isinstance(chunk[-1], dict) else None
+            cleaned = self._clean(chunk)
+            if self.method == 'POST':
+                self.seen.update(cleaned.keys())
+            self.category_ids.update(good['category'] for good in cleaned.values())
+        self.failed, self.errors_list = failed, errors_list
+
+        if self.processed != offset or self.last_id != last_id:
+            raise ValueError(f'Прайс не совпадает с контрольной точкой загрузки: товар {offset}, артикул {last_id}')
+        return goods
+
+    def split(self, goods, save_slice) -> tuple[list, list]:
+        """
+        Проверка товаров прайса и разбиение на пачки для записи отдельными задачами Celery. Каждая пачка
+        сохраняется в свой файл (save_slice) за один проход по прайсу: задача читает только свою пачку, товары
+        не хранятся в памяти и не передаются в сообщениях. Пачки записываются параллельно, поэтому повтор артикула,
+        уже попавшего в одну из пачек, исключается из пачки и записывается после всех пачек
+
+        :param goods: итерируемый набор словарей с данными товаров
+        :param save_slice: функция записи списка товаров в файл пачки, возвращает имя файла
+        :return: имена файлов пачек и файлов отложенных товаров в порядке прайса
+        """
+        batches, deferred, batched, repeats = [], [], set(), []
+        for chunk in _iter_chunks(goods, self.chunk_size):
+            self.processed += len(chunk)
+            external_ids = self._clean(chunk).keys()
+            repeated = external_ids & batched
+            batch = []
+            for good in chunk:
+                is_repeat = isinstance(good, dict) and _to_int(good.get('id')) in repeated
+                (repeats if is_repeat else batch).append(good)
+            if external_ids - repeated:
+                batched.update(external_ids)
+                batches.append(save_slice(batch))
+            if len(repeats) >= self.chunk_size:
+                deferred.append(save_slice(repeats))
+                repeats = []
+        if repeats:
+            deferred.append(save_slice(repeats))
+        return batches, deferred
+
+    def write_batch(self, goods: list[dict]) -> dict:
+        """
+        Запись пачки товаров прайса в одной транзакции. Ошибки проверки товаров не добавляются в итоги - они уже
+        записаны при разбиении на пачки (split)
+
+        :param goods: список словарей с данными товаров
+        :return: итоги записи для объединения методом merge
+        """
+        with self.stats.batch(len(goods)):
+            failed, errors_list = self.failed, self.errors_list
+            with self.stats.stage('clean'):
+                cleaned = self._clean(goods)
+            self.failed, self.errors_list = failed, errors_list
+            self._write(cleaned)
+        return self.summary()
+
+    def summary(self) -> dict:
+        """Итоги записанных экземпляром товаров для объединения методом merge (JSON- и pickle-сериализуемые)"""
+        return {
+            'processed': self.processed, 'loaded': self.counter, 'failed': self.failed, 'errors': self.errors_list,
+            'created': self.created, 'updated': self.updated, 'unchanged': self.unchanged,
+            'products': list(self.product_ids), 'categories': list(self.category_ids), 'seen': list(self.seen),
+            'stats': self.stats.as_dict(),
+        }
+
+    def merge(self, summary: dict) -> None:
+        """Добавление итогов пачки или шарда, записанных отдельной задачей или процессом (результат summary)"""
+        self.processed += summary['processed']
+        self.failed += summary['failed']
+        self.errors_list.extend(summary['errors'])
+        self.counter += summary['loaded']
+        self.created += summary['created']
+        self.updated += summary['updated']
+        self.unchanged += summary['unchanged']
+        self.product_ids.update(summary['products'])
+        self.category_ids.update(summary['categories'])
+        self.seen.update(summary['seen'])
+        self.stats.merge(summary['stats'])
+
+    def finish(self) -> None:
+        """
+        Завершение загрузки: пересчет агрегата предложений (если он не пересчитывался по пачкам), обнуление
+        при POST остатков товаров, отсутствующих в прайсе, и пересборка индекса значений характеристик
+        затронутых категорий. При записи через промежуточную таблицу все это выполняет apply_staged
+        """
+        if self.staging:
+            with self.stats.stage('apply'):
+                self.apply_staged()
+        else:
+            if not self.refresh_offers:
+                with self.stats.stage('offers'):
+                    self._update_offers()
+            if self.method == 'POST':
+                with self.stats.stage('reset'):
+                    self.reset_missing()
+        with self.stats.stage('index'):
+            rebuild_parameter_index(self.category_ids)
+
+    def apply_staged(self) -> None:
+        """
+        Применение POST-прайса из промежуточной таблицы к остаткам магазина. Новые и изменившиеся товары сначала
+        готовятся пачками (_prepare_staged), остатки магазина при этом не меняются. Затем разница применяется одной
+        короткой транзакцией set-based запросами из промежуточных таблиц: товары и характеристики записываются
+        INSERT ... SELECT ... ON CONFLICT DO UPDATE (PostgreSQL, SQLite), изменившееся только количество - одним
+        UPDATE с подзапросом, остатки товаров, отсутствующих в прайсе, обнуляются одним UPDATE, журнал движений
+        остатков записывается INSERT ... SELECT; товары в Python не загружаются. Покупатели видят остатки магазина
+        целиком до или целиком после применения. Прерванное применение повторяется без повторной подготовки
+        уже подготовленных товаров.
+        """
+        self._prepare_staged()
+        staged = StagedGood.objects.filter(job=self.job)
+        same_content = staged.filter(external_id=OuterRef('external_id'), content_hash=OuterRef('content_hash'))
+        prepared = staged.filter(product__isnull=False)
+        total = staged.count()
+
+        with transaction.atomic():
+            # товар магазина на момент применения: без него подготовленный товар создается
+            prepared.update(product_info=Subquery(ProductInfo.objects.filter(
+                shop=self.shop, external_id=OuterRef('external_id')).values('id')[:1]))
+            # продукты и категории, от которых изменившиеся товары уходят, и к которым приходят
+            leaving = ProductInfo.objects.filter(id__in=prepared.values('product_info')).\
+                values_list('product_id', 'product__category_id')
+            arriving = Product.objects.filter(id__in=prepared.values('product')).values_list('id', 'category_id')
+            for product_id, category_id in (*leaving, *arriving):
+                self.product_ids.add(product_id)
+                self.category_ids.add(category_id)
+            restocked = ProductInfo.objects.filter(Exists(same_content.exclude(quantity=OuterRef('quantity'))),
+                                                   shop=self.shop)
+            missing = ProductInfo.objects.filter(shop=self.shop, quantity__gt=0).\
+                exclude(external_id__in=staged.values('external_id'))
+            self.product_ids.update(restocked.values_list('product_id', flat=True),
+                                    missing.values_list('product_id', flat=True))
+            self.created = prepared.filter(product_info__isnull=True).count()
+            self.updated = prepared.filter(product_info__isnull=False).count()
+            # запросы выполняются, только если есть что менять: загрузка того же прайса ничего не пишет в остатки
+            restocked_count = staged.filter(product__isnull=True).filter(Exists(ProductInfo.objects.filter(
+                shop=self.shop, external_id=OuterRef('external_id')).exclude(quantity=OuterRef('quantity')))).count()
+            has_missing = missing.exists()
+
+            with self.stats.stage('stock'):
+                self._record_staged_movements(self.updated + restocked_count, has_missing)
+                if restocked_count:
+                    restocked.update(quantity=Subquery(same_content.values('quantity')[:1]))
+                if has_missing:
+                    missing.update(quantity=0)
+            if self.created or self.updated:
+                with self.stats.stage('product_infos'):
+                    self._upsert_staged_product_infos(self.created)
+                with self.stats.stage('parameters'):
+                    self._upsert_staged_parameters()
+            self.updated += restocked_count
+            with self.stats.stage('offers'):
+                self._update_offers()
+            StagedParameter.objects.filter(job=self.job).delete()
+            staged.delete()
+
+        self.counter = total
+        self.unchanged = total - self.created - self.updated
+
+    def _prepare_staged(self) -> None:
+        """
+        Подготовка новых и изменившихся товаров промежуточной таблицы пачками: продукты и характеристики находятся
+        или создаются, поисковый документ и значения характеристик записываются в промежуточные таблицы. Каталог
+        при этом не меняется, подготовленные товары (с продуктом) при повторе применения пропускаются.
+        """
+        with self.stats.stage('compare'):
+            pending = list(StagedGood.objects.filter(job=self.job, product__isnull=True).exclude(Exists(
+                ProductInfo.objects.filter(shop=self.shop, external_id=OuterRef('external_id'),
+                                           content_hash=OuterRef('content_hash')))).
+                order_by('id').values_list('id', flat=True))
+        for ids in _iter_chunks(pending, self.chunk_size):
+            rows = list(StagedGood.objects.filter(id__in=ids))
+            external_ids = [row.external_id for row in rows]
+            with self.stats.stage('products'):
+                existing = dict(ProductInfo.objects.filter(shop=self.shop, external_id__in=external_ids).
+                                values_list('external_id', 'id'))
+                current = self._load_parameters(existing.values())
+                products = self._resolve_products([row.data for row in rows])
+                parameters = self._resolve_parameters([row.data for row in rows])
+            staged_parameters = []
+            for row in rows:
+                good = row.data
+                values = {name: value for name, (_, value) in current[existing[row.external_id]].items()} \
+                    if row.external_id in existing else {}
+                values.update(good['parameters'])
+                row.product_id = products[(good['category'], good['name'])]
+                row.search_document = join_search_document(
+                    [good['name'], good['model'], *(part for item in values.items() for part in item)])
+                staged_parameters.extend(StagedParameter(job=self.job, external_id=row.external_id,
+                                                         parameter_id=parameters[name], value=value)
+                                         for name, value in good['parameters'].items())
+            with transaction.atomic():
+                StagedParameter.objects.filter(job=self.job, external_id__in=external_ids).delete()
+                StagedParameter.objects.bulk_create(staged_parameters)
+                StagedGood.objects.bulk_update(rows, ['product', 'search_document'])
+                if self.on_chunk:  # счетчики не меняются, обновляется время прогресса загрузки
+                    self.on_chunk(self)
+
+    def _execute(self, sql: str, params: list) -> int:
+        """Выполнение запроса применения промежуточной таблицы с подстановкой имен таблиц, :return: число строк"""
+        tables = {name: connection.ops.quote_name(model._meta.db_table) for name, model in (
+            ('info', ProductInfo), ('product', Product), ('parameter', ProductParameter), ('movement', StockMovement),
+            ('staged', StagedGood), ('staged_parameter', StagedParameter))}
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(**tables), params)
+            return cursor.rowcount
+
+    def _record_staged_movements(self, changed: int, missing: bool) -> None:
+        """
+        Журнал движений остатков применяемого прайса до изменения остатков: изменение количества имеющихся товаров
+        и обнуление остатков товаров, отсутствующих в прайсе
+
+        :param changed: количество имеющихся товаров с изменениями, 0 - запрос не выполняется
+        :param missing: есть ли ненулевые остатки товаров, отсутствующих в прайсе
+        """
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        if changed:
+            self._execute(
+                'INSERT INTO {movement} (product_info_id, kind, quantity, created_at) '
+                'SELECT info.id, %s, staged.quantity - info.quantity, %s FROM {staged} staged '
+                'JOIN {info} info ON info.shop_id = %s AND info.external_id = staged.external_id '
+                'WHERE staged.job_id = %s AND staged.quantity <> info.quantity',
+                ['reset', now, self.shop.id, self.job.id])
+        if missing:
+            self._execute(
+                'INSERT INTO {movement} (product_info_id, kind, quantity, created_at) '
+                'SELECT info.id, %s, -info.quantity, %s FROM {info} info '
+                'WHERE info.shop_id = %s AND info.quantity > 0 AND NOT EXISTS '
+                '(SELECT 1 FROM {staged} staged WHERE staged.job_id = %s AND staged.external_id = info.external_id)',
+                ['reset', now, self.shop.id, self.job.id])
+
+    def _upsert_staged_product_infos(self, created: int) -> None:
+        """
+        Upsert подготовленных товаров из промежуточной таблицы по (магазин, артикул) и журнал остатков новых товаров
+
+        :param created: количество новых товаров, 0 - журнал не записывается
+        """
+        columns = ', '.join(PRODUCT_INFO_UPDATE_FIELDS)
+        # наименование продукта в промежуточной таблице не хранится и берется из подготовленного продукта
+        values = ', '.join('product.name' if field == 'name' else f'staged.{field}'
+                           for field in PRODUCT_INFO_UPDATE_FIELDS)
+        updates = ', '.join(f'{field} = excluded.{field}' for field in PRODUCT_INFO_UPDATE_FIELDS)
+        self._execute(
+            f'INSERT INTO {{info}} (shop_id, external_id, rating_count, rating_sum, {columns}) '
+            f'SELECT %s, staged.external_id, 0, 0, {values} FROM {{staged}} staged '
+            f'JOIN {{product}} product ON product.id = staged.product_id WHERE staged.job_id = %s '
+            f'ON CONFLICT (shop_id, external_id) DO UPDATE SET {updates}',
+            [self.shop.id, self.job.id])
+        if created:
+            self._execute(
+                'INSERT INTO {movement} (product_info_id, kind, quantity, created_at) '
+                'SELECT info.id, %s, staged.quantity, %s FROM {staged} staged '
+                'JOIN {info} info ON info.shop_id = %s AND info.external_id = staged.external_id '
+                'WHERE staged.job_id = %s AND staged.product_id IS NOT NULL AND staged.product_info_id IS NULL '
+                'AND staged.quantity > 0',
+                ['reset', connection.ops.adapt_datetimefield_value(timezone.now()), self.shop.id, self.job.id])
+
+    def _upsert_staged_parameters(self) -> None:
+        """Upsert значений характеристик подготовленных товаров по (товар, характеристика)"""
+        self._execute(
+            'INSERT INTO {parameter} (product_id, parameter_id, value) '
+            'SELECT info.id, staged.parameter_id, staged.value FROM {staged_parameter} staged '
+            'JOIN {info} info ON info.shop_id = %s AND info.external_id = staged.external_id '
+            'WHERE staged.job_id = %s '
+            'ON CONFLICT (product_id, parameter_id) DO UPDATE SET value = excluded.value',
+            [self.shop.id, self.job.id])
+
+    def _update_offers(self) -> None:
+        """Пересчет агрегата предложений продуктов, затронутых загрузкой, пачками по chunk_size продуктов"""
+        for product_ids in _iter_chunks(sorted(self.product_ids), self.chunk_size):
+            Product.update_offers(product_ids)
+
+    def import_chunk(self, goods: list[dict]) -> int:
+        """
+        Загрузка пачки товаров в одной транзакции. on_chunk вызывается в той же транзакции: записанная пачка
+        и сохраненный прогресс (контрольная точка загрузки) не расходятся при прерывании загрузки
+
+        :param goods: список словарей с данными товаров
+        :return: количество загруженных/обновленных товаров пачки
+        """
+        with self.stats.batch(len(goods)):
+            self.processed += len(goods)
+            self.last_id = _to_int(goods[-1].get('id')) if isinstance(goods[-1], dict) else None
+            with self.stats.stage('clean'):
+                goods = self._clean(goods)
+            with transaction.atomic():
+                if goods and self.staging:
+                    with self.stats.stage('staging'):
+                        self._stage(goods)
+                elif goods:
+                    self._write(goods)
+                if self.on_chunk:
+                    self.on_chunk(self)
+        return len(goods)
+
+    def _stage(self, goods: dict) -> None:
+        """
+        Запись проверенных товаров пачки в промежуточную таблицу: upsert по (загрузка, артикул), при повторе
+        артикула в прайсе действует последняя запись
+        """
+        rows = [StagedGood(job=self.job, external_id=external_id, model=good['model'], quantity=good['quantity'],
+                           price=good['price'], price_rrc=good['price_rrc'], description=good['description'],
+                           content_hash=get_content_hash(good), data=good) for external_id, good in goods.items()]
+        if connection.features.supports_update_conflicts_with_target:
+            StagedGood.objects.bulk_create(rows, update_conflicts=True, unique_fields=['job_id', 'external_id'],
+                                           update_fields=['model', 'quantity', 'price', 'price_rrc', 'description',
+                                                          'content_hash', 'data'])
+        else:
+            StagedGood.objects.filter(job=self.job, external_id__in=goods.keys()).delete()
+            StagedGood.objects.bulk_create(rows)
+        self.counter += len(goods)
+
+    def _write(self, goods: dict) -> None:
+        """
+        Запись проверенных товаров пачки в одной транзакции. Записываются только изменившиеся товары:
+        хеш содержимого товара сравнивается с сохраненным в ProductInfo.content_hash, при POST количество - с текущим
+        остатком (оно меняется и вне загрузок прайса - заказами, обнулением при POST). Товару, у которого
+        изменилось только количество, обновляется одно поле quantity.
+
+        При PATCH остаток не читается: количество поставки прибавляется к остатку одним UPDATE после записи товаров
+        (add_stock), так что параллельные поставки одного товара не теряют единицы.
+        """
+        receipt = self.method == 'PATCH'
+        with transaction.atomic():
+            with self.stats.stage('compare'):
+                existing = {external_id: (pk, product_id, quantity, content_hash, category_id)
+                            for external_id, pk, product_id, quantity, content_hash, category_id in
+                            ProductInfo.objects.filter(shop=self.shop, external_id__in=goods.keys()).
+                            values_list('external_id', 'id', 'product_id', 'quantity', 'content_hash',
+                                        'product__category_id')}
+
+                changed, restocked, affected_products = {}, [], set()
+                movements = {}  # артикул -> изменение остатка
+                for external_id, good in goods.items():
+                    good['content_hash'] = get_content_hash(good)
+                    if external_id not in existing:
+                        changed[external_id] = good
+                        movements[external_id] = good['quantity']
+                        continue
+                    pk, product_id, quantity_now, content_hash, category_id = existing[external_id]
+                    movements[external_id] = good['quantity'] if receipt else good['quantity'] - quantity_now
+                    if content_hash != good['content_hash']:
+                        changed[external_id] = good
+                        affected_products.add(product_id)  # продукт, от которого товар может уйти
+                        # категория, из которой товар может уйти: ее индекс характеристик тоже пересобирается
+                        self.category_ids.add(category_id)
+                    elif movements[external_id]:
+                        restocked.append(ProductInfo(id=pk, shop=self.shop, external_id=external_id,
+                                                     product_id=product_id, model=good['model'],
+                                                     quantity=good['quantity'], price=good['price'],
+                                                     price_rrc=good['price_rrc'], description=good['description']))
+                        affected_products.add(product_id)
+                    else:
+                        self.unchanged += 1
+
+            product_infos = {external_id: pk for external_id, (pk, *_) in existing.items()}
+            if changed:
+                existing = {external_id: existing[external_id][:3] for external_id in changed.keys() & existing.keys()}
+                with self.stats.stage('products'):
+                    current = self._load_parameters(pk for pk, _, _ in existing.values())
+                    products = self._resolve_products(changed.values())
+                    parameters = self._resolve_parameters(changed.values())
+                with self.stats.stage('product_infos'):
+                    product_infos.update(self._write_product_infos(changed, existing, current, products))
+                with self.stats.stage('parameters'):
+                    self._write_parameters(changed, product_infos, current, parameters)
+                affected_products.update(products.values())
+                self.created += len(changed) - len(existing)
+                self.updated += len(existing)
+                self.category_ids.update(good['category'] for good in changed.values())
+
+            with self.stats.stage('stock'):
+                if restocked and not receipt:
+                    self._write_quantities(restocked)
+                movements = {product_infos[external_id]: quantity for external_id, quantity in movements.items()}
+                if receipt:
+                    add_stock(movements, 'receipt')
+                else:
+                    record_movements(movements, 'reset')
+            self.updated += len(restocked)
+
+            # пересчитываем предложения продуктов записанных товаров и продуктов, от которых товары ушли
+            self.product_ids.update(affected_products)
+            if affected_products and self.refresh_offers:
+                with self.stats.stage('offers'):
+                    Product.update_offers(affected_products)
+
+        if self.method == 'POST':
+            self.seen.update(goods.keys())
+        self.counter += len(goods)
+
+    @staticmethod
+    def _write_quantities(rows: list) -> None:
+        """
+        Запись количества товаров, у которых не изменилось ничего, кроме количества: upsert по (магазин, артикул)
+        с обновлением одного поля quantity, на БД без его поддержки - bulk_update
+
+        :param rows: товары ProductInfo с id и данными прайса
+        """
+        if connection.features.supports_update_conflicts_with_target:
+            for row in rows:
+                row.id = None
+            ProductInfo.objects.bulk_create(rows, update_conflicts=True, unique_fields=['shop_id', 'external_id'],
+                                            update_fields=['quantity'])
+        else:
+            ProductInfo.objects.bulk_update(rows, ['quantity'])
+
+    def reset_missing(self) -> int:
+        """
+        Обнуление остатков товаров магазина, отсутствующих в прайсе (завершение POST-загрузки)
+
+        :return: количество обнуленных товаров
+        """
+        missing = [(pk, product_id, quantity) for pk, external_id, product_id, quantity in
+                   ProductInfo.objects.filter(shop=self.shop, quantity__gt=0).
+                   values_list('id', 'external_id', 'product_id', 'quantity').iterator()
+                   if external_id not in self.seen]
+        for start in range(0, len(missing), self.chunk_size):
+            batch = missing[start:start + self.chunk_size]
+            with transaction.atomic():
+                ProductInfo.objects.filter(id__in=[pk for pk, _, _ in batch]).update(quantity=0)
+                record_movements({pk: -quantity for pk, _, quantity in batch}, 'reset')
+                Product.update_offers({product_id for _, product_id, _ in batch})
+        return len(missing)
+
+    def get_errors(self) -> dict:
+        """Ошибки загрузки в формате ответа PartnerUpdate"""
+        if not self.failed:
+            return {}
+        return {'Errors': self.errors_list, 'Не удалось добавить товаров на остатки/обновить': self.failed}
+
+    def _add_error(self, good, error: str) -> None:
+        self.failed += 1
+        good_id, name = (good.get('id'), good.get('name')) if isinstance(good, dict) else (None, None)
+        self.errors_list.append({'product_info_creation_failed': (good_id, name, error)})
+
+    def _clean(self, goods: list[dict]) -> dict:
+        """
+        Валидация товаров пачки с подгрузкой недостающих id категорий одним запросом
+
+        :return: словарь артикул -> товар; при повторе артикула в пачке действует последняя запись,
+        а при PATCH количество повторов суммируется
+        """
+        category_ids = {_to_int(good.get('category')) for good in goods if isinstance(good, dict)}
+        category_ids -= self._known_categories
+        if category_ids:
+            self._known_categories.update(Category.objects.filter(id__in=category_ids).values_list('id', flat=True))
+
+        cleaned = {}
+        for good in goods:
+            try:
+                good = clean_good(good, self._known_categories)
+            except ValueError as e:
+                self._add_error(good, str(e))
+                continue
+            previous = cleaned.get(good['id'])
+            if previous and self.method == 'PATCH':
+                good['quantity'] += previous['quantity']
+            cleaned[good['id']] = good
+        return cleaned
+
+    @staticmethod
+    def _load_parameters(product_info_ids) -> dict:
+        """
+        Текущие характеристики уже имеющихся товаров пачки в порядке их добавления
+
+        :return: словарь id товара -> {название характеристики: (id записи ProductParameter, значение)}
+        """
+        current = defaultdict(dict)
+        product_info_ids = list(product_info_ids)
+        if product_info_ids:
+            rows = ProductParameter.objects.filter(product_id__in=product_info_ids).order_by('id').\
+                values_list('id', 'product_id', 'parameter__name', 'value')
+            for pk, product_id, name, value in rows:
+                current[product_id][name] = (pk, value)
+        return current
+
+    @staticmethod
+    def _resolve_products(goods) -> dict:
+        """
+        Получение продуктов по ключу (категория, наименование), недостающие создаются одним bulk_create
+
+        :return: словарь (id категории, наименование) -> id продукта
+        """
+        keys = {(good['category'], good['name']) for good in goods}
+
+        def load(names) -> dict:
+            rows = Product.objects.filter(category_id__in={category for category, _ in keys}, name__in=names).\
+                values_list('category_id', 'name', 'id')
+            return {(category, name): pk for category, name, pk in rows if (category, name) in keys}
+
+        products = load({name for _, name in keys})
+        missing = keys - products.keys()
+        if missing:
+            # ignore_conflicts - продукт мог быть создан параллельной загрузкой другого магазина
+            Product.objects.bulk_create([Product(category_id=category, name=name) for category, name in missing],
+                                        ignore_conflicts=True)
+            products.update(load({name for _, name in missing}))
+        return products
+
+    def _resolve_parameters(self, goods) -> dict:
+        """
+        Получение id характеристик по названию с кешированием между пачками, недостающие создаются bulk_create
+
+        :return: словарь название характеристики -> id
+        """
+        names = {name for good in goods for name in good['parameters']}
+        missing = names - self._parameters.keys()
+        if missing:
+            self._parameters.update(Parameter.objects.filter(name__in=missing).values_list('name', 'id'))
+            missing -= self._parameters.keys()
+        if missing:
+            Parameter.objects.bulk_create([Parameter(name=name) for name in missing], ignore_conflicts=True)
+            self._parameters.update(Parameter.objects.filter(name__in=missing).values_list('name', 'id'))
+        return self._parameters
+
+    def _write_product_infos(self, goods: dict, existing: dict, current: dict, products: dict) -> dict:
+        """
+        Upsert товаров пачки по уникальному ключу (магазин, артикул). Поисковый документ собирается из данных
+        прайса и текущих характеристик товара и записывается тем же запросом.
+
+        :param goods: словарь артикул -> товар с количеством и хешем содержимого
+        :param existing: словарь артикул -> (id, id продукта, количество) уже имеющихся товаров магазина
+        :param current: текущие характеристики имеющихся товаров (см. _load_parameters)
+        :param products: словарь (id категории, наименование) -> id продукта
+        :return: словарь артикул -> id товара ProductInfo
+        """
+        rows = []
+        for external_id, good in goods.items():
+            parameters = {}
+            if external_id in existing:
+                parameters = {name: value for name, (_, value) in current[existing[external_id][0]].items()}
+            parameters.update(good['parameters'])
+            rows.append(ProductInfo(
+                shop=self.shop,
+                external_id=external_id,
+                product_id=products[(good['category'], good['name'])],
+                name=good['name'],
+                model=good['model'],
+                quantity=0 if self.method == 'PATCH' else good['quantity'],  # поставка прибавляется в _write
+                price=good['price'],
+                price_rrc=good['price_rrc'],
+                description=good['description'],
+                search_document=join_search_document(
+                    [good['name'], good['model'], *(part for item in parameters.items() for part in item)]),
+                content_hash=good['content_hash'],
+            ))
+
+        fields = PRODUCT_INFO_RECEIPT_UPDATE_FIELDS if self.method == 'PATCH' else PRODUCT_INFO_UPDATE_FIELDS
+        if copy_available():
+            copy_upsert(ProductInfo, rows, ['shop_id', 'external_id'], fields)
+        elif connection.features.supports_update_conflicts_with_target:
+            ProductInfo.objects.bulk_create(rows, update_conflicts=True, unique_fields=['shop_id', 'external_id'],
+                                            update_fields=fields)
+        else:
+            for row in rows:
+                if row.external_id in existing:
+                    row.id = existing[row.external_id][0]
+            ProductInfo.objects.bulk_create([row for row in rows if row.id is None])
+            ProductInfo.objects.bulk_update([row for row in rows if row.id is not None], fields)
+
+        product_infos = {external_id: pk for external_id, (pk, _, _) in existing.items()}
+        created = goods.keys() - product_infos.keys()
+        if created:
+            product_infos.update(ProductInfo.objects.filter(shop=self.shop, external_id__in=created).
+                                 values_list('external_id', 'id'))
+        return product_infos
+
+    @staticmethod
+    def _write_parameters(goods: dict, product_infos: dict, current: dict, parameters: dict) -> None:
+        """
+        Upsert значений характеристик товаров пачки по уникальному ключу (товар, характеристика).
+        Характеристики, отсутствующие в прайсе, не удаляются.
+        """
+        rows = [ProductParameter(id=current[product_infos[external_id]].get(name, (None,))[0],
+                                 product_id=product_infos[external_id], parameter_id=parameters[name], value=value)
+                for external_id, good in goods.items() for name, value in good['parameters'].items()]
+        if not rows:
+            return
+
+        if copy_available():
+            copy_upsert(ProductParameter, rows, ['product_id', 'parameter_id'], ['value'])
+        elif connection.features.supports_update_conflicts_with_target:
+            for row in rows:
+                row.id = None
+            ProductParameter.objects.bulk_create(rows, update_conflicts=True,
+                                                 unique_fields=['product_id', 'parameter_id'], update_fields=['value'])
+        else:
+            ProductParameter.objects.bulk_create([row for row in rows if row.id is None])
+            ProductParameter.objects.bulk_update([row for row in rows if row.id is not None], ['value'])
+
+
+def create_job_categories(job: ImportJob, file, price_format: str, stats: ImportStats) -> None:
+    """
+    Создание категорий csv-прайса воркером перед загрузкой товаров: категории csv указываются в строках товаров
+    и собираются чтением всего файла, поэтому при запросе загрузки читается только магазин. Ошибки создания
+    категорий записываются в задачу загрузки, как ошибки категорий, созданных при запросе.
+
+    :param job: задача загрузки
+    :param file: файл прайса, после чтения категорий возвращается в начало
+    :param price_format: формат прайса
+    :param stats: метрики этапов загрузки
+    """
+    if price_format != 'csv':
+        return
+    with stats.stage('categories'):
+        categories = read_price_list_header(file, price_format).get('categories')
+        file.seek(0)
+        if categories:
+            create_categories(categories, job.shop, job.errors.get('Не удалось создать категорий', 0),
+                              job.errors.get('Errors', []), job.errors)
+
+
+def run_import_job(job: ImportJob) -> dict:
+    """
+    Фоновая загрузка товаров прайса по задаче ImportJob с записью прогресса после каждой пачки и итогов загрузки.
+    При POST остатки магазина, не переданные в прайсе, обнуляются.
+
+    Прогресс записывается в транзакции пачки и служит контрольной точкой: загрузка, прерванная перезапуском
+    воркера или ошибкой, продолжается с товара, следующего за последней записанной пачкой.
+
+    :param job: задача загрузки с сохраненным файлом прайса
+    :return: итог загрузки в формате ответа PartnerUpdate
+    """
+    jobs = ImportJob.objects.filter(id=job.id)
+    job.errors.pop('Error', None)  # ошибка, прервавшая загрузку до возобновления
+    job.attempts += 1
+    jobs.update(state='running', errors=job.errors, attempts=job.attempts, finished_at=None, updated_at=timezone.now())
+    saved_failed = job.failed
+
+    def save_progress(importer: GoodsImporter) -> None:
+        nonlocal saved_failed
+        progress = dict(processed=importer.processed, loaded=importer.counter, failed=importer.failed,
+                        created=importer.created, updated=importer.updated, unchanged=importer.unchanged,
+                        checkpoint=importer.processed, checkpoint_id=importer.last_id, updated_at=timezone.now())
+        if importer.failed != saved_failed:  # ошибки товаров записываются, только если добавились
+            job.errors.update(importer.get_errors())
+            progress['errors'], saved_failed = job.errors, importer.failed
+        jobs.update(**progress)
+
+    try:
+        stats = ImportStats(job.id, job.stats.get('stages'))
+        # товары читаются из файла потоково и передаются на запись пачками
+        with stats.capture(), job.file.open('rb') as file:
+            price_format = get_price_list_format(job.file.name)
+            if not job.checkpoint:
+                create_job_categories(job, file, price_format, stats)
+            importer = GoodsImporter(job.shop, job.method, errors_list=job.errors.get('Errors', []),
+                                     on_chunk=save_progress, job=job, stats=stats)
+            goods = iter_price_list_goods(file, price_format)
+            if job.checkpoint:
+                importer.counter, importer.failed = job.loaded, job.failed
+                importer.created, importer.updated, importer.unchanged = job.created, job.updated, job.unchanged
+                goods = importer.skip(goods, job.checkpoint, job.checkpoint_id)
+            importer.import_goods(goods)
+    except Exception as error:
+        fail_import_job(job, error)
+        raise
+    return _complete_import_job(job, importer)
+
+
+def _slice_prefix(job: ImportJob) -> str:
+    """Начало имени файлов пачек параллельной загрузки в хранилище прайсов"""
+    return f'{IMPORT_SLICE_DIR}/{job.id}-'
+
+
+def save_job_slice(job: ImportJob, number: int, goods: list[dict]) -> str:
+    """
+    Запись товаров пачки параллельной загрузки в отдельный файл JSON Lines рядом с прайсом
+
+    :param job: задача загрузки
+    :param number: номер файла пачки
+    :param goods: список словарей с данными товаров в порядке прайса
+    :return: имя файла в хранилище прайсов
+    """
+    content = ''.join(json.dumps(good, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for good in goods)
+    return job.file.storage.save(f'{_slice_prefix(job)}{number:06}.jsonl', ContentFile(content.encode('utf-8')))
+
+
+def read_job_slice(job: ImportJob, name: str) -> list[dict]:
+    """
+    Чтение товаров пачки параллельной загрузки из ее файла: прайс не перечитывается, в памяти - только пачка
+
+    :param job: задача загрузки
+    :param name: имя файла пачки (save_job_slice)
+    :return: список словарей с данными товаров в порядке прайса
+    """
+    with job.file.storage.open(name, 'rb') as file:
+        return [json.loads(line) for line in file]
+
+
+def delete_job_slices(job: ImportJob) -> None:
+    """Удаление файлов пачек параллельной загрузки после ее завершения или ошибки"""
+    storage, prefix = job.file.storage, _slice_prefix(job)
+    if storage.exists(IMPORT_SLICE_DIR):
+        for name in storage.listdir(IMPORT_SLICE_DIR)[1]:
+            if f'{IMPORT_SLICE_DIR}/{name}'.startswith(prefix):
+                storage.delete(f'{IMPORT_SLICE_DIR}/{name}')
+
+
+def start_batch_import(job: ImportJob) -> tuple[list, list]:
+    """
+    Первый этап параллельной загрузки: проверка товаров прайса и разбиение на пачки для задач Celery, каждая
+    пачка записывается в свой файл. Количество обработанных товаров и ошибки проверки записываются в задачу
+    загрузки.
+
+    :param job: задача загрузки с сохраненным файлом прайса
+    :return: имена файлов пачек и файлов отложенных повторов артикулов (см. GoodsImporter.split)
+    """
+    job.attempts += 1
+    ImportJob.objects.filter(id=job.id).update(state='running', attempts=job.attempts, updated_at=timezone.now())
+    numbers = itertools.count(1)
+    try:
+        stats = ImportStats(job.id, job.stats.get('stages'))
+        with stats.capture(), job.file.open('rb') as file:
+            price_format = get_price_list_format(job.file.name)
+            create_job_categories(job, file, price_format, stats)
+            importer = GoodsImporter(job.shop, job.method, errors_list=job.errors.get('Errors', []), stats=stats)
+            with stats.stage('split'):
+                batches, deferred = importer.split(iter_price_list_goods(file, price_format),
+                                                   lambda goods: save_job_slice(job, next(numbers), goods))
+    except Exception as error:
+        fail_import_job(job, error)
+        raise
+
+    job.errors.update(importer.get_errors())
+    job.total = job.processed = importer.processed
+    job.failed = importer.failed
+    job.stats = importer.stats.as_dict()
+    job.save(update_fields=['total', 'processed', 'failed', 'errors', 'stats', 'updated_at'])
+    return batches, deferred
+
+
+def import_batch(job: ImportJob, name: str) -> dict:
+    """
+    Запись пачки товаров параллельной загрузки, прочитанной из файла пачки, с увеличением счетчика загруженных
+    товаров задачи
+
+    :param job: задача загрузки
+    :param name: имя файла пачки
+    :return: итоги пачки (GoodsImporter.write_batch)
+    """
+    importer = GoodsImporter(job.shop, job.method, refresh_offers=False, stats=ImportStats(job.id))
+    with importer.stats.capture():
+        with importer.stats.stage('parse'):
+            goods = read_job_slice(job, name)
+        summary = importer.write_batch(goods)
+    ImportJob.objects.filter(id=job.id).update(loaded=F('loaded') + importer.counter, updated_at=timezone.now())
+    return summary
+
+
+def finish_batch_import(job: ImportJob, summaries: list[dict], deferred: list[str]) -> dict:
+    """
+    Завершение параллельной загрузки после записи всех пачек: объединение итогов пачек, запись отложенных
+    повторов артикулов, пересчет предложений, обнуление отсутствующих остатков при POST, индекс характеристик.
+    Пачки записываются сразу в остатки, без промежуточной таблицы: до завершения остатки обновлены частично
+
+    :param job: задача загрузки
+    :param summaries: итоги пачек
+    :param deferred: имена файлов отложенных товаров в порядке прайса
+    :return: итог загрузки в формате ответа PartnerUpdate
+    """
+    importer = GoodsImporter(job.shop, job.method, errors_list=job.errors.get('Errors', []), refresh_offers=False,
+                             stats=ImportStats(job.id, job.stats.get('stages')))
+    importer.processed, importer.failed = job.processed, job.failed
+    try:
+        for summary in summaries:
+            importer.merge(summary)
+        with importer.stats.capture():
+            for name in deferred:
+                with importer.stats.stage('parse'):
+                    goods = read_job_slice(job, name)
+                importer.write_batch(goods)
+            importer.finish()
+    except Exception as error:
+        fail_import_job(job, error)
+        raise
+    return _complete_import_job(job, importer)
+
+
+def _import_shard(job_id: int, shop_id: int, method: str, chunk_size: int, chunks: multiprocessing.Queue,
+                  results: multiprocessing.Queue) -> None:
+    """
+    Процесс загрузки шарда прайса: пачки товаров шарда из очереди chunks записываются в отдельных транзакциях
+    через собственное соединение с БД, итоги (GoodsImporter.summary) или ошибка передаются в очередь results
+
+    :param job_id: id задачи загрузки (для строк лога метрик)
+    :param shop_id: id магазина
+    :param method: http-метод загрузки (POST/PATCH)
+    :param chunk_size: количество товаров в транзакции
+    :param chunks: очередь пачек товаров шарда, None - конец шарда
+    :param results: очередь итогов процессов
+    """
+    finished = False  # конец шарда получен: больше пачек в очереди не будет
+    try:
+        importer = GoodsImporter(Shop.objects.get(id=shop_id), method, chunk_size=chunk_size, refresh_offers=False,
+                                 stats=ImportStats(job_id))
+        with importer.stats.capture():
+            while (goods := chunks.get()) is not None:
+                importer.import_chunk(goods)
+            finished = True
+        results.put(importer.summary())
+    except Exception as error:
+        while not finished:  # разбираем очередь до конца шарда, чтобы не заблокировать раздачу пачек
+            finished = chunks.get() is None
+        results.put({'error': f'{type(error).__name__}: {error}'})
+    finally:
+        connections.close_all()
+
+
+def _wait(action, process: multiprocessing.Process):
+    """Ожидание операции с очередью процесса с проверкой, что процесс не завершился аварийно"""
+    while True:
+        try:
+            return action()
+        except (queue.Full, queue.Empty):
+            if not process.is_alive():
+                raise RuntimeError(f'Процесс загрузки {process.name} завершился с кодом {process.exitcode}')
+
+
+def run_sharded_import(job: ImportJob, goods, workers: int = 1) -> dict:
+    """
+    Загрузка товаров прайса процессами: товары шардируются по артикулу, каждый процесс записывает свой шард
+    пачками в отдельных транзакциях через собственное соединение с БД. Повторы артикула попадают в один шард
+    и записываются по порядку, как при последовательной загрузке. После записи всех шардов итоги и ошибки
+    объединяются, предложения пересчитываются один раз, при POST обнуляются остатки, отсутствующие в прайсе.
+    Промежуточная таблица не используется: до завершения загрузки остатки магазина обновлены частично.
+
+    :param job: задача загрузки (файл не сохраняется, товары передаются в goods)
+    :param goods: итерируемый набор словарей с данными товаров
+    :param workers: количество процессов, 1 - загрузка в текущем процессе
+    :return: итог загрузки в формате ответа PartnerUpdate
+    """
+    ImportJob.objects.filter(id=job.id).update(state='running', updated_at=timezone.now())
+    importer = GoodsImporter(job.shop, job.method, errors_list=job.errors.get('Errors', []), refresh_offers=False,
+                             stats=ImportStats(job.id, job.stats.get('stages')))
+    try:
+        if workers == 1:
+            shard = GoodsImporter(job.shop, job.method, refresh_offers=False, stats=ImportStats(job.id))
+            with shard.stats.capture():
+                for chunk in shard.stats.iterate('parse', _iter_chunks(goods, shard.chunk_size)):
+                    shard.import_chunk(chunk)
+            summaries = [shard.summary()]
+        else:
+            summaries = _run_shards(job, goods, workers, importer.chunk_size)
+        for summary in summaries:
+            importer.merge(summary)
+        with importer.stats.capture():
+            importer.finish()
+    except Exception as error:
+        fail_import_job(job, error)
+        raise
+    return _complete_import_job(job, importer)
+
+
+def _run_shards(job: ImportJob, goods, workers: int, chunk_size: int) -> list[dict]:
+    """Раздача товаров по процессам шардов и сбор их итогов (см. run_sharded_import)"""
+    context = multiprocessing.get_context('fork')  # процессы наследуют настроенный Django
+    results = context.Queue()
+    shards = []
+    connections.close_all()  # соединение родителя не должно использоваться процессами
+    for number in range(workers):
+        chunks = context.Queue(maxsize=2)  # не больше двух пачек шарда в памяти
+        process = context.Process(target=_import_shard, name=f'importshop-{number}',
+                                  args=(job.id, job.shop_id, job.method, chunk_size, chunks, results))
+        process.start()
+        shards.append((process, chunks, []))
+
+    try:
+        for good in goods:
+            external_id = _to_int(good.get('id')) if isinstance(good, dict) else None
+            process, chunks, chunk = shards[(external_id or 0) % workers]
+            chunk.append(good)
+            if len(chunk) >= chunk_size:
+                _wait(lambda: chunks.put(list(chunk), timeout=1), process)
+                chunk.clear()
+        for process, chunks, chunk in shards:
+            if chunk:
+                _wait(lambda: chunks.put(chunk, timeout=1), process)
+            _wait(lambda: chunks.put(None, timeout=1), process)
+        summaries = []
+        while len(summaries) < workers:
+            try:
+                summaries.append(results.get(timeout=1))
+            except queue.Empty:
+                if not any(process.is_alive() for process, _, _ in shards):
+                    raise RuntimeError('Процессы загрузки завершились без передачи итогов')
+    finally:
+        for process, _, _ in shards:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+    errors = [summary['error'] for summary in summaries if 'error' in summary]
+    if errors:
+        raise RuntimeError('; '.join(errors))
+    return summaries
+
+
+def fail_import_job(job: ImportJob, error) -> None:
+    """
+    Запись ошибки загрузки, прервавшей задачу. Ошибка в самом прайсе (ValueError: некорректный прайс, прайс
+    не совпадает с контрольной точкой) повторится при каждом возобновлении, поэтому такая загрузка, как и загрузка,
+    исчерпавшая IMPORT_MAX_ATTEMPTS попыток, завершается окончательно: файл прайса и промежуточные товары удаляются,
+    команда resumeimports ее не возобновляет
+    """
+    job.errors['Error'] = str(error)
+    if job.file:
+        delete_job_slices(job)
+    now = timezone.now()
+    progress = dict(state='failed', errors=job.errors, finished_at=now, updated_at=now)
+    if isinstance(error, ValueError) or job.attempts >= settings.IMPORT_MAX_ATTEMPTS:
+        StagedParameter.objects.filter(job=job).delete()
+        StagedGood.objects.filter(job=job).delete()
+        job.file.delete(save=False)
+        progress['file'] = ''
+    ImportJob.objects.filter(id=job.id).update(**progress)
+
+
+def _complete_import_job(job: ImportJob, importer: GoodsImporter) -> dict:
+    """Запись итогов успешной загрузки и удаление файла прайса"""
+    job.errors.update(importer.get_errors())
+    job.state, job.loaded, job.failed = 'done', importer.counter, importer.failed
+    job.created, job.updated, job.unchanged = importer.created, importer.updated, importer.unchanged
+    job.total = job.processed = importer.processed
+    job.stats = importer.stats.as_dict()
+    job.finished_at = timezone.now()
+    if job.file:
+        delete_job_slices(job)
+    job.file.delete(save=False)  # файл прайса больше не нужен
+    job.save(update_fields=['state', 'loaded', 'failed', 'created', 'updated', 'unchanged', 'total', 'processed',
+                            'errors', 'stats', 'finished_at', 'file', 'updated_at'])
+    importer.stats.log('import_done', method=job.method, processed=job.processed, loaded=job.loaded,
+                       failed=job.failed, batches=len(job.stats['batches']), stages=job.stats['stages'])
+    return job.result
@@ -0,0 +1,81 @@
+# версионируемый кеш ответов редко изменяемых списков (категории, магазины)
+
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+# время жизни закешированного ответа, устаревшие версии вытесняются по времени
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# имена версионируемых списков
+CATEGORIES_CACHE = 'categories'
+SHOPS_CACHE = 'shops'
+
+
+def is_shared_cache() -> bool:
+    """
+    Кеш общий для всех процессов (Redis): версия, увеличенная воркером Celery или другим процессом веб-сервера,
+    видна процессу, отдающему список. В локальной памяти процесса (LocMemCache) версия другого процесса не видна,
+    поэтому списки без общего кеша не кешируются.
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_cache_version(name: str) -> int:
+    """
+    Текущая версия списка. При отсутствии счетчика в кеше (первый запрос, вытеснение) он создается со значением
+    текущего времени в наносекундах, чтобы новая версия не совпала с версией ранее закешированных ответов.
+
+    :param name: имя версионируемого списка
+    :return: номер версии
+    """
+    key = f'version:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_cache_version(*names: str) -> None:
+    """
+    Увеличение версии списков: закешированные ответы и выданные клиентам ETag перестают совпадать с текущими
+
+    :param names: имена версионируемых списков
+    """
+    for name in names:
+        key = f'version:{name}'
+        try:
+            cache.incr(key)
+        except ValueError:  # счетчика нет в кеше
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+class VersionedCacheMixin:
+    """
+    Миксин ListAPIView: ответ списка хранится в кеше под ключом с номером версии списка, ETag ответа содержит
+    номер версии. При совпадении If-None-Match с текущим ETag возвращается 304 без обращения к БД.
+    Версия увеличивается при изменении данных списка (bump_cache_version).
+    Без общего кеша (is_shared_cache) список отдается из БД без кеширования и ETag.
+    """
+
+    cache_name = None
+
+    def list(self, request, *args, **kwargs):
+        if not is_shared_cache():
+            return super().list(request, *args, **kwargs)
+        version = get_cache_version(self.cache_name)
+        etag = f'"{self.cache_name}-{version}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=304, headers={'ETag': etag})
+
+        key = f'{self.cache_name}:{version}:{request.get_full_path()}'
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, CACHE_TIMEOUT)
+        return Response(data, headers={'ETag': etag})
@@ -95,6 +95,10 @@ class Error(Enum):
         'Status': False,
         'Error': 'Некорректное значение аргумента is_main'
     }
+    IMPORT_JOB_NOT_EXIST = {
+        'Status': False,
+        'Error': 'Загрузка прайса не существует или не относится к магазину пользователя'
+    }
     ORDER_NOT_EXIST = {
         'Status': False,
         'Error': 'Заказ не существует'
@@ -146,6 +150,9 @@ class ValidateError(Enum):
     Ошибки валидации данных
     """
     ANOTHER_USER_CONTACT = 'Контакт не указан или не принадлежит пользователю'
+    CATEGORY_FORMAT_WRONG = 'Категория должна содержать целый неотрицательный id и название'
+    CATEGORY_ID_TAKEN = 'Категория с таким id уже существует под другим названием'
+    CATEGORY_NAME_TAKEN = 'Категория с таким названием уже существует под другим id'
     CITY_IS_INCORRECT = 'Некорректное название города'
     CONTACTS_EXCEEDING = 'Нельзя добавить пользователю более 5 контактов'
     DELIVERY_DATE_WRONG = 'Необходимо указать дату доставки'
@@ -154,10 +161,18 @@ class ValidateError(Enum):
     DUPLICATE_BASKET = 'Нельзя создать вторую корзину'
     EMAIL_FAILED = 'Не удалось доставить письмо с изменением статуса заказа на электронную почту'
     EMAIL_NOT_UNIQUE = 'Пользователь с таким email уже существует'
+    FIELDS_WRONG = 'Неизвестные поля в fields/exclude'
+    GOOD_CATEGORY_NOT_FOUND = 'Категория товара не найдена'
+    GOOD_FIELD_REQUIRED = 'Не указаны обязательные поля товара'
+    GOOD_FIELD_WRONG = 'Поля товара должны быть целыми неотрицательными числами'
+    GOOD_FORMAT_WRONG = 'Некорректный формат описания товара'
+    GOOD_NAME_TOO_LONG = 'Слишком длинное наименование или модель товара'
+    GOOD_PARAMETERS_WRONG = 'Некорректные характеристики товара'
     ICON_EXCEEDING = 'Основная иконка может быть только одна'
     ICON_IS_EMPTY = 'Выберите основную иконку'
     NAME_REQUIRED = 'Необходимо указать имя и фамилию пользователя'
     ORDER_IS_EMPTY = 'Невозможно сохранить пустой заказ/корзину'
+    PARAMETER_FILTER_WRONG = 'Фильтр по характеристике указывается в формате "характеристика:значение"'
     PHONE_IS_INCORRECT = 'Некорректный номер телефона'
     RECIPIENT_IS_EMPTY = 'Необходимо указать получателя доставки'
     STREET_IS_INCORRECT = 'Некорректное название улицы'
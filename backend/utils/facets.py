@@ -0,0 +1,190 @@
+# фильтры по характеристикам товаров и подсчет фасетов каталога
+
+from bisect import insort
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import ValidationError
+
+from backend.models import Parameter, ParameterValueIndex, ProductParameter
+from backend.utils.error_text import ValidateError
+
+# развертывание posting list индекса в строки средствами БД: соединение с табличной функцией JSON-массива
+# и выражение id товара; на остальных БД фильтры и фасеты считаются по характеристикам товаров
+POSTING_ROWS = {
+    'postgresql': ('CROSS JOIN LATERAL jsonb_array_elements_text(idx.product_infos) AS posting(id)',
+                   'posting.id::integer'),
+    'sqlite': ('CROSS JOIN json_each(idx.product_infos) AS posting', 'posting.value'),
+}
+
+
+def parse_parameter_filters(params: list) -> dict:
+    """
+    Разбор фильтров по характеристикам вида 'характеристика:значение'.
+    Значения одной характеристики объединяются по ИЛИ, разные характеристики - по И.
+
+    :param params: список значений параметра запроса 'param'
+    :return: словарь {название характеристики: множество значений}
+    """
+    parameters = defaultdict(set)
+    for param in params:
+        name, _, value = param.partition(':')
+        if not name.strip() or not value.strip():
+            raise ValidationError({'param': ValidateError.PARAMETER_FILTER_WRONG.value})
+        parameters[name.strip()].add(value.strip())
+    return parameters
+
+
+def rebuild_parameter_index(category_ids) -> int:
+    """
+    Пересборка индекса значений характеристик (ParameterValueIndex) для указанных категорий одним проходом
+    по характеристикам товаров
+
+    :param category_ids: id категорий
+    :return: количество записей индекса
+    """
+    category_ids = set(category_ids)
+    postings = defaultdict(list)
+    rows = ProductParameter.objects.filter(product__product__category_id__in=category_ids).\
+        values_list('product__product__category_id', 'parameter_id', 'value', 'product_id').order_by('product_id')
+    for category_id, parameter_id, value, product_id in rows.iterator():
+        postings[(category_id, parameter_id, value)].append(product_id)
+
+    with transaction.atomic():
+        ParameterValueIndex.objects.filter(category_id__in=category_ids).delete()
+        ParameterValueIndex.objects.bulk_create(
+            [ParameterValueIndex(category_id=category_id, parameter_id=parameter_id, value=value, product_infos=ids)
+             for (category_id, parameter_id, value), ids in postings.items()],
+            batch_size=500)
+    return len(postings)
+
+
+def update_parameter_index(product_info_ids, category_ids) -> None:
+    """
+    Обновление индекса значений характеристик для отдельных товаров (правка в админке): id товаров удаляются
+    из posting lists указанных категорий и добавляются в posting lists их текущих значений. Читаются и
+    блокируются только posting lists, в которых товары есть или появляются; на БД без развертывания posting
+    lists (POSTING_ROWS) категории пересобираются целиком.
+
+    :param product_info_ids: id товаров ProductInfo
+    :param category_ids: категории, в которых товары были (из которых могли уйти)
+    """
+    product_info_ids, category_ids = set(product_info_ids), set(category_ids)
+    if connection.vendor not in POSTING_ROWS:
+        rebuild_parameter_index(category_ids | set(ProductParameter.objects.filter(
+            product_id__in=product_info_ids).values_list('product__product__category_id', flat=True)))
+        return
+
+    current = defaultdict(list)
+    for key in ProductParameter.objects.filter(product_id__in=product_info_ids).\
+            values_list('product__product__category_id', 'parameter_id', 'value', 'product_id'):
+        current[key[:3]].append(key[3])
+
+    with transaction.atomic():
+        join, column = POSTING_ROWS[connection.vendor]
+        category_ids |= {key[0] for key in current}
+        if not product_info_ids or not category_ids:
+            return
+        containing = RawSQL(f'SELECT idx.id FROM {_table(ParameterValueIndex)} idx {join} '
+                            f'WHERE idx.category_id IN ({", ".join(["%s"] * len(category_ids))}) '
+                            f'AND {column} IN ({", ".join(["%s"] * len(product_info_ids))})',
+                            [*category_ids, *product_info_ids])
+        postings = ParameterValueIndex.objects.select_for_update().filter(id__in=containing)
+        if current:
+            postings |= ParameterValueIndex.objects.select_for_update().filter(
+                category_id__in={key[0] for key in current}, parameter_id__in={key[1] for key in current},
+                value__in={key[2] for key in current})
+        postings = {(posting.category_id, posting.parameter_id, posting.value): posting for posting in postings}
+
+        changed = []
+        for key, posting in postings.items():
+            ids = [pk for pk in posting.product_infos if pk not in product_info_ids]
+            for pk in current.get(key, ()):
+                insort(ids, pk)
+            if ids != posting.product_infos:
+                posting.product_infos = ids
+                changed.append(posting)
+        ParameterValueIndex.objects.filter(id__in=[posting.id for posting in changed if not posting.product_infos]).\
+            delete()
+        ParameterValueIndex.objects.bulk_update([posting for posting in changed if posting.product_infos],
+                                                ['product_infos'])
+        ParameterValueIndex.objects.bulk_create(
+            [ParameterValueIndex(category_id=category_id, parameter_id=parameter_id, value=value,
+                                 product_infos=sorted(ids))
+             for (category_id, parameter_id, value), ids in current.items() if (category_id, parameter_id, value)
+             not in postings])
+
+
+def _table(model) -> str:
+    """Имя таблицы модели для raw SQL"""
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def has_category_index(category_id) -> bool:
+    """
+    Используется ли индекс значений характеристик категории: категория указана, индекс построен, и БД
+    разворачивает posting lists в запросе (POSTING_ROWS)
+
+    :param category_id: id категории из параметра запроса (строка) или None
+    """
+    return bool(category_id) and str(category_id).isdigit() and connection.vendor in POSTING_ROWS and \
+        ParameterValueIndex.objects.filter(category_id=category_id).exists()
+
+
+def filter_by_parameters(queryset, parameters: dict, category_id=None):
+    """
+    Фильтрация товаров по характеристикам. В пределах категории товары выбираются пересечением posting lists
+    индекса в БД: на каждую характеристику - подзапрос id товаров из posting lists только ее выбранных значений,
+    иначе - подзапросом EXISTS на каждую характеристику.
+
+    :param queryset: queryset товаров
+    :param parameters: словарь {название характеристики: множество значений}
+    :param category_id: id категории из параметра запроса
+    """
+    if has_category_index(category_id):
+        join, column = POSTING_ROWS[connection.vendor]
+        for name, values in parameters.items():
+            placeholders = ', '.join(['%s'] * len(values))
+            queryset = queryset.filter(id__in=RawSQL(
+                f'SELECT {column} FROM {_table(ParameterValueIndex)} idx {join} '
+                f'JOIN {_table(Parameter)} parameter ON parameter.id = idx.parameter_id '
+                f'WHERE idx.category_id = %s AND parameter.name = %s AND idx.value IN ({placeholders})',
+                [int(category_id), name, *values]))
+        return queryset
+
+    for name, values in parameters.items():
+        queryset = queryset.filter(Exists(ProductParameter.objects.filter(product=OuterRef('pk'), parameter__name=name,
+                                                                          value__in=values)))
+    return queryset
+
+
+def get_parameter_facets(queryset, category_id=None) -> dict:
+    """
+    Подсчет фасетов: количество товаров выборки для каждого значения каждой характеристики. Считается в БД одним
+    сгруппированным запросом, id выборки в Python не загружаются: в пределах категории - по posting lists индекса,
+    развернутым в строки и ограниченным подзапросом id выборки, иначе - по характеристикам товаров выборки.
+
+    :param queryset: отфильтрованный queryset товаров
+    :param category_id: id категории из параметра запроса
+    :return: {характеристика: {значение: количество товаров}}, значения по убыванию количества
+    """
+    if has_category_index(category_id):
+        join, column = POSTING_ROWS[connection.vendor]
+        selection, params = queryset.order_by().values('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT parameter.name, idx.value, COUNT(*) FROM {_table(ParameterValueIndex)} idx {join} '
+                           f'JOIN {_table(Parameter)} parameter ON parameter.id = idx.parameter_id '
+                           f'WHERE idx.category_id = %s AND {column} IN ({selection}) '
+                           f'GROUP BY parameter.name, idx.value', [int(category_id), *params])
+            counts = cursor.fetchall()
+    else:
+        counts = ProductParameter.objects.filter(product__in=queryset.order_by().values('id')).order_by().\
+            values_list('parameter__name', 'value').annotate(count=Count('id'))
+
+    facets = {}
+    for name, value, count in sorted(counts, key=lambda item: (item[0], -item[2], item[1])):
+        if count:
+            facets.setdefault(name, {})[value] = count
+    return facets
@@ -0,0 +1,144 @@
+# метрики загрузки прайса по этапам и пачкам: время выполнения, количество и время запросов к БД, пик памяти
+# tracemalloc. Итоги сохраняются в задаче загрузки (ImportJob.stats), по каждой пачке и по завершении загрузки
+# в лог backend.import пишется строка JSON для дашбордов
+
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('backend.import')
+
+# суммируемые метрики этапа или пачки
+COUNTERS = ('calls', 'time', 'queries', 'query_time')
+
+
+class ImportStats:
+    """
+    Сборщик метрик загрузки. Этапы (stage) суммируются по всем пачкам, вложенный этап учитывается и в охватывающем
+    (время apply включает время записи товаров внутри него). Запросы к БД считает execute_wrapper, установленный
+    на время capture. Пик памяти замеряется, только если tracemalloc запущен (IMPORT_TRACE_MEMORY или внешний замер,
+    например бенчмарк) - трассировка памяти многократно замедляет загрузку.
+    """
+
+    def __init__(self, job_id: int = None, stages: dict = None):
+        """
+        :param job_id: id задачи загрузки для строк лога
+        :param stages: уже собранные метрики этапов (например, этапов запроса PartnerUpdate до постановки в очередь)
+        """
+        self.job_id = job_id
+        self.stages = {name: dict(metrics) for name, metrics in (stages or {}).items()}
+        self.batches = []
+        self._active = []  # метрики выполняющихся этапов и пачек, от внешнего к вложенному
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            for metrics in self._active:
+                metrics['queries'] += 1
+                metrics['query_time'] += duration
+
+    @contextmanager
+    def capture(self):
+        """Подсчет запросов к БД соединения по умолчанию и запуск трассировки памяти при IMPORT_TRACE_MEMORY"""
+        started = settings.IMPORT_TRACE_MEMORY and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            with connection.execute_wrapper(self):
+                yield self
+        finally:
+            if started:
+                tracemalloc.stop()
+
+    @contextmanager
+    def _measure(self):
+        metrics = {'calls': 1, 'time': 0.0, 'queries': 0, 'query_time': 0.0, 'peak_memory_mb': None}
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # пик до начала этапа сохраняется охватывающим этапам, затем сбрасывается для замера этого этапа
+            self._keep_peak(tracemalloc.get_traced_memory()[1] / 2 ** 20)
+            tracemalloc.reset_peak()
+        self._active.append(metrics)
+        start = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            metrics['time'] = time.perf_counter() - start
+            self._active.pop()
+            if tracing:
+                # вложенный этап сбрасывает пик, поэтому его пик передается охватывающим
+                peak = max(tracemalloc.get_traced_memory()[1] / 2 ** 20, metrics.pop('_peak', 0))
+                metrics['peak_memory_mb'] = round(peak, 2)
+                self._keep_peak(peak)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Замер этапа загрузки, метрики суммируются с предыдущими вызовами этапа"""
+        with self._measure() as metrics:
+            yield
+        self._add(name, metrics)
+
+    @contextmanager
+    def batch(self, goods: int):
+        """
+        Замер пачки товаров: метрики пачки добавляются в batches и пишутся в лог
+
+        :param goods: количество товаров прайса в пачке
+        """
+        with self._measure() as metrics:
+            yield
+        del metrics['calls']
+        batch = {'batch': len(self.batches) + 1, 'goods': goods, **self._rounded(metrics)}
+        self.batches.append(batch)
+        self.log('import_batch', **batch)
+
+    def iterate(self, name: str, iterable):
+        """Итератор, время получения каждого элемента которого учитывается в этапе name (разбор прайса)"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def merge(self, stats: dict) -> None:
+        """Добавление метрик, собранных в другой задаче или процессе (результат as_dict)"""
+        for name, metrics in stats['stages'].items():
+            self._add(name, metrics)
+        for batch in stats['batches']:
+            self.batches.append({**batch, 'batch': len(self.batches) + 1})
+
+    def as_dict(self) -> dict:
+        """Метрики этапов и пачек (JSON-сериализуемые)"""
+        return {'stages': {name: self._rounded(metrics) for name, metrics in self.stages.items()},
+                'batches': self.batches}
+
+    def log(self, event: str, **fields) -> None:
+        """Строка лога backend.import в формате JSON"""
+        logger.info(json.dumps({'event': event, 'job_id': self.job_id, **fields}, ensure_ascii=False))
+
+    def _add(self, name: str, metrics: dict) -> None:
+        total = self.stages.setdefault(name, {'calls': 0, 'time': 0.0, 'queries': 0, 'query_time': 0.0,
+                                              'peak_memory_mb': None})
+        for counter in COUNTERS:
+            total[counter] += metrics[counter]
+        if metrics['peak_memory_mb'] is not None:
+            total['peak_memory_mb'] = max(total['peak_memory_mb'] or 0, metrics['peak_memory_mb'])
+
+    def _keep_peak(self, peak: float) -> None:
+        for metrics in self._active:
+            metrics['_peak'] = max(metrics.get('_peak', 0), peak)
+
+    @staticmethod
+    def _rounded(metrics: dict) -> dict:
+        return {key: round(value, 4) if isinstance(value, float) else value for key, value in metrics.items()}
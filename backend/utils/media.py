@@ -1,6 +1,7 @@
 # переменные и вспомогательные функции для работы с изображениями
 
 import uuid
+from django.core.cache import cache
 from django.template.defaultfilters import slugify as django_slugify
 
 
@@ -39,6 +40,31 @@ def upload_icon_location(instance, filename: str) -> str:
     return f'images/{new_filename}/{uuid.uuid4()}.{extension}'
 
 
+# время хранения ссылок на миниатюры в кеше, сек
+spec_url_timeout = 60 * 60 * 24 * 7
+
+
+def get_spec_urls(specs) -> dict:
+    """Ссылки на миниатюры imagekit (photo_small/photo_large) изображений товаров. Ссылки кешируются по имени
+    исходного файла, поэтому при повторных запросах imagekit не вычисляет имя миниатюры и не проверяет ее наличие
+    в хранилище. Ссылки всех изображений сериализации читаются из кеша одним get_many, недостающие записываются
+    одним set_many
+
+    :param specs: итерируемый набор пар (объект модели ProductInfoPhoto, наименование ImageSpecField)
+    :return: словарь {(имя исходного файла, наименование ImageSpecField): ссылка}
+    """
+
+    keys = {f'spec_url:{spec}:{photo.photo.name}': (photo, spec) for photo, spec in specs}
+    if not keys:
+        return {}
+    urls = cache.get_many(keys)
+    missing = {key: getattr(photo, spec).url for key, (photo, spec) in keys.items() if key not in urls}
+    if missing:
+        cache.set_many(missing, spec_url_timeout)
+        urls.update(missing)
+    return {(photo.photo.name, spec): urls[key] for key, (photo, spec) in keys.items()}
+
+
 # заглушка вывода основного изображения товара, путь
 default_photo_large = '/media/images/phone_default_large.png'
 
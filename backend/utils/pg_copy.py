@@ -0,0 +1,67 @@
+# загрузка пачек товаров прайса в PostgreSQL через COPY FROM STDIN: строки потоком передаются во временную
+# таблицу и одним INSERT ... SELECT ... ON CONFLICT переносятся в таблицу модели. Включается настройкой
+# IMPORT_COPY, на остальных БД (SQLite) загрузка выполняется через bulk_create
+
+from io import StringIO
+
+from django.conf import settings
+from django.db import connection
+
+# экранирование специальных символов текстового формата COPY
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def copy_available() -> bool:
+    """Загрузка через COPY включена и БД по умолчанию - PostgreSQL"""
+    return settings.IMPORT_COPY and connection.vendor == 'postgresql'
+
+
+def copy_value(value) -> str:
+    """
+    Значение поля в текстовом формате COPY
+
+    :param value: значение, подготовленное для записи в БД (get_db_prep_save)
+    :return: строка, NULL - \\N
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).translate(COPY_ESCAPES)
+
+
+def copy_upsert(model, objs: list, unique_fields: list[str], update_fields: list[str]) -> None:
+    """
+    Upsert объектов модели через COPY: все поля объектов, кроме первичного ключа, копируются во временную таблицу
+    с теми же столбцами (удаляется при завершении транзакции), затем переносятся в таблицу модели одним
+    INSERT ... ON CONFLICT (unique_fields) DO UPDATE SET update_fields. Эквивалент
+    bulk_create(objs, update_conflicts=True, unique_fields=..., update_fields=...) без передачи значений
+    параметрами запроса.
+
+    :param model: модель
+    :param objs: объекты модели без id
+    :param unique_fields: имена столбцов уникального ключа
+    :param update_fields: имена столбцов, перезаписываемых у существующих строк
+    """
+    if not objs:
+        return
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    buffer = StringIO()
+    for obj in objs:
+        buffer.write('\t'.join(copy_value(field.get_db_prep_save(getattr(obj, field.attname), connection))
+                               for field in fields))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    quote = connection.ops.quote_name
+    table, temp_table = quote(model._meta.db_table), f'pg_temp.{quote("copy_" + model._meta.db_table)}'
+    columns = ', '.join(quote(field.column) for field in fields)
+    updates = ', '.join(f'{quote(column)} = EXCLUDED.{quote(column)}' for column in update_fields)
+    with connection.cursor() as cursor:
+        # временная таблица пересоздается: несколько пачек могут записываться в одной транзакции
+        cursor.execute(f'DROP TABLE IF EXISTS {temp_table}')
+        cursor.execute(f'CREATE TEMPORARY TABLE {temp_table} ON COMMIT DROP AS '
+                       f'SELECT {columns} FROM {table} WITH NO DATA')
+        cursor.copy_expert(f'COPY {temp_table} ({columns}) FROM STDIN', buffer)
+        cursor.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {temp_table} '
+                       f'ON CONFLICT ({", ".join(map(quote, unique_fields))}) DO UPDATE SET {updates}')
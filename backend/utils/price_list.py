@@ -0,0 +1,439 @@
+# потоковое чтение прайсов партнеров (yaml, csv, jsonl): товары разбираются по одному, без загрузки всего
+# документа в память
+
+import codecs
+import csv
+import io
+import itertools
+import json
+
+import yaml
+
+# форматы прайсов, определяемые по расширению файла
+PRICE_LIST_FORMATS = ('yaml', 'csv', 'jsonl')
+
+# C-парсер libyaml при наличии, иначе однопроходный разбор диалекта shop_post.yaml (iter_yaml_items): чистый
+# Python-парсер yaml.SafeLoader на порядок медленнее
+PriceListLoader = getattr(yaml, 'CSafeLoader', None)
+
+# разделы yaml-прайса верхнего уровня, содержащие списки категорий и товаров
+YAML_LIST_SECTIONS = ('categories', 'goods')
+# поля товара, значение которых может занимать несколько строк (description) или быть блоком пар "ключ: значение"
+YAML_BLOCK_FIELDS = ('description', 'parameters')
+# загрузчик без потока: распознавание типа и построение значений скаляров по правилам yaml.safe_load
+SCALAR_LOADER = yaml.SafeLoader('')
+
+# колонки csv-прайса: магазин и название категории повторяются в строках товаров, каждая характеристика -
+# отдельная колонка с префиксом CSV_PARAMETER_PREFIX
+CSV_FIELDS = ('shop', 'category', 'category_name', 'id', 'model', 'name', 'price', 'price_rrc', 'quantity',
+              'description')
+CSV_PARAMETER_PREFIX = 'parameter:'
+# строк csv-прайса, просматриваемых в поиске магазина при чтении заголовка без категорий (запрос загрузки)
+CSV_HEADER_ROWS = 100
+
+
+class PriceListError(ValueError):
+    """Некорректная структура прайса"""
+
+
+def _compose_node(loader, anchors: dict) -> yaml.Node:
+    """
+    Сборка узла yaml из событий парсера (аналог Composer.compose_node, недоступного у C-парсера)
+
+    :param loader: загрузчик PriceListLoader, следующее событие которого - начало узла
+    :param anchors: узлы с якорями (&anchor), на которые могут ссылаться следующие узлы документа
+    :return: узел для loader.construct_document
+    """
+    event = loader.get_event()
+    if isinstance(event, yaml.AliasEvent):
+        if event.anchor not in anchors:
+            raise PriceListError(f'Ссылка на неизвестный якорь yaml: *{event.anchor}')
+        return anchors[event.anchor]
+
+    if isinstance(event, yaml.ScalarEvent):
+        tag = event.tag if event.tag not in (None, '!') else \
+            loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        tag = event.tag if event.tag not in (None, '!') else loader.resolve(yaml.SequenceNode, None, event.implicit)
+        node = yaml.SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        while not loader.check_event(yaml.SequenceEndEvent):
+            node.value.append(_compose_node(loader, anchors))
+        node.end_mark = loader.get_event().end_mark
+    else:
+        tag = event.tag if event.tag not in (None, '!') else loader.resolve(yaml.MappingNode, None, event.implicit)
+        node = yaml.MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        while not loader.check_event(yaml.MappingEndEvent):
+            node.value.append((_compose_node(loader, anchors), _compose_node(loader, anchors)))
+        node.end_mark = loader.get_event().end_mark
+
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    return node
+
+
+def _load_node(loader, anchors: dict):
+    """Чтение следующего узла в объект Python"""
+    return loader.construct_document(_compose_node(loader, anchors))
+
+
+def _skip_node(loader) -> None:
+    """Пропуск следующего узла без построения объектов (якоря пропущенных узлов недоступны для ссылок)"""
+    depth = 0
+    while True:
+        event = loader.get_event()
+        if isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.SequenceEndEvent, yaml.MappingEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
+
+
+def _iter_sections(loader, anchors: dict):
+    """
+    Обход разделов верхнего уровня прайса (shop, categories, goods)
+
+    :return: генератор названий разделов; перед следующей итерацией значение раздела должно быть прочитано
+    или пропущено
+    """
+    loader.get_event()  # StreamStart
+    if loader.check_event(yaml.StreamEndEvent):
+        return
+    loader.get_event()  # DocumentStart
+    if not loader.check_event(yaml.MappingStartEvent):
+        raise PriceListError('Прайс должен содержать разделы shop, categories и goods')
+    loader.get_event()
+    while not loader.check_event(yaml.MappingEndEvent):
+        yield _load_node(loader, anchors)
+
+
+def _read_yaml_header(file) -> dict:
+    """Заголовок yaml-прайса: товары пропускаются без разбора, чтение прекращается на найденных магазине и категориях"""
+    header = {}
+    if PriceListLoader is None:
+        for section, value in iter_yaml_items(file):
+            if section == 'shop':
+                header[section] = value
+            elif section == 'categories' and value is None:  # раздел без элементов - None, как у C-парсера
+                header[section] = None
+            elif section == 'categories':
+                header[section] = header[section] or []
+                header[section].append(value)
+            elif len(header) == 2:
+                break
+        return header
+
+    anchors = {}
+    loader = PriceListLoader(file)
+    try:
+        for section in _iter_sections(loader, anchors):
+            if section in ('shop', 'categories'):
+                header[section] = _load_node(loader, anchors)
+                if len(header) == 2:
+                    break
+            else:
+                _skip_node(loader)
+    finally:
+        loader.dispose()
+    return header
+
+
+def _iter_yaml_goods(file):
+    """Товары yaml-прайса, собираемые по одному из событий парсера"""
+    if PriceListLoader is None:
+        yield from (value for section, value in iter_yaml_items(file) if section == 'goods' and value is not None)
+        return
+
+    anchors = {}
+    loader = PriceListLoader(file)
+    try:
+        for section in _iter_sections(loader, anchors):
+            if section != 'goods':
+                _skip_node(loader)
+                continue
+            if loader.check_event(yaml.ScalarEvent):  # пустой раздел goods
+                _skip_node(loader)
+                continue
+            if not loader.check_event(yaml.SequenceStartEvent):
+                raise PriceListError('Раздел goods должен быть списком товаров')
+            loader.get_event()
+            while not loader.check_event(yaml.SequenceEndEvent):
+                yield _load_node(loader, anchors)
+            loader.get_event()
+    finally:
+        loader.dispose()
+
+
+def _strip_comment(row: str) -> str:
+    """Строка yaml без комментария: '#' в начале строки или после пробела, вне кавычек"""
+    if '#' not in row:
+        return row
+    quote, i = None, 0
+    while i < len(row):
+        char = row[i]
+        if quote:
+            if char == '\\' and quote == '"' or row[i:i + 2] == "''" and quote == "'":  # escape и '' внутри кавычек
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in '"\'' and (i == 0 or row[i - 1] in ' \t:-'):
+            quote = char
+        elif char == '#' and (i == 0 or row[i - 1] in ' \t'):
+            return row[:i].rstrip()
+        i += 1
+    return row
+
+
+def _partition_key(row: str) -> tuple[str, str]:
+    """Ключ и значение строки 'ключ: значение', ключ может быть в кавычках и содержать ':'"""
+    if row[:1] in '"\'':
+        end = row.find(row[0], 1)
+        while row[0] == "'" and end != -1 and row[end + 1:end + 2] == "'":  # '' внутри одинарных кавычек
+            end = row.find("'", end + 2)
+        if end != -1:
+            _, _, value = row[end + 1:].partition(':')
+            return row[:end + 1], value
+    key, _, value = row.partition(':')
+    return key, value
+
+
+def _scalar(value: str):
+    """Значение поля: в кавычках - строка, без кавычек - как у yaml.safe_load (int, float, bool, None, дата, строка)"""
+    value = value.strip()
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+        if value[0] == "'":
+            return value[1:-1].replace("''", "'")
+        # escape-последовательности в двойных кавычках разбирает yaml
+        return value[1:-1] if '\\' not in value else yaml.load(value, Loader=yaml.SafeLoader)
+    if value.isascii() and value.isdigit() and (value[0] != '0' or value == '0'):  # частый случай без регулярок
+        return int(value)
+    tag = SCALAR_LOADER.resolve(yaml.ScalarNode, value, (True, False))
+    return SCALAR_LOADER.yaml_constructors[tag](SCALAR_LOADER, yaml.ScalarNode(tag, value))
+
+
+def iter_yaml_items(file):
+    """
+    Однопроходный разбор yaml-прайса в формате shop_post.yaml без libyaml (без якорей, flow-стиля и многострочных
+    скаляров |/>): строка относится к разделу верхнего уровня (shop, categories, goods), новому элементу списка
+    ("- id: ..."), полю текущего элемента или - по отступу - к продолжению многострочного description или блоку
+    parameters текущего товара. Комментарии вне кавычек отбрасываются, значения без кавычек приводятся к типам,
+    как в yaml.safe_load. Время разбора линейно от размера файла.
+
+    :param file: файл прайса (файловый объект, открытый в двоичном режиме, или итератор строк)
+    :return: генератор пар (раздел, значение): ('shop', магазин), (раздел списка, None) в начале раздела
+    categories/goods, затем (раздел списка, элемент) - элемент отдается, когда прочитан целиком
+    """
+    section = None  # текущий раздел верхнего уровня
+    item = None  # текущая категория/товар
+    block, block_indent = None, 0  # многострочное поле текущего товара и отступ его ключа
+    description = ''  # текст многострочного описания текущего товара
+
+    for line in file:
+        line = line.decode('utf-8') if isinstance(line, bytes) else line
+        row = _strip_comment(line.lstrip()).rstrip()
+        if not row:
+            continue
+        indent = len(line) - len(line.lstrip())
+
+        # строки глубже ключа многострочного поля - продолжение описания или характеристики
+        if block and indent > block_indent:
+            if block == 'description':  # многострочное значение - строка, как у yaml.safe_load
+                description = item['description'] = f'{description} {row}'.strip()
+            else:
+                name, value = _partition_key(row)
+                item['parameters'][_scalar(name)] = _scalar(value)
+            continue
+        block = None
+
+        if indent == 0:
+            if item is not None:
+                yield section, item
+            item = None
+            section, value = _partition_key(row)
+            if section == 'shop':
+                yield section, _scalar(value)
+            elif section in YAML_LIST_SECTIONS:
+                yield section, None
+            continue
+        if section not in YAML_LIST_SECTIONS:
+            continue
+
+        if row[:2] == '- ':  # новый элемент списка, в той же строке - его первое поле
+            if item is not None:
+                yield section, item
+            item = {}
+            field = row[2:].lstrip()
+            indent += len(row) - len(field)
+            row = field
+        if item is None:
+            continue
+
+        key, value = _partition_key(row)
+        key = _scalar(key)
+        if section == 'goods' and key in YAML_BLOCK_FIELDS:
+            block, block_indent = key, indent
+            item[key] = {} if key == 'parameters' else _scalar(value)
+            description = value.strip()
+        else:
+            item[key] = _scalar(value)
+
+    if item is not None:
+        yield section, item
+
+
+def _iter_lines(file):
+    """Строки файла, открытого в двоичном режиме, декодированные из utf-8 (BOM в начале файла пропускается)"""
+    try:
+        yield from codecs.iterdecode(file, 'utf-8-sig')
+    except UnicodeDecodeError as error:
+        raise PriceListError(f'Прайс должен быть в кодировке utf-8: {error}') from error
+
+
+def _iter_csv_rows(file):
+    """Строки csv-прайса в виде словарей колонка -> значение"""
+    reader = csv.DictReader(_iter_lines(file))
+    try:
+        yield from reader
+    except csv.Error as error:
+        raise PriceListError(f'Некорректный csv, строка {reader.line_num}: {error}') from error
+
+
+def _read_csv_header(file) -> dict:
+    """Заголовок csv-прайса: магазин из первой строки, где он указан, и категории товаров с названиями"""
+    shop, categories = None, {}
+    for row in _iter_csv_rows(file):
+        shop = shop or row.get('shop') or None
+        category_id, name = row.get('category'), row.get('category_name')
+        if category_id and name and category_id not in categories:
+            categories[category_id] = name
+    header = {'shop': shop} if shop else {}
+    if categories:
+        header['categories'] = [{'id': int(category_id) if category_id.isdigit() else category_id, 'name': name}
+                                for category_id, name in categories.items()]
+    return header
+
+
+def _read_csv_shop(file) -> dict:
+    """Магазин csv-прайса из первой строки, где он указан, среди первых CSV_HEADER_ROWS строк; категории не читаются"""
+    for row in itertools.islice(_iter_csv_rows(file), CSV_HEADER_ROWS):
+        if row.get('shop'):
+            return {'shop': row['shop']}
+    return {}
+
+
+def _iter_csv_goods(file):
+    """Товары csv-прайса: пустые ячейки пропускаются, колонки parameter:<название> собираются в характеристики"""
+    for row in _iter_csv_rows(file):
+        good = {'parameters': {}}
+        for column, value in row.items():
+            if column is None or value in (None, ''):  # лишние ячейки строки и незаполненные поля
+                continue
+            if column.startswith(CSV_PARAMETER_PREFIX):
+                good['parameters'][column[len(CSV_PARAMETER_PREFIX):]] = value
+            elif column not in ('shop', 'category_name'):
+                good[column] = value
+        yield good
+
+
+def _iter_jsonl_objects(file):
+    """Объекты JSON Lines: по одному JSON-объекту в строке, пустые строки пропускаются"""
+    for number, line in enumerate(_iter_lines(file), 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            raise PriceListError(f'Некорректный JSON в строке {number}: {error}') from error
+
+
+def _read_jsonl_header(file) -> dict:
+    """Заголовок jsonl-прайса - первая строка с магазином и категориями"""
+    header = next(_iter_jsonl_objects(file), None)
+    if not isinstance(header, dict) or not {'shop', 'categories'} & header.keys():
+        raise PriceListError('Первая строка jsonl-прайса должна содержать shop и categories')
+    return {key: header[key] for key in ('shop', 'categories') if key in header}
+
+
+def _iter_jsonl_goods(file):
+    """Товары jsonl-прайса - строки после заголовка"""
+    objects = _iter_jsonl_objects(file)
+    next(objects, None)
+    yield from objects
+
+
+_READERS = {
+    'yaml': (_read_yaml_header, _iter_yaml_goods),
+    'csv': (_read_csv_header, _iter_csv_goods),
+    'jsonl': (_read_jsonl_header, _iter_jsonl_goods),
+}
+
+
+def get_price_list_format(file_name: str) -> str | None:
+    """
+    Формат прайса по расширению файла
+
+    :param file_name: имя файла прайса
+    :return: формат из PRICE_LIST_FORMATS или None для неподдерживаемого файла
+    """
+    extension = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else None
+    return extension if extension in PRICE_LIST_FORMATS else None
+
+
+def read_price_list_header(file, price_format: str = 'yaml', categories: bool = True) -> dict:
+    """
+    Чтение заголовка прайса: магазин и категории. Товары yaml и jsonl не разбираются, в csv магазин и категории
+    указываются в строках товаров, поэтому для категорий файл читается целиком, но без сбора товаров в память
+
+    :param file: файл прайса (файловый объект, открытый в двоичном режиме)
+    :param price_format: формат прайса из PRICE_LIST_FORMATS
+    :param categories: False - заголовок для запроса загрузки: категории csv не собираются (их создает воркер
+    перед загрузкой товаров), магазин ищется в первых CSV_HEADER_ROWS строках; yaml и jsonl читаются как обычно
+    :return: словарь с ключами 'shop' и 'categories' (при наличии в прайсе)
+    """
+    if price_format == 'csv' and not categories:
+        return _read_csv_shop(file)
+    return _READERS[price_format][0](file)
+
+
+def iter_price_list_goods(file, price_format: str = 'yaml'):
+    """
+    Потоковое чтение товаров прайса: в памяти одновременно находится только разбираемый товар
+
+    :param file: файл прайса (файловый объект, открытый в двоичном режиме)
+    :param price_format: формат прайса из PRICE_LIST_FORMATS
+    :return: генератор словарей с данными товаров
+    """
+    return _READERS[price_format][1](file)
+
+
+def dump_price_list(data: dict, price_format: str = 'yaml') -> bytes:
+    """
+    Запись прайса в формате, который читают read_price_list_header и iter_price_list_goods
+
+    :param data: прайс - словарь с ключами shop, categories и goods
+    :param price_format: формат прайса из PRICE_LIST_FORMATS
+    :return: содержимое файла в utf-8
+    """
+    if price_format == 'yaml':
+        return yaml.dump(data, allow_unicode=True, sort_keys=False).encode('utf-8')
+
+    goods = data.get('goods') or []
+    if price_format == 'jsonl':
+        header = {key: data[key] for key in ('shop', 'categories') if key in data}
+        lines = [json.dumps(item, ensure_ascii=False) for item in (header, *goods)]
+        return '\n'.join(lines).encode('utf-8') + b'\n'
+
+    category_names = {category['id']: category['name'] for category in data.get('categories') or []}
+    parameters = list(dict.fromkeys(name for good in goods for name in good.get('parameters') or {}))
+    rows = [{
+        **{field: good.get(field) for field in CSV_FIELDS if field in good},
+        'shop': data.get('shop'),
+        'category_name': category_names.get(good.get('category')),
+        **{f'{CSV_PARAMETER_PREFIX}{name}': value for name, value in (good.get('parameters') or {}).items()},
+    } for good in goods]
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=[*CSV_FIELDS, *(f'{CSV_PARAMETER_PREFIX}{name}' for name in parameters)])
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue().encode('utf-8')
@@ -0,0 +1,59 @@
+# поисковый индекс каталога товаров: документ на каждый ProductInfo и его инкрементальное обновление
+
+from collections import defaultdict
+
+from backend.models import ProductInfo, ProductParameter
+
+# размер пачки товаров при пересчете документов
+SEARCH_UPDATE_BATCH = 500
+
+# конфигурация полнотекстового поиска Postgres (стемминг русского языка)
+SEARCH_CONFIG = 'russian'
+
+
+def join_search_document(parts) -> str:
+    """
+    Сборка поискового документа из частей: название продукта, модель, названия и значения характеристик.
+    Документ хранится в нижнем регистре, чтобы fallback-поиск без Postgres не зависел от регистра кириллицы.
+
+    :param parts: части документа, пустые пропускаются
+    :return: текст поискового документа
+    """
+    return ' '.join(str(part) for part in parts if part).lower()
+
+
+def build_search_document(product_info: ProductInfo) -> str:
+    """
+    Формирование поискового документа товара
+
+    :param product_info: товар на складе с подгруженными product и product_parameters__parameter
+    :return: текст поискового документа
+    """
+    parts = [product_info.product.name, product_info.model]
+    for item in product_info.product_parameters.all():
+        parts.append(item.parameter.name)
+        parts.append(item.value)
+    return join_search_document(parts)
+
+
+def update_search_documents(product_info_ids) -> int:
+    """
+    Пересчет поисковых документов для указанных товаров пачками через bulk_update.
+    Части документов выбираются через values_list, без создания объектов характеристик и продуктов.
+
+    :param product_info_ids: id товаров ProductInfo (список, множество или values_list queryset)
+    :return: количество обновленных документов
+    """
+    product_info_ids = list(product_info_ids)
+    updated = 0
+    for start in range(0, len(product_info_ids), SEARCH_UPDATE_BATCH):
+        batch = product_info_ids[start:start + SEARCH_UPDATE_BATCH]
+        parameters = defaultdict(list)
+        for product_id, name, value in ProductParameter.objects.filter(product_id__in=batch).order_by('id').\
+                values_list('product_id', 'parameter__name', 'value'):
+            parameters[product_id].extend((name, value))
+        goods = [ProductInfo(id=pk, search_document=join_search_document([name, model, *parameters[pk]]))
+                 for pk, name, model in ProductInfo.objects.filter(id__in=batch).
+                 values_list('id', 'product__name', 'model')]
+        updated += ProductInfo.objects.bulk_update(goods, ['search_document'])
+    return updated
@@ -0,0 +1,56 @@
+# журнал движения остатков товаров: поставки, установка остатков прайсом и ручные корректировки записываются
+# строками StockMovement, а ProductInfo.quantity изменяется атомарным UPDATE quantity = quantity + изменение
+# без чтения текущего остатка, поэтому параллельные поставки одного товара не теряют единицы
+
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery
+
+from backend.models import ProductInfo, StockMovement
+
+
+def record_movements(changes: dict, kind: str) -> list:
+    """
+    Запись движений остатков в журнал одним bulk_create без изменения ProductInfo.quantity (остаток уже записан,
+    например, установлен POST-прайсом)
+
+    :param changes: словарь id товара ProductInfo -> изменение остатка
+    :param kind: вид движения (STOCK_MOVEMENT_KIND_CHOICES)
+    :return: записанные движения (с id на БД, возвращающих их из bulk_create)
+    """
+    return StockMovement.objects.bulk_create([
+        StockMovement(product_info_id=pk, kind=kind, quantity=quantity)
+        for pk, quantity in changes.items() if quantity])
+
+
+def add_stock(changes: dict, kind: str) -> None:
+    """
+    Запись движений остатков в журнал и изменение остатков товаров одним UPDATE
+    quantity = quantity + (изменение из записанного движения товара): текущий остаток не читается, параллельные
+    изменения суммируются базой данных. На БД, не возвращающих id из bulk_create, выполняется UPDATE на каждое
+    различное значение изменения.
+
+    :param changes: словарь id товара ProductInfo -> изменение остатка
+    :param kind: вид движения (STOCK_MOVEMENT_KIND_CHOICES)
+    """
+    changes = {pk: quantity for pk, quantity in changes.items() if quantity}
+    if not changes:
+        return
+    with transaction.atomic():
+        movements = record_movements(changes, kind)
+        if connection.features.can_return_rows_from_bulk_insert:
+            # у товара одно движение в changes; диапазон id записанных движений позволяет искать движение по индексу
+            # товара, а не перебирать список id для каждой строки
+            ids = [movement.id for movement in movements]
+            movement = StockMovement.objects.filter(id__range=(min(ids), max(ids)), id__in=ids,
+                                                    product_info=OuterRef('pk'))
+            ProductInfo.objects.filter(id__in=changes.keys()).\
+                update(quantity=F('quantity') + Subquery(movement.values('quantity')[:1]))
+            return
+        by_quantity = defaultdict(list)
+        for pk, quantity in changes.items():
+            by_quantity[quantity].append(pk)
+        for quantity, pks in by_quantity.items():
+            ProductInfo.objects.filter(id__in=pks).update(quantity=F('quantity') + quantity)
+
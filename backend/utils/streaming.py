@@ -0,0 +1,69 @@
+# потоковая отдача больших списков в JSON без построения всего serializer.data в памяти
+
+import json
+from distutils.util import strtobool
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+# количество объектов, выбираемых из БД (и подгружаемых prefetch_related) за один раз
+STREAM_CHUNK_SIZE = 500
+
+
+def is_stream_requested(request) -> bool:
+    """
+    Проверка, запрошена ли потоковая отдача списка параметром запроса 'stream'
+
+    :param request: объект запроса
+    :return: True при stream=true/1/yes
+    """
+    try:
+        return bool(strtobool(request.query_params.get('stream', 'false')))
+    except ValueError:
+        return False
+
+
+def iter_json_list(queryset, serializer_class, context: dict = None, chunk_size: int = None):
+    """
+    Генератор JSON-массива: объекты выбираются из БД пачками через iterator(chunk_size) (prefetch_related
+    выполняется на каждую пачку), каждая пачка сериализуется одним сериализатором many=True и отдается целиком,
+    поэтому в памяти находится не более chunk_size объектов независимо от размера выборки
+
+    :param queryset: queryset объектов списка
+    :param serializer_class: сериализатор одного объекта
+    :param context: контекст сериализатора
+    :param chunk_size: размер пачки, по умолчанию STREAM_CHUNK_SIZE
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+
+    def dump(instances: list) -> str:
+        """Объекты пачки в JSON без скобок массива"""
+        return json.dumps(serializer_class(instances, many=True, context=context).data, cls=JSONEncoder,
+                          ensure_ascii=False, separators=(',', ':'))[1:-1]
+
+    yield '['
+    chunk = []
+    first = True
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(instance)
+        if len(chunk) == chunk_size:
+            yield ('' if first else ',') + dump(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield ('' if first else ',') + dump(chunk)
+    yield ']'
+
+
+def streaming_json_response(queryset, serializer_class, context: dict = None,
+                            chunk_size: int = None) -> StreamingHttpResponse:
+    """
+    Потоковый ответ со списком объектов в JSON
+
+    :param queryset: queryset объектов списка
+    :param serializer_class: сериализатор одного объекта
+    :param context: контекст сериализатора
+    :param chunk_size: размер пачки, по умолчанию STREAM_CHUNK_SIZE
+    """
+    return StreamingHttpResponse(iter_json_list(queryset, serializer_class, context, chunk_size),
+                                 content_type='application/json')
@@ -7,6 +7,7 @@ import oauth2_provider.models
 import yaml
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.shortcuts import redirect
+from django.urls import reverse
 from django_rest_passwordreset.views import ResetPasswordRequestToken, ResetPasswordConfirm
 from distutils.util import strtobool
 from django.contrib.auth.password_validation import validate_password
@@ -16,7 +17,7 @@ from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import api_view
-from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -27,13 +28,14 @@ import sentry_sdk
 
 import backend.models
 from backend.models import Order, Shop, OrderItem, ProductInfo, Category, Contact, ConfirmEmailToken, Address, \
-    RatingProduct, User, ProductInfoPhoto
+    RatingProduct, User, ProductInfoPhoto, Product, ImportJob
 from shop_site import settings
-from .filters import ProductsFilter, query_filter_maker
+from .filters import ProductsFilter, ProductSearchFilter, query_filter_maker
+from .pagination import ProductCursorPagination
 from .serializers import ShopSerializer, OrderCustomerSerializer, ProductParameterSerializer, CategorySerializer, \
     OrderPartnerSerializer, ContactSerializer, BasketSerializer, OrderItemCreateSerializer, UserSerializer, \
     UserBuyerSerializer, AddressSerializer, ProductInfoDetailSerializer, OrderDetailSerializer, ReviewSerializer, \
-    ShopProductPhotoSerializer, ProductPhotoSerializer
+    ShopProductPhotoSerializer, ProductPhotoSerializer, ProductCompareSerializer, ImportJobSerializer
 from shop_site.yasg import OrderPostSerializer, BasketDeleteSerializer, BasketPostSerializer, \
     manual_parameters_orderview_get, manual_parameters_orderpartner_get, PartnerOrderPostSerializer, \
     PartnerStatePostSerializer, PartnerUpdatePostSerializer, manual_parameters_partnerupdate, \
@@ -41,12 +43,19 @@ from shop_site.yasg import OrderPostSerializer, BasketDeleteSerializer, BasketPo
     AccountCreateSerializer, ConfirmAccountSerializer, LoginAccountSerializer, RateProductSerializer, \
     CreateReportSerializer, manual_parameters_avatar_thumbnail, AccountPatchSerializer, manual_parameters_good_images, \
     CreateProductImageSerializer, manual_parameters_product_photo, PatchProductImageSerializer, \
-    DeleteProductImageSerializer, exclude_from_swagger
+    DeleteProductImageSerializer, exclude_from_swagger, manual_parameters_products_get, \
+    manual_parameters_product_detail_get
 from .signals import new_account_registered, new_order_state, new_order_created
 from .utils.error_text import Error, ValidateError
 from .utils import reg_patterns, media
-from .utils.get_data_from_yaml import create_categories, get_data_from_all_tasks
-from .tasks import task_load_good_from_yaml
+from .utils.get_data_from_yaml import create_categories
+from .utils.bulk_import import validate_price_list
+from .utils.price_list import read_price_list_header, get_price_list_format, PriceListError
+from .utils.import_stats import ImportStats
+from .utils.facets import get_parameter_facets
+from .utils.cache import VersionedCacheMixin, bump_cache_version, CATEGORIES_CACHE, SHOPS_CACHE
+from .utils.streaming import is_stream_requested, streaming_json_response
+from .tasks import task_import_price_list
 from .task_backup_report import backup_shop_base, send_report_task
 
 
@@ -382,25 +391,27 @@ class AccountDetails(APIView):
 
 
 # noinspection PyUnresolvedReferences
-class CategoryView(ListAPIView):
+class CategoryView(VersionedCacheMixin, ListAPIView):
     """
     Класс для просмотра категорий товара.
 
-    Все категории.
+    Все категории. Ответ кешируется до изменения категорий, поддерживается If-None-Match (ETag).
     """
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_name = CATEGORIES_CACHE
 
 
 # noinspection PyUnresolvedReferences
-class ShopView(ListAPIView):
+class ShopView(VersionedCacheMixin, ListAPIView):
     """
     Класс для просмотра магазинов, принимающих заказы.
 
-    Без детализации.
+    Без детализации. Ответ кешируется до изменения магазинов, поддерживается If-None-Match (ETag).
     """
     queryset = Shop.objects.filter(state=True)
     serializer_class = ShopSerializer
+    cache_name = SHOPS_CACHE
 
 
 # noinspection PyUnresolvedReferences
@@ -416,27 +427,64 @@ class ProductInfoView(ListAPIView):
     'price_less' фильтр по цене меньше или равно
     'category_id' фильтр по id категории продуктов
     'category' фильтр по названию категории продуктов (без учета регистра, по частичному совпадению)
+    'param' фильтр по характеристике товара в формате 'характеристика:значение', можно указать несколько раз
+    (значения одной характеристики - по ИЛИ, разные характеристики - по И)
+    'best_offer' при best_offer=true выводится только самое дешевое предложение в наличии по каждому продукту
 
-    'search' поиск по названию продукта, модели, наименованию параметра (без учета регистра, по частичному совпадению)
+    'search' полнотекстовый поиск по названию продукта, модели, наименованиям и значениям параметров (по началу слов,
+    без учета регистра, с учетом опечаток), без 'ordering' выдача сортируется по релевантности
 
     Параметры сортировки:
 
     'ordering' сортировка по цене, названию продуктов
-    (price, -price, product, -product)
+    (price, -price, product, -product), по умолчанию по возрастанию цены
+
+    Пагинация курсорная (keyset), ссылки на соседние страницы возвращаются в 'next' и 'previous':
+
+    'cursor' курсор страницы из ссылки next/previous
+    'page_size' количество товаров на странице (по умолчанию 50, не более 200)
+
+    В 'facets' возвращается количество товаров выборки по каждому значению каждой характеристики.
+
+    'fields' выводимые поля товара через запятую, 'exclude' исключаемые поля товара через запятую
+
+    'stream' при stream=true вся выборка без пагинации и фасетов отдается потоковым JSON-массивом
     """
     # queryset = ProductInfo.objects.filter(shop__state=True).\
     #     select_related('shop', 'product__category').\
     #     prefetch_related('product_parameters__parameter')
-    queryset = ProductInfo.objects.filter(shop__state=True).select_related('shop', 'product__category').\
-        prefetch_related(Prefetch('ratings', queryset=RatingProduct.objects.select_related('user')), 'photos')
+    # рейтинг берется из сохраненных агрегатов rating_count/rating_sum, иконка - из ссылки main_photo,
+    # связи подгружаются только для выводимых полей (get_queryset)
+    queryset = ProductInfo.objects.filter(shop__state=True)
     serializer_class = ProductParameterSerializer
+    pagination_class = ProductCursorPagination
 
     # фильтрация + сортировка
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
     filterset_class = ProductsFilter
-    search_fields = ['product__name', 'model', 'product_parameters__parameter__name']
     ordering_fields = ['price', 'product']
 
+    def get_queryset(self):
+        select, prefetch = self.get_serializer_class().get_related(self.request)
+        return super().get_queryset().select_related(*select).prefetch_related(*prefetch)
+
+    @swagger_auto_schema(manual_parameters=manual_parameters_products_get)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if is_stream_requested(request):
+            ordering = self.paginator.get_ordering(request, queryset, self)
+            return streaming_json_response(queryset.order_by(*ordering), self.get_serializer_class(),
+                                           self.get_serializer_context())
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        response.data['facets'] = get_parameter_facets(queryset, request.query_params.get('category_id'))
+        return response
+
 
 # noinspection PyUnresolvedReferences
 class ProductInfoDetailView(RetrieveAPIView):
@@ -444,11 +492,38 @@ class ProductInfoDetailView(RetrieveAPIView):
     Класс для просмотра детальной информации по конкретному товару в магазине.
 
     Детализация с расчетом рейтинга и отзывами.
+
+    'fields' выводимые поля через запятую, 'exclude' исключаемые поля через запятую
     """
-    queryset = ProductInfo.objects.all().select_related('product', 'shop').\
-        prefetch_related('product_parameters__parameter', 'ratings__user', 'photos')
+    queryset = ProductInfo.objects.all()
     serializer_class = ProductInfoDetailSerializer
 
+    def get_queryset(self):
+        # связи подгружаются только для выводимых полей
+        select, prefetch = self.get_serializer_class().get_related(self.request)
+        return super().get_queryset().select_related(*select).prefetch_related(*prefetch)
+
+    @swagger_auto_schema(manual_parameters=manual_parameters_product_detail_get)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+# noinspection PyUnresolvedReferences
+class ProductCompareView(RetrieveAPIView):
+    """
+    Класс для сравнения цен продукта в разных магазинах.
+
+    Минимальная/максимальная цена, количество предложений и магазинов берутся из агрегата предложений продукта,
+    предложения (товары в наличии в магазинах, принимающих заказы) выводятся по возрастанию цены.
+    """
+    queryset = Product.objects.select_related('category').prefetch_related(
+        Prefetch('product_info',
+                 queryset=ProductInfo.objects.filter(shop__state=True, quantity__gt=0).select_related('shop').
+                 order_by('price', 'id'),
+                 to_attr='offers'))
+    serializer_class = ProductCompareSerializer
+    lookup_url_kwarg = 'product_id'
+
 
 # noinspection PyUnresolvedReferences
 class RateProduct(APIView):
@@ -1009,6 +1084,8 @@ class OrderView(APIView):
         'state' фильтр по статусу заказов
         'date_before' фильтр по дате 20XX-XX-XX, раньше чем указанная
         'date_after' фильтр по дате 20XX-XX-XX, начиная с указанной
+
+        'stream' при stream=true список отдается потоковым JSON-массивом
         """
 
         # Проверка авторизации пользователя
@@ -1040,6 +1117,9 @@ class OrderView(APIView):
                              'ordered_items__product_info__shop').\
             annotate(total_sum=query_total_sum).order_by('-datetime')
 
+        if is_stream_requested(request):
+            return streaming_json_response(orders, OrderCustomerSerializer)
+
         serializer = OrderCustomerSerializer(orders, many=True)
         return Response(serializer.data)
 
@@ -1219,6 +1299,9 @@ class PartnerState(APIView):
         if shop:
             try:
                 shop.update(state=new_state)
+                bump_cache_version(SHOPS_CACHE)  # update() не вызывает сигналы модели
+                # предложения магазина появляются/исчезают в сравнении цен
+                Product.update_offers(ProductInfo.objects.filter(shop__in=shop).values('product_id'))
                 return Response({'Status': True, 'new_state': new_state})
             except ValueError as error:
                 return Response({'Status': False, 'Errors': str(error)})
@@ -1250,6 +1333,8 @@ class PartnerOrders(APIView):
         'sum_less' фильтр по сумме, заказы дешевле value
         'delivery_date_before' фильтр по дате доставки 20XX-XX-XX, раньше чем указанная
         'delivery_date_after' фильтр по дате доставки 20XX-XX-XX, начиная с указанной
+
+        'stream' при stream=true список отдается потоковым JSON-массивом
         """
 
         # проверка авторизации
@@ -1296,6 +1381,9 @@ class PartnerOrders(APIView):
         except ValidationError:
             return Response(Error.DATE_WRONG.value, status=400)
 
+        if is_stream_requested(request):
+            return streaming_json_response(queryset, OrderPartnerSerializer)
+
         serializer = OrderPartnerSerializer(queryset, many=True)
         return Response(serializer.data)
 
@@ -1393,7 +1481,8 @@ class PartnerUpdate(APIView):
         """
         Полностью обновить складские остатки магазина, создать новый магазин.
 
-        В yaml-файле (аргумент file) передается полный список остатков магазина.
+        В yaml-файле (аргумент file) передается полный список остатков магазина, также принимаются прайсы
+        в форматах csv и jsonl.
         Все товары на остатках, не переданные в yaml, будут значиться с нулевым количеством.
         Новые товары будут добавлены, уже имеющиеся на остатках - обновлены согласно информации в yaml-файле.
 
@@ -1402,6 +1491,8 @@ class PartnerUpdate(APIView):
         {
         "url": "http://bee.ru"
         }
+
+        'dry_run' при dry_run=1 прайс только проверяется, без создания магазина, категорий и товаров
         """
 
         # Проверка авторизации пользователя
@@ -1412,14 +1503,20 @@ class PartnerUpdate(APIView):
         if request.user.type != 'shop':
             return Response(Error.USER_TYPE_NOT_SHOP.value, status=403)
 
-        # Забираем данные из .yaml + проверяем, что передан файл формата .yaml
+        # Забираем данные из файла + проверяем, что передан файл формата .yaml, .csv или .jsonl
         file = request.data.get('file')
         if not file:
             return Response(Error.NOT_REQUIRED_ARGS.value, status=400)
-        if file.name.split('.')[-1] != 'yaml':
+        price_format = get_price_list_format(file.name)
+        if not price_format:
+            return Response(Error.FILE_INCORRECT.value, status=400)
+        # читаем только магазин и категории, товары разбираются воркером потоково
+        stats = ImportStats()
+        try:
+            with stats.capture(), stats.stage('header'):  # категории csv создает воркер
+                file_data = read_price_list_header(file, price_format, categories=False)
+        except (yaml.YAMLError, PriceListError):
             return Response(Error.FILE_INCORRECT.value, status=400)
-        # file_data = get_data_from_yaml_file(file)
-        file_data = yaml.load(file, Loader=yaml.Loader)
 
         # Определяем магазин или создаем новый
         shop_name = file_data.get('shop')
@@ -1433,6 +1530,12 @@ class PartnerUpdate(APIView):
                 except ValidationError as error:
                     return Response({'Status': False, 'Error': str(error)}, status=400)
 
+                # при проверке прайса магазин не создается, проверяем только, что название не занято
+                if self.is_dry_run(request):
+                    if Shop.objects.filter(name=shop_name).exists():
+                        return Response(Error.SHOP_USER_NOT_RELATED.value, status=400)
+                    return self.validate(file, file_data, price_format)
+
                 try:
                     shop = Shop.objects.create(name=file_data.get('shop'), user=request.user, url=url)
                 except IntegrityError:
@@ -1441,37 +1544,21 @@ class PartnerUpdate(APIView):
             else:
                 return Response(Error.URL_NOT_SPECIFIED.value, status=400)
 
-        else:
-            # сносим старую базу остатков, выставляя нулевые остатки
-            ProductInfo.objects.filter(shop=shop.id).update(quantity=0)
+        if self.is_dry_run(request):
+            return self.validate(file, file_data, price_format)
 
         # сборщик ошибок
-        counter = 0
         errors = {}
         errors_list = []
-        shop_product_failed = 0
         category_failed = 0
 
-        # загружаем новые категории из yaml
-        create_categories(file_data.get('categories'), shop, category_failed, errors_list, errors)
-
-        # забираем данные о товарах
-        goods = file_data.get('goods')
-        all_tasks = []  # для селери
-        if goods:
-            method = str(request.method)  # определяем http-метод для task
-            for good in goods:
-                task_er = {}
-                task_er_list = []
-                # товары загружаем параллельно в task
-                task = task_load_good_from_yaml.delay(method, good, shop_name, task_er_list, task_er, counter)
-                all_tasks.append(task.task_id)
+        # загружаем новые категории из прайса
+        if file_data.get('categories'):
+            with stats.capture(), stats.stage('categories'):
+                create_categories(file_data['categories'], shop, category_failed, errors_list, errors)
 
-            # забираем данные из отправленных tasks
-            counter = get_data_from_all_tasks(all_tasks, counter, shop_product_failed, errors)[0]
-
-        status = True if counter else False
-        return Response({'Status': status, 'Загружено/обновлено товаров': counter, **errors})
+        # товары загружаются в фоне, остатки обнуляются воркером перед загрузкой
+        return self.start_import(request, shop, file, errors, stats)
 
     @swagger_auto_schema(manual_parameters=manual_parameters_partnerupdate)
     def patch(self, request, *args, **kwargs):
@@ -1479,9 +1566,12 @@ class PartnerUpdate(APIView):
         Принять новую поставку на склад, обновить цены, описание товаров.
 
         Текущие остатки склада суммируются с указанными в yaml-накладной.
-        В yaml-файле (аргумент file) передается то, что поступает на склад, или переоценка/параметры товара.
+        В yaml-файле (аргумент file) передается то, что поступает на склад, или переоценка/параметры товара,
+        также принимаются накладные в форматах csv и jsonl.
         При переоценке/изменении описания без фактического привоза товару в накладной необходимо установить
         количество = 0.
+
+        'dry_run' при dry_run=1 накладная только проверяется, без записи в БД
         """
 
         # Проверка авторизации пользователя
@@ -1492,50 +1582,117 @@ class PartnerUpdate(APIView):
         if request.user.type != 'shop':
             return Response(Error.USER_TYPE_NOT_SHOP.value, status=403)
 
-        # Забираем данные из .yaml + проверяем, что передан файл формата .yaml
+        # Забираем данные из файла + проверяем, что передан файл формата .yaml, .csv или .jsonl
         file = request.data.get('file')
         if not file:
             return Response(Error.NOT_REQUIRED_ARGS.value, status=400)
-        if file.name.split('.')[-1] != 'yaml':
+        price_format = get_price_list_format(file.name)
+        if not price_format:
+            return Response(Error.FILE_INCORRECT.value, status=400)
+        # читаем только магазин и категории, товары разбираются воркером потоково
+        stats = ImportStats()
+        try:
+            with stats.capture(), stats.stage('header'):  # категории csv создает воркер
+                data = read_price_list_header(file, price_format, categories=False)
+        except (yaml.YAMLError, PriceListError):
             return Response(Error.FILE_INCORRECT.value, status=400)
-        # data = get_data_from_yaml_file(file)
-        data = yaml.load(stream=file, Loader=yaml.Loader)
 
         # сборщик ошибок
-        counter = 0
         errors = {}
         errors_list = []
-        shop_product_failed = 0
         category_failed = 0
 
         # Определяем магазин, с которым работаем (и что у user есть к нему доступ)
-        shop_name = data['shop']
+        shop_name = data.get('shop')
         shop = Shop.objects.filter(user=request.user, name=shop_name).first()
         if not shop:
             return Response(Error.SHOP_USER_NOT_RELATED.value, status=400)
 
+        if self.is_dry_run(request):
+            return self.validate(file, data, price_format)
+
         # Обновляем/добавляем категории в базу
         new_categories = data.get('categories')
         if new_categories:
-            create_categories(new_categories, shop, category_failed, errors_list, errors)
+            with stats.capture(), stats.stage('categories'):
+                create_categories(new_categories, shop, category_failed, errors_list, errors)
+
+        return self.start_import(request, shop, file, errors, stats)
+
+    @staticmethod
+    def is_dry_run(request) -> bool:
+        """Запрошена ли только проверка прайса без загрузки (dry_run=1/true/yes)"""
+        try:
+            return bool(strtobool(request.query_params.get('dry_run', 'false')))
+        except ValueError:
+            return False
+
+    @staticmethod
+    def validate(file, header: dict, price_format: str) -> Response:
+        """
+        Проверка прайса в процессе запроса без записи в БД
+
+        :param file: файл-вложение с прайсом
+        :param header: магазин и категории прайса (категории csv при запросе не читаются)
+        :param price_format: формат прайса
+        :return: Response с отчетом о проверке
+        """
+        file.seek(0)
+        try:
+            if 'categories' not in header:  # проверка и так читает весь прайс
+                header = read_price_list_header(file, price_format)
+                file.seek(0)
+            report = validate_price_list(file, header.get('categories'), price_format)
+        except (yaml.YAMLError, PriceListError):
+            return Response(Error.FILE_INCORRECT.value, status=400)
+        return Response(report, status=200)
+
+    @staticmethod
+    def start_import(request, shop: Shop, file, errors: dict, stats: ImportStats) -> Response:
+        """
+        Сохранение прайса и постановка фоновой загрузки товаров в очередь Celery
+
+        :param request: запрос загрузки прайса
+        :param shop: магазин, остатками которого идет управление
+        :param file: файл-вложение с прайсом
+        :param errors: ошибки, возникшие до загрузки товаров (создание категорий)
+        :param stats: метрики этапов запроса (чтение заголовка прайса, создание категорий)
+        :return: Response с id задачи загрузки и ссылкой на ее прогресс
+        """
+        job = ImportJob.objects.create(shop=shop, method=str(request.method), file=file, errors=errors,
+                                       stats=stats.as_dict())
+        task_import_price_list.delay(job.id)
+        return Response({'Status': True, 'job_id': job.id,
+                         'url': request.build_absolute_uri(reverse('partner_update_job', args=[job.id]))},
+                        status=202)
+
+
+# noinspection PyUnresolvedReferences
+class PartnerUpdateJob(APIView):
+    """
+    Класс для получения прогресса и итогов фоновой загрузки прайса
+    """
+
+    def get(self, request, job_id: int, *args, **kwargs):
+        """
+        Получить прогресс загрузки прайса: статус (new - в очереди, running - загружается, done - завершена,
+        failed - ошибка), количество товаров в прайсе, обработанных, загруженных и не загруженных товаров.
+        После завершения в result - итог загрузки с детализацией ошибок, в stats - время, количество и время
+        запросов к БД и пик памяти по этапам загрузки и по каждой пачке.
+        """
 
-        # забираем данные о товарах
-        goods = data.get('goods')
-        all_tasks = []  # для селери
-        if goods:
-            method = str(request.method)  # определяем http-метод для task
-            for good in goods:
-                task_er = {}
-                task_er_list = []
-                # товары загружаем параллельно в task
-                good_task = task_load_good_from_yaml.delay(method, good, shop_name, task_er_list, task_er, counter)
-                all_tasks.append(good_task.task_id)
+        # Проверка авторизации пользователя
+        if not request.user.is_authenticated:
+            return Response(Error.USER_NOT_AUTHENTICATED.value, status=403)
 
-            # забираем данные из отправленных tasks
-            counter = get_data_from_all_tasks(all_tasks, counter, shop_product_failed, errors)[0]
+        # Проверяем, что юзер == менеджер магазина
+        if request.user.type != 'shop':
+            return Response(Error.USER_TYPE_NOT_SHOP.value, status=403)
 
-        status = True if counter else False
-        return Response({'Status': status, 'Загружено/обновлено товаров': counter, **errors})
+        job = ImportJob.objects.filter(id=job_id, shop__user=request.user).first()
+        if not job:
+            return Response(Error.IMPORT_JOB_NOT_EXIST.value, status=404)
+        return Response(ImportJobSerializer(job).data)
 
 
 # noinspection PyUnresolvedReferences
@@ -1826,6 +1983,7 @@ class PartnerProductInfoPhotoView(APIView):
         all_images = ProductInfoPhoto.objects.filter(product__shop__user=request.user, product=new_main.product)
         all_images.update(is_main=False)
         all_images.filter(id=product).update(is_main=True)
+        ProductInfo.update_main_photo(new_main.product_id)
 
         serializer = ProductPhotoSerializer(all_images, many=True)
         return Response(serializer.data)
@@ -0,0 +1,234 @@
+# пропускная способность загрузки прайса партнера: запрос PartnerUpdate и задача task_import_price_list
+# (Celery в режиме eager) на синтетических прайсах в тестовой БД, созданной по настройкам DATABASES.
+# Итоги по этапам записываются в JSON-baseline, с которым сравниваются следующие прогоны
+#
+#   python -m benchmarks.import_price_list --goods 20000 --output baseline.json
+#   python -m benchmarks.import_price_list --goods 20000 --compare baseline.json
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shop_site.settings')
+django.setup()
+
+from celery.signals import task_prerun, task_postrun  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from backend.models import ImportJob, User  # noqa: E402
+from backend.utils.price_list import dump_price_list  # noqa: E402
+from benchmarks.parse_price_list import make_catalog, measure  # noqa: E402
+from shop_site.celery import app as celery_app  # noqa: E402
+
+# метрики этапа, рост которых считается регрессией при сравнении с baseline
+REGRESSION_METRICS = ('wall_time', 'import_time', 'queries', 'peak_memory_mb')
+
+
+def make_stages(catalog: dict) -> list[tuple[str, str, dict]]:
+    """
+    Этапы загрузки в порядке выполнения: каждый следующий загружается поверх остатков предыдущего
+
+    :param catalog: синтетический прайс (make_catalog)
+    :return: список (название этапа, http-метод, прайс)
+    """
+    def changed(**fields) -> dict:
+        return dict(catalog, goods=[{**good, **{key: value(good) for key, value in fields.items()}}
+                                    for good in catalog['goods']])
+
+    return [
+        ('post_new', 'post', catalog),  # новые товары
+        ('post_unchanged', 'post', catalog),  # тот же прайс
+        ('post_price', 'post', changed(price=lambda good: good['price'] + 1)),  # изменилась цена
+        ('post_quantity', 'post', changed(price=lambda good: good['price'] + 1,
+                                          quantity=lambda good: good['quantity'] + 1)),  # только количество
+        ('patch', 'patch', changed(quantity=lambda good: 1)),  # поставка всех товаров
+    ]
+
+
+class StageMeter:
+    """
+    Счетчик запросов к БД этапа (execute_wrapper вместо CaptureQueriesContext: запись текста запросов с параметрами
+    многократно замедляет bulk-запросы загрузки) и время/номер запроса начала и конца задачи task_import_price_list
+    по сигналам Celery
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.start = self.finish = None
+
+    def __call__(self, execute, sql, params, many, context):
+        if 'silk_' not in sql:  # запросы django-silk, записывающего профиль запроса, к загрузке не относятся
+            self.queries += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        task_prerun.connect(self.on_prerun, weak=False)
+        task_postrun.connect(self.on_postrun, weak=False)
+        self.wrapper = connection.execute_wrapper(self)
+        self.wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wrapper.__exit__(*exc_info)
+        task_prerun.disconnect(self.on_prerun)
+        task_postrun.disconnect(self.on_postrun)
+
+    def on_prerun(self, task, **kwargs) -> None:
+        if task.name == 'backend.tasks.task_import_price_list':
+            self.start = (time.perf_counter(), self.queries)
+
+    def on_postrun(self, task, **kwargs) -> None:
+        if task.name == 'backend.tasks.task_import_price_list':
+            self.finish = (time.perf_counter(), self.queries)
+
+
+def run_stages(stages: list, goods_quantity: int, trace_memory: bool = False) -> dict:
+    """
+    Загрузка прайсов этапов менеджером нового магазина через API
+
+    :param stages: этапы (make_stages)
+    :param goods_quantity: количество товаров в прайсе
+    :param trace_memory: замер пиковой памяти tracemalloc (замедляет загрузку, время этапов не записывается)
+    :return: словарь этап -> метрики
+    """
+    user = User.objects.create_user(email='benchmark@m.ru', is_active=True, type='shop')
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+    results = {}
+    for name, method, catalog in stages:
+        file = SimpleUploadedFile('price.yaml', dump_price_list(catalog))
+        data = {'file': file, 'url': 'http://sv.ru'} if name == 'post_new' else {'file': file}
+        if trace_memory:
+            tracemalloc.start()
+        with StageMeter() as meter:
+            start = time.perf_counter()
+            res = getattr(client, method)(reverse('partner_update'), data=data, format='multipart')
+            wall_time = time.perf_counter() - start
+        if res.status_code != 202:
+            raise RuntimeError(f'{name}: {res.status_code} {res.content.decode()}')
+        job = ImportJob.objects.get(id=res.json()['job_id'])
+        if job.state != 'done':
+            raise RuntimeError(f'{name}: загрузка {job.state} {job.errors}')
+        if trace_memory:
+            results[name] = {'peak_memory_mb': round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2),
+                             'import_stages': {stage: {'peak_memory_mb': metrics['peak_memory_mb']}
+                                               for stage, metrics in job.stats['stages'].items()}}
+            tracemalloc.stop()
+            continue
+        import_time = meter.finish[0] - meter.start[0]
+        results[name] = {
+            'wall_time': round(wall_time, 3),
+            'upload_time': round(wall_time - import_time, 3),
+            'import_time': round(import_time, 3),
+            'goods_per_second': round(goods_quantity / import_time),
+            'queries': meter.queries,
+            'import_queries': meter.finish[1] - meter.start[1],
+            'created': job.created, 'updated': job.updated, 'unchanged': job.unchanged,
+            # метрики этапов загрузки из задачи (ImportJob.stats): где тратится время загрузки
+            'import_stages': {stage: {'time': metrics['time'], 'queries': metrics['queries'],
+                                      'query_time': metrics['query_time']}
+                              for stage, metrics in job.stats['stages'].items()},
+        }
+    return results
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Сравнение прогона с baseline: рост метрик REGRESSION_METRICS больше чем на tolerance (запросов - любой)
+
+    :return: список описаний регрессий
+    """
+    regressions = []
+    print(f'\n{"Этап":<16}{"Метрика":<16}{"Baseline":>12}{"Сейчас":>12}{"Изменение":>11}')
+    for stage, metrics in current['stages'].items():
+        for metric in REGRESSION_METRICS:
+            old, new = baseline.get('stages', {}).get(stage, {}).get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            limit = 0 if metric == 'queries' else tolerance
+            mark = ' !' if change > limit else ''
+            print(f'{stage:<16}{metric:<16}{old:>12}{new:>12}{change:>+10.0%}{mark}')
+            if mark:
+                regressions.append(f'{stage}.{metric}: {old} -> {new}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пропускная способность загрузки прайса партнера')
+    parser.add_argument('--goods', type=int, default=20000, help='количество товаров в прайсе')
+    parser.add_argument('--parameters', type=int, default=3, help='количество характеристик каждого товара')
+    parser.add_argument('--categories', type=int, default=5, help='количество категорий')
+    parser.add_argument('--parallel', action='store_true', help='параллельная загрузка пачками (IMPORT_PARALLEL)')
+    parser.add_argument('--no-memory', action='store_true', help='без замера пиковой памяти (второго прогона)')
+    parser.add_argument('--output', help='файл для записи результатов (JSON-baseline)')
+    parser.add_argument('--compare', help='baseline для сравнения, при регрессии код выхода 1')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='допустимый рост времени и памяти, доля')
+    args = parser.parse_args()
+
+    settings.IMPORT_PARALLEL = args.parallel
+    logging.getLogger('backend.import').setLevel(logging.WARNING)  # строки метрик пачек не выводятся
+    celery_app.conf.task_always_eager = True
+    catalog = make_catalog(args.goods, args.categories, args.parameters)
+    stages = make_stages(catalog)
+
+    setup_test_environment()
+    test_db = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        results = run_stages(stages, args.goods)
+        if not args.no_memory:
+            call_command('flush', interactive=False, verbosity=0)
+            for stage, metrics in run_stages(stages, args.goods, trace_memory=True).items():
+                for import_stage, peak in metrics.pop('import_stages').items():
+                    results[stage]['import_stages'].setdefault(import_stage, {}).update(peak)
+                results[stage].update(metrics)
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+        teardown_test_environment()
+
+    parse_time = measure(dump_price_list(catalog), 'yaml', repeat=1)
+    report = {
+        'config': {'goods': args.goods, 'parameters': args.parameters, 'categories': args.categories,
+                   'parallel': args.parallel, 'batch_size': settings.IMPORT_BATCH_SIZE, 'database': connection.vendor},
+        'stages': {'parse': {'wall_time': round(parse_time, 3), 'goods_per_second': round(args.goods / parse_time)},
+                   **results},
+    }
+
+    print(f'{"Этап":<16}{"Время, с":>10}{"Загрузка, с":>13}{"Товаров/с":>11}{"Запросов":>10}{"Память, Мб":>12}')
+    for stage, metrics in report['stages'].items():
+        print(f'{stage:<16}{metrics["wall_time"]:>10}{metrics.get("import_time", ""):>13}'
+              f'{metrics["goods_per_second"]:>11}{metrics.get("queries", ""):>10}{metrics.get("peak_memory_mb", ""):>12}')
+
+    for stage, metrics in report['stages'].items():
+        if metrics.get('import_stages'):
+            slowest = sorted(metrics['import_stages'].items(), key=lambda item: -item[1].get('time', 0))[:4]
+            print(f'  {stage}: ' + ', '.join(f'{name} {values.get("time", 0):.2f} с' for name, values in slowest))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        if regressions:
+            print('\nРегрессии:', *regressions, sep='\n  ')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
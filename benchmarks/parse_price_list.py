@@ -0,0 +1,66 @@
+# сравнение скорости потокового разбора прайса в форматах yaml, csv и jsonl на одном и том же каталоге
+#
+#   python -m benchmarks.parse_price_list --goods 20000
+
+import argparse
+import io
+import time
+
+from backend.utils.price_list import PRICE_LIST_FORMATS, dump_price_list, iter_price_list_goods
+
+
+def make_catalog(goods_quantity: int, categories: int = 5, parameters: int = 3) -> dict:
+    """
+    Синтетический прайс в структуре shop_post.yaml
+
+    :param goods_quantity: количество товаров
+    :param categories: количество категорий
+    :param parameters: количество характеристик каждого товара
+    :return: словарь с ключами shop, categories и goods
+    """
+    return {
+        'shop': 'Связной',
+        'categories': [{'id': i, 'name': f'Категория {i}'} for i in range(1, categories + 1)],
+        'goods': [{
+            'id': i,
+            'category': i % categories + 1,
+            'model': f'model-{i}',
+            'name': f'Товар {i}',
+            'price': 1000 + i % 500,
+            'price_rrc': 1100 + i % 500,
+            'quantity': i % 20,
+            'description': f'Описание товара {i}, несколько слов о нем',
+            'parameters': {f'Характеристика {j}': f'значение {i % 7}' for j in range(parameters)},
+        } for i in range(1, goods_quantity + 1)],
+    }
+
+
+def measure(content: bytes, price_format: str, repeat: int = 3) -> float:
+    """Лучшее из repeat время потокового разбора всех товаров, сек"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in iter_price_list_goods(io.BytesIO(content), price_format):
+            pass
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Скорость разбора прайса в форматах yaml, csv и jsonl')
+    parser.add_argument('--goods', type=int, default=20000, help='количество товаров в прайсе')
+    parser.add_argument('--repeat', type=int, default=3, help='количество повторов, берется лучшее время')
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.goods)
+    print(f'{"Формат":<8}{"Размер, Мб":>12}{"Время, с":>10}{"Товаров/с":>12}{"Мб/с":>8}')
+    for price_format in PRICE_LIST_FORMATS:
+        content = dump_price_list(catalog, price_format)
+        elapsed = measure(content, price_format, args.repeat)
+        size = len(content) / 2 ** 20
+        print(f'{price_format:<8}{size:>12.1f}{elapsed:>10.2f}{args.goods / elapsed:>12.0f}{size / elapsed:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# проверка линейности однопроходного разбора yaml-прайса без libyaml (get_data_from_yaml_file): время разбора на товар
+# в большом прайсе не должно расти относительно прайсов меньшего размера (код возврата 1 при нарушении)
+#
+#   python -m benchmarks.yaml_tokenizer --goods 1000 10000 100000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shop_site.settings')
+django.setup()
+
+from backend.utils.get_data_from_yaml import get_data_from_yaml_file  # noqa: E402
+
+
+def write_price_list(path: str, goods_quantity: int) -> None:
+    """Прайс в диалекте shop_post.yaml с многострочным описанием и характеристиками каждого товара"""
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('shop: Связной\ncategories:\n  - id: 1\n    name: Смартфоны\ngoods:\n')
+        for i in range(goods_quantity):
+            file.write(f'  - id: {i}\n    category: 1\n    model: model-{i}\n    name: Товар {i}\n'
+                       f'    price: 100\n    price_rrc: 110\n    quantity: 5\n'
+                       f'    description: Описание товара {i},\n      продолжение описания\n'
+                       f'    parameters:\n      "Цвет": красный\n      "Длина": {i} м\n')
+
+
+def measure(path: str, repeat: int) -> float:
+    """Лучшее из repeat время разбора прайса, сек"""
+    timings = []
+    for _ in range(repeat):
+        with open(path, 'rb') as file:
+            start = time.perf_counter()
+            get_data_from_yaml_file(file)
+            timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Линейность разбора прайса get_data_from_yaml_file')
+    parser.add_argument('--goods', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='размеры прайсов, последний сравнивается с меньшими')
+    parser.add_argument('--repeat', type=int, default=3, help='количество повторов, берется лучшее время')
+    parser.add_argument('--tolerance', type=float, default=3, help='допустимый рост времени на товар, раз')
+    args = parser.parse_args()
+
+    per_good = {}
+    print(f'{"Товаров":>10}{"Время, с":>10}{"Мкс/товар":>12}')
+    with tempfile.TemporaryDirectory() as directory:
+        for goods_quantity in args.goods:
+            path = os.path.join(directory, f'{goods_quantity}.yaml')
+            write_price_list(path, goods_quantity)
+            elapsed = measure(path, args.repeat)
+            per_good[goods_quantity] = elapsed / goods_quantity
+            print(f'{goods_quantity:>10}{elapsed:>10.3f}{per_good[goods_quantity] * 1e6:>12.2f}')
+
+    largest = args.goods[-1]
+    smaller = [per_good[goods_quantity] for goods_quantity in args.goods[:-1]]
+    if smaller and per_good[largest] > args.tolerance * min(smaller):
+        print(f'Время на товар в прайсе из {largest} товаров выросло больше чем в {args.tolerance} раза')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'backend',
     'debug_toolbar',
@@ -169,6 +170,41 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# загруженные партнерами прайсы для фоновой загрузки, не раздаются через /media/
+IMPORT_ROOT = os.path.join(BASE_DIR, 'imports')
+# количество товаров прайса в одной транзакции записи и в одном сообщении Celery при параллельной загрузке
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+# параллельная запись пачек прайса отдельными задачами Celery (chord) вместо последовательной в одной задаче
+IMPORT_PARALLEL = os.getenv('IMPORT_PARALLEL') == 'True'
+# запись товаров и характеристик пачки через COPY во временную таблицу и INSERT ... ON CONFLICT (только PostgreSQL)
+IMPORT_COPY = os.getenv('IMPORT_COPY') == 'True'
+# замер пика памяти этапов загрузки (tracemalloc многократно замедляет загрузку, включается для диагностики)
+IMPORT_TRACE_MEMORY = os.getenv('IMPORT_TRACE_MEMORY') == 'True'
+# сек без записи прогресса, после которых загрузка в статусе running считается прерванной и возобновляется
+# командой resumeimports (должно превышать время самого долгого этапа загрузки без записи прогресса)
+IMPORT_STALE_TIMEOUT = int(os.getenv('IMPORT_STALE_TIMEOUT', 1800))
+# попыток загрузки прайса (первый запуск и возобновления resumeimports), после которых загрузка завершается ошибкой
+IMPORT_MAX_ATTEMPTS = int(os.getenv('IMPORT_MAX_ATTEMPTS', 3))
+
+# метрики загрузки прайсов (backend.utils.import_stats) пишутся в stdout строками JSON
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'import': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+    },
+    'loggers': {
+        'backend.import': {'handlers': ['import'], 'level': os.getenv('IMPORT_LOG_LEVEL', 'INFO'),
+                           'propagate': False},
+    },
+}
+
+# файлы запросов всегда сохраняются во временный файл на диске, а не в память процесса (прайсы в сотни Мб)
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+
 # smtp для отправки email в сигналах
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST')
@@ -251,6 +287,24 @@ SOCIAL_AUTH_VK_EXTRA_DATA = [
 # REDIS_HOST = '127.0.0.1'
 # REDIS_PORT = '6379'
 
+# CACHE settings
+# кеш списков категорий и магазинов: Redis из переменной CACHE, без нее - локальная память процесса, в которой
+# версии списков, увеличенные другими процессами (воркер Celery), не видны, и списки не кешируются
+CACHE_LOCATION = os.getenv('CACHE')
+if CACHE_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_LOCATION,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # CELERY settings
 CELERY_BROKER_URL = os.getenv('BROKER')
 CELERY_BROKER_TRANSPORT_OPTION = {'visibility_timeout': 3600}
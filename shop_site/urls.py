@@ -24,8 +24,9 @@ from django.urls import re_path as url
 from backend.utils.sentry import sentry_test_trigger_error
 from backend.views import CategoryView, ShopView, ProductInfoView, PartnerState, PartnerOrders, ContactView, \
     OrderView, BasketView, PartnerUpdate, RegisterAccount, ConfirmAccount, AccountDetails, LoginAccount, \
-    LogoutAccount, MyResetPasswordRequestToken, MyResetPasswordConfirm, ProductInfoDetailView, \
-    OrderDetailView, RateProduct, PartnerBackup, PartnerReport, PartnerProductInfoPhotoView, main_redirect
+    LogoutAccount, MyResetPasswordRequestToken, MyResetPasswordConfirm, ProductInfoDetailView, ProductCompareView, \
+    OrderDetailView, RateProduct, PartnerBackup, PartnerReport, PartnerProductInfoPhotoView, PartnerUpdateJob, \
+    main_redirect
 from .yasg import urlpatterns as doc_urls
 
 
@@ -41,6 +42,7 @@ urlpatterns = [
     path('shops/', ShopView.as_view(), name='shops'),
     path('products/', ProductInfoView.as_view(), name='products'),
     path('products/<int:pk>/', ProductInfoDetailView.as_view(), name='product_detail'),
+    path('products/compare/<int:product_id>/', ProductCompareView.as_view(), name='product_compare'),
     path('products/rate/', RateProduct.as_view(), name='rate_product'),
     path('basket/', BasketView.as_view(), name='basket'),
     path('order/', OrderView.as_view(), name='order'),
@@ -59,6 +61,7 @@ urlpatterns = [
     path('partner/state/', PartnerState.as_view(), name='partner_state'),
     path('partner/orders/', PartnerOrders.as_view(), name='partner_orders'),
     path('partner/update/', PartnerUpdate.as_view(), name='partner_update'),
+    path('partner/update/<int:job_id>/', PartnerUpdateJob.as_view(), name='partner_update_job'),
     path('partner/backup/', PartnerBackup.as_view(), name='partner_backup'),
     path('partner/report/', PartnerReport.as_view(), name='partner_report'),
     path('partner/images/', PartnerProductInfoPhotoView.as_view(), name='product_images'),
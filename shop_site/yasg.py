@@ -3,7 +3,8 @@ from drf_yasg.utils import swagger_auto_schema
 from rest_framework import permissions, serializers
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
-from drf_yasg.openapi import IN_QUERY, TYPE_INTEGER, Parameter as Param, TYPE_STRING, TYPE_FILE, IN_FORM
+from drf_yasg.openapi import IN_QUERY, TYPE_INTEGER, Parameter as Param, TYPE_STRING, TYPE_FILE, IN_FORM, \
+    TYPE_BOOLEAN
 
 from backend.models import Order, OrderItem, User
 
@@ -40,6 +41,7 @@ manual_parameters_orderview_get = [
    Param('state', IN_QUERY, type=TYPE_STRING),
    Param('date_before', IN_QUERY, type=TYPE_STRING),
    Param('date_after', IN_QUERY, type=TYPE_STRING),
+   Param('stream', IN_QUERY, type=TYPE_BOOLEAN),
 ]
 
 # query_params для работы с заказами магазина: фильтрация и поиск
@@ -54,11 +56,26 @@ manual_parameters_orderpartner_get = [
    Param('sum_less', IN_QUERY, type=TYPE_INTEGER),
    Param('delivery_date_before', IN_QUERY, type=TYPE_STRING),
    Param('delivery_date_after', IN_QUERY, type=TYPE_STRING),
+   Param('stream', IN_QUERY, type=TYPE_BOOLEAN),
+]
+
+# query_params для списка товаров: потоковая отдача и выборочный вывод полей
+manual_parameters_products_get = [
+   Param('stream', IN_QUERY, type=TYPE_BOOLEAN),
+   Param('fields', IN_QUERY, type=TYPE_STRING),
+   Param('exclude', IN_QUERY, type=TYPE_STRING),
+]
+
+# query_params для детализации товара: выборочный вывод полей
+manual_parameters_product_detail_get = [
+   Param('fields', IN_QUERY, type=TYPE_STRING),
+   Param('exclude', IN_QUERY, type=TYPE_STRING),
 ]
 
 # загрузка файла partnerupdate
 manual_parameters_partnerupdate = [
-   Param(name="file", in_=IN_FORM, type=TYPE_FILE, required=True, description="Файл")
+   Param(name="file", in_=IN_FORM, type=TYPE_FILE, required=True, description="Файл"),
+   Param(name="dry_run", in_=IN_QUERY, type=TYPE_BOOLEAN, description="Только проверка прайса без загрузки"),
 ]
 
 # загрузка файла avatar_thumbnail
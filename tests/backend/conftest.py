@@ -1,10 +1,15 @@
 import random
 
 import pytest
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APIClient
 from model_bakery import baker
 
 from backend.models import Category, Product, Shop, ProductInfo, Parameter, ProductParameter
+from backend.utils.price_list import dump_price_list, get_price_list_format
+from backend.utils.search import update_search_documents
+from shop_site.celery import app as celery_app
 
 
 # @pytest.fixture
@@ -14,6 +19,27 @@ from backend.models import Category, Product, Shop, ProductInfo, Parameter, Prod
 #     print('Конец теста!')
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Кеш не откатывается вместе с транзакцией теста, очищаем его перед каждым тестом"""
+    cache.clear()
+
+
+@pytest.fixture
+def shared_cache(settings, tmp_path):
+    """Кеш, общий для процессов (файловый вместо Redis): с ним списки кешируются с версиями"""
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                   'LOCATION': str(tmp_path / 'cache')}}
+
+
+@pytest.fixture
+def celery_eager():
+    """Синхронное выполнение задач Celery, в том числе chord, в процессе теста"""
+    celery_app.conf.task_always_eager = True
+    yield
+    celery_app.conf.task_always_eager = False
+
+
 @pytest.fixture
 def client_pytest():
     return APIClient()
@@ -85,4 +111,39 @@ def make_productinfo(quantity: int, shop_name: str = None, price_start: int = No
         for i in goods:
             baker.make(ProductParameter, product=i, parameter=parameter)
 
+    # как и при загрузке из накладной, обновляем поисковые документы товаров
+    update_search_documents([good.id for good in goods])
+
     return goods
+
+
+def make_price_list(shop_name: str, goods_quantity: int, categories: list = None, quantity: int = 10,
+                    price: int = 100, parameters: int = 2, start_id: int = 1, file_name: str = 'price.yaml') -> \
+        SimpleUploadedFile:
+    """
+    Генерация прайса магазина в формате shop_post.yaml (или csv/jsonl по расширению file_name)
+
+    :param shop_name: название магазина
+    :param goods_quantity: количество товаров
+    :param categories: список категорий [{'id': ..., 'name': ...}], по умолчанию одна категория с id=1
+    :param quantity: количество каждого товара
+    :param price: цена каждого товара
+    :param parameters: количество характеристик каждого товара
+    :param start_id: артикул первого товара
+    :param file_name: имя файла-вложения
+    :return: файл-вложение для запроса к partner/update/
+    """
+    categories = categories or [{'id': 1, 'name': 'Смартфоны'}]
+    goods = [{
+        'id': external_id,
+        'category': categories[external_id % len(categories)]['id'],
+        'model': f'model-{external_id}',
+        'name': f'Товар {external_id}',
+        'price': price,
+        'price_rrc': price + 10,
+        'quantity': quantity,
+        'description': f'Описание товара {external_id}',
+        'parameters': {f'Характеристика {i}': f'значение {external_id % 3}' for i in range(parameters)},
+    } for external_id in range(start_id, start_id + goods_quantity)]
+    data = {'shop': shop_name, 'categories': categories, 'goods': goods}
+    return SimpleUploadedFile(file_name, dump_price_list(data, get_price_list_format(file_name)))
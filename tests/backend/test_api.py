@@ -1,18 +1,45 @@
+import json
+import os
 import random
-from unittest.mock import patch
+import tracemalloc
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest.mock import patch, PropertyMock
 
 import oauth2_provider
 import pytest
+import yaml
+from django.contrib.admin import AdminSite
 from django.contrib.auth.hashers import check_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F
+from django.forms import modelform_factory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django_rest_passwordreset.models import ResetPasswordToken
 from model_bakery import baker
+from PIL import Image
 from rest_framework.authtoken.models import Token
 
-from backend.models import Shop, User, ConfirmEmailToken, Category, Order, OrderItem, Contact, Address
-from backend.tasks import task_send_email
-from tests.backend.conftest import make_productinfo
-from backend.utils.error_text import Error
+from backend.models import Shop, User, ConfirmEmailToken, Category, Order, OrderItem, Contact, Address, \
+    RatingProduct, ProductInfo, Parameter, ProductParameter, ProductInfoPhoto, Product, ImportJob, StagedGood, \
+    StagedParameter, StockMovement, ParameterValueIndex
+from backend.admin import ProductInfoAdmin
+from backend.serializers import ProductParameterListSerializer
+from backend.tasks import task_send_email, task_import_price_list
+from tests.backend.conftest import make_productinfo, make_price_list
+from backend.utils import bulk_import, media, price_list
+from backend.utils.bulk_import import GoodsImporter, clean_good
+from backend.utils.error_text import Error, ValidateError
+from backend.utils.price_list import read_price_list_header, iter_price_list_goods, dump_price_list
+from backend.utils.facets import rebuild_parameter_index, update_parameter_index
+from backend.utils.get_data_from_yaml import create_categories, get_data_from_yaml_file
+from backend.utils.pg_copy import copy_upsert, copy_value
 
 
 # noinspection PyUnresolvedReferences
@@ -36,6 +63,31 @@ def test_get_shops(client_pytest, name, url, state, exp_code, length):
         assert data[0]['state'] == state
 
 
+@pytest.mark.django_db
+def test_get_shops_cache(client_pytest, shared_cache):
+    """Проверяем, что список магазинов отдается из кеша с ETag, повторный запрос с If-None-Match получает 304,
+    а смена статуса магазина менеджером меняет версию списка"""
+    user = User.objects.create_user(email='shop@m.ru', is_active=True, type='shop')
+    Shop.objects.create(name='Евросеть', url='http://ev.ru', state=True, user=user)
+
+    res = client_pytest.get(reverse('shops'))
+    etag = res['ETag']
+    assert res.status_code == 200
+    assert len(res.json()) == 1
+
+    res = client_pytest.get(reverse('shops'), HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == 304
+
+    client_pytest.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+    res = client_pytest.post(reverse('partner_state'), data={'state': 'False'}, format='json')
+    assert res.json()['new_state'] is False
+
+    res = client_pytest.get(reverse('shops'), HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == 200
+    assert res['ETag'] != etag
+    assert res.json() == []
+
+
 @pytest.mark.parametrize(
     ['shop_1', 'quantity_1', 'shop_2', 'quantity_2'],
     (
@@ -50,7 +102,7 @@ def test_productinfo_get(client_pytest, shop_1, quantity_1, shop_2, quantity_2):
     make_productinfo(quantity_2, shop_2)
 
     res = client_pytest.get(reverse('products'))
-    data = res.json()
+    data = res.json()['results']
 
     assert res.status_code == 200
     assert len(data) == quantity_1 + quantity_2
@@ -109,6 +161,8 @@ def test_productinfo_get_filters(client_pytest, shop_1, quantity_1, shop_2, quan
 
     res = client_pytest.get(reverse('products'), {filter_name: filter_value})
     data = res.json()
+    if res.status_code == 200:  # при ошибке в значении фильтра возвращается детализация ошибки, а не страница
+        data = data['results']
 
     assert len(data) == exp_res
 
@@ -128,6 +182,8 @@ def test_productinfo_get_filters(client_pytest, shop_1, quantity_1, shop_2, quan
              'Смартфон iPhone 13 mini Blue', 'гироскоп'),  # search по названию параметра товара
             ('Связной', 4, 'search', 'гироск', 0, 'apple-iphone-13-mini-blue',
              'Смартфон iPhone 13 mini Blue', 'камера'),  # search по несуществующему названию параметра товара
+            ('Связной', 3, 'search', 'APPLE гиро', 3, 'apple-iphone-13-mini-blue',
+             'Смартфон iPhone 13 mini Blue', 'гироскоп'),  # search по началам слов из разных полей, без учета регистра
     )
 )
 @pytest.mark.django_db
@@ -141,11 +197,111 @@ def test_productinfo_get_search_filter(client_pytest, shop_1, quantity_1, filter
 
     res = client_pytest.get(reverse('products'), {filter_name: filter_value})
     assert res.status_code == 200
-    data = res.json()
+    data = res.json()['results']
 
     assert len(data) == exp_res
 
 
+@pytest.mark.parametrize(
+    ['ordering', 'page_size', 'quantity'],
+    (
+            (None, 3, 10),          # сортировка по умолчанию (по цене)
+            ('-price', 4, 9),       # сортировка по убыванию цены
+            ('product', 2, 7),      # сортировка по названию продукта
+            ('-product', 5, 5),     # все товары помещаются на одну страницу
+    )
+)
+@pytest.mark.django_db
+def test_productinfo_get_pagination(client_pytest, ordering, page_size, quantity):
+    """Проверяем курсорную пагинацию каталога: обход всех страниц вперед и назад без пропусков и дублей при
+    одинаковых значениях ключа сортировки"""
+
+    goods = make_productinfo(quantity, price_start=100, price_max=102)  # много одинаковых цен
+    expected = sorted(goods, key=lambda x: (x.price, x.id))
+    if ordering == '-price':
+        expected.reverse()
+
+    params = {'page_size': page_size}
+    if ordering:
+        params['ordering'] = ordering
+
+    # идем вперед по ссылкам next
+    pages = []
+    res = client_pytest.get(reverse('products'), params)
+    while True:
+        assert res.status_code == 200
+        data = res.json()
+        pages.append(data['results'])
+        assert len(data['results']) <= page_size
+        if not data['next']:
+            break
+        res = client_pytest.get(data['next'])
+    received = [i['price'] for page in pages for i in page]
+
+    assert len(received) == quantity
+    if ordering in (None, '-price'):
+        assert received == [i.price for i in expected]
+    assert len(pages) == -(-quantity // page_size)
+
+    # возвращаемся назад по ссылкам previous
+    back_pages = [data['results']]
+    while data['previous']:
+        data = client_pytest.get(data['previous']).json()
+        back_pages.append(data['results'])
+    assert back_pages[::-1] == pages
+
+
+@pytest.mark.django_db
+def test_productinfo_get_ordering_name(client_pytest):
+    """Проверяем сортировку каталога по названию: keyset по денормализованному ProductInfo.name без соединения
+    с продуктами, наименование товаров обновляется при переименовании продукта"""
+
+    goods = [make_productinfo(2, prod_name=name) for name in ('Б', 'В', 'Г')]
+    assert [good.name for group in goods for good in group] == ['Б', 'Б', 'В', 'В', 'Г', 'Г']
+    product = goods[2][0].product
+    product.name = 'А'
+    product.save()
+
+    ids, params = [], {'ordering': 'product', 'page_size': 4}
+    with CaptureQueriesContext(connection) as queries:
+        res = client_pytest.get(reverse('products'), params).json()
+        ids += [i['id'] for i in res['results']]
+        ids += [i['id'] for i in client_pytest.get(res['next']).json()['results']]
+    assert ids == [good.id for group in (goods[2], goods[0], goods[1]) for good in group]
+    pages = [i['sql'] for i in queries if i['sql'].startswith('SELECT "backend_productinfo"') and 'LIMIT 5' in i['sql']]
+    assert len(pages) == 2 and all('"backend_productinfo"."name"' in sql.split('ORDER BY')[1] for sql in pages)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    ['chunk_size', 'quantity'],
+    (
+            (3, 7),     # несколько пачек, последняя неполная
+            (3, 6),     # целое число пачек
+            (3, 0),     # пустая выборка
+    )
+)
+def test_productinfo_get_stream(client_pytest, chunk_size, quantity):
+    """Проверяем, что при stream=true вся выборка товаров отдается потоковым JSON-массивом без пагинации,
+    каждая пачка сериализуется одним сериализатором списка"""
+
+    if quantity:
+        make_productinfo(quantity, price_start=1, price_max=100000)
+
+    with patch('backend.utils.streaming.STREAM_CHUNK_SIZE', chunk_size):
+        paginated = client_pytest.get(reverse('products'), {'page_size': 200}).json()['results']
+        to_representation = ProductParameterListSerializer.to_representation
+        with patch.object(ProductParameterListSerializer, 'to_representation', autospec=True,
+                          side_effect=to_representation) as mock_list:
+            res = client_pytest.get(reverse('products'), {'stream': 'true'})
+            content = b''.join(res.streaming_content)  # генератор ответа выполняется при чтении
+
+    assert res.status_code == 200
+    assert res.streaming
+    assert json.loads(content) == paginated
+    assert mock_list.call_count == -(-quantity // chunk_size)
+
+
 @pytest.mark.parametrize(
     ['shop_name', 'category_name'],
     (
@@ -169,6 +325,135 @@ def test_productinfo_detail(client_pytest, shop_name, category_name):
     assert data['product']['category'] == category_name
 
 
+@pytest.mark.parametrize(
+    ['url_name', 'query', 'exp_fields', 'exp_queries'],
+    (
+            ('product_detail', {'fields': 'id,price'}, {'id', 'price'}, 1),     # без связей и фото
+            ('product_detail', {'exclude': 'ratings,main_image,icons,images_large'},
+             {'id', 'product', 'description', 'product_parameters', 'price', 'external_id', 'shop', 'quantity',
+              'total_rating'}, 3),                                              # без отзывов и фото
+            ('product_detail', {}, {'id', 'product', 'description', 'product_parameters', 'price', 'external_id',
+                                    'shop', 'quantity', 'ratings', 'total_rating', 'main_image', 'icons',
+                                    'images_large'}, 5),                        # все поля
+            ('products', {'fields': 'id,product,price,photo'}, {'id', 'product', 'price', 'photo'}, None),
+            ('products', {'exclude': 'shop,total_rating'}, {'id', 'model', 'product', 'price', 'quantity', 'photo'},
+             None),
+    )
+)
+@pytest.mark.django_db
+def test_productinfo_sparse_fields(client_pytest, url_name, query, exp_fields, exp_queries):
+    """Проверяем вывод только запрошенных полей товара и отказ от подгрузки связей исключенных полей"""
+
+    good = make_productinfo(1, param='Цвет')[0]
+    args = [good.id] if url_name == 'product_detail' else []
+
+    with CaptureQueriesContext(connection) as queries:
+        res = client_pytest.get(reverse(url_name, args=args), query)
+
+    assert res.status_code == 200
+    if exp_queries:
+        # считаем только запросы к данным магазина (без запросов silk)
+        assert len([i for i in queries if i['sql'].startswith('SELECT') and 'silk_' not in i['sql']]) == exp_queries
+    data = res.json()
+    item = data if url_name == 'product_detail' else data['results'][0]
+    assert set(item) == exp_fields
+
+
+@pytest.mark.django_db
+def test_product_compare(client_pytest):
+    """Проверяем сравнение цен продукта по магазинам, режим лучших предложений каталога и пересчет агрегата
+    предложений при смене статуса магазина"""
+
+    user = User.objects.create_user(email='shop@m.ru', is_active=True, type='shop')
+    product = baker.make(Product, category=baker.make(Category))
+    shops = [baker.make(Shop, state=True, user=user), baker.make(Shop, state=True), baker.make(Shop, state=True)]
+    offers = [baker.make(ProductInfo, product=product, shop=shops[0], price=100, quantity=5),
+              baker.make(ProductInfo, product=product, shop=shops[1], price=300, quantity=1),
+              baker.make(ProductInfo, product=product, shop=shops[2], price=50, quantity=0)]  # нет в наличии
+    make_productinfo(2)
+    Product.update_offers([product.id])
+
+    data = client_pytest.get(reverse('product_compare', args=[product.id])).json()
+    assert (data['min_price'], data['max_price'], data['offers_count'], data['shops_in_stock']) == (100, 300, 2, 2)
+    assert data['best_offer'] == offers[0].id
+    assert [i['id'] for i in data['offers']] == [offers[0].id, offers[1].id]
+
+    res = client_pytest.get(reverse('products'), {'best_offer': 'true', 'shop_id': shops[0].id})
+    assert [i['id'] for i in res.json()['results']] == [offers[0].id]
+    res = client_pytest.get(reverse('products'), {'best_offer': 'true', 'shop_id': shops[1].id})
+    assert res.json()['results'] == []
+
+    # магазин с лучшим предложением перестает принимать заказы
+    client_pytest.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+    client_pytest.post(reverse('partner_state'), data={'state': 'False'}, format='json')
+
+    data = client_pytest.get(reverse('product_compare', args=[product.id])).json()
+    assert (data['min_price'], data['max_price'], data['offers_count'], data['shops_in_stock']) == (300, 300, 1, 1)
+    assert data['best_offer'] == offers[1].id
+
+
+@pytest.mark.parametrize('photos_quantity', (1, 3))
+@pytest.mark.django_db
+def test_productinfo_detail_photos(client_pytest, settings, tmp_path, photos_quantity):
+    """Проверяем, что изображения детализации товара собираются за один проход по подгруженным фото: количество
+    запросов не зависит от количества фото, основное изображение соответствует is_main, ссылки на миниатюры
+    берутся из кеша"""
+
+    settings.MEDIA_ROOT = tmp_path
+    good = make_productinfo(1, shop_name='Связной', prod_name='Смартфон')[0]  # имя файла строится по названиям
+    for i in range(photos_quantity):
+        image = BytesIO()
+        Image.new('RGB', (60, 80)).save(image, 'JPEG')
+        ProductInfoPhoto.objects.create(product=good, is_main=(i == photos_quantity - 1),
+                                        photo=SimpleUploadedFile(f'{i}.jpg', image.getvalue()))
+    main_photo = ProductInfoPhoto.objects.get(product=good, is_main=True)
+
+    with CaptureQueriesContext(connection) as queries:
+        data = client_pytest.get(reverse('product_detail', args=[good.id])).json()
+    assert len([i for i in queries if i['sql'].startswith('SELECT') and 'silk_' not in i['sql']]) == 4
+
+    assert data['main_image'] == main_photo.photo_large.url
+    assert len(data['icons']) == len(data['images_large']) == photos_quantity
+
+    # повторный запрос берет ссылки на миниатюры из кеша одним запросом, не обращаясь к imagekit
+    with patch('imagekit.cachefiles.ImageCacheFile.url', new_callable=PropertyMock) as spec_url, \
+            patch('backend.utils.media.cache', wraps=media.cache) as spec_cache:
+        assert client_pytest.get(reverse('product_detail', args=[good.id])).json() == data
+    spec_url.assert_not_called()
+    assert (spec_cache.get_many.call_count, spec_cache.get.call_count) == (1, 0)
+
+
+@pytest.mark.django_db
+def test_productinfo_list_photos(client_pytest, settings, tmp_path):
+    """Проверяем, что ссылки на иконки главных изображений страницы каталога читаются из кеша одним get_many
+    и записываются одним set_many"""
+
+    settings.MEDIA_ROOT = tmp_path
+    goods = make_productinfo(3, shop_name='Связной')
+    for good in goods:
+        good.product.name = f'Смартфон {good.id}'  # имя файла изображения строится по названиям
+        good.product.save()
+        image = BytesIO()
+        Image.new('RGB', (60, 80)).save(image, 'JPEG')
+        ProductInfoPhoto.objects.create(product=good, is_main=True,
+                                        photo=SimpleUploadedFile('photo.jpg', image.getvalue()))
+
+    with patch('backend.utils.media.cache', wraps=media.cache) as spec_cache:
+        data = client_pytest.get(reverse('products'), {'fields': 'id,photo'}).json()['results']
+    assert (spec_cache.get_many.call_count, spec_cache.set_many.call_count, spec_cache.get.call_count) == (1, 1, 0)
+    assert {i['id']: i['photo'] for i in data} == \
+           {good.id: good.photos.get().photo_small.url for good in goods}
+
+
+@pytest.mark.django_db
+def test_productinfo_sparse_fields_wrong(client_pytest):
+    """Проверяем ошибку при запросе несуществующего поля"""
+
+    res = client_pytest.get(reverse('products'), {'fields': 'id,name'})
+    assert res.status_code == 400
+    assert res.json() == {'fields': f'{ValidateError.FIELDS_WRONG.value}: name'}
+
+
 @patch.object(task_send_email, 'delay')  # мокаем таску
 @pytest.mark.parametrize(
     ['first_name', 'last_name', 'email', 'password', 'exp_res', 'error_text'],
@@ -600,6 +885,42 @@ def test_get_categories(client_pytest, exp_res_1, quantity):
         assert i['name'] == cats[index].name
 
 
+@pytest.mark.django_db
+def test_get_categories_cache(client_pytest, shared_cache):
+    """Проверяем, что загрузка новых категорий из накладной меняет версию закешированного списка категорий"""
+
+    baker.make(Category, _quantity=3)
+    res = client_pytest.get(reverse('categories'))
+    etag = res['ETag']
+    assert len(res.json()) == 3
+    assert client_pytest.get(reverse('categories'), HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    create_categories([{'id': 1000, 'name': 'Смартфоны'}], baker.make(Shop), 0, [], {})
+
+    res = client_pytest.get(reverse('categories'), HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == 200
+    assert len(res.json()) == 4
+
+    # связь с магазином меняется без save() категории
+    etag = res['ETag']
+    Category.objects.get(name='Смартфоны').shops.add(baker.make(Shop))
+    assert client_pytest.get(reverse('categories'), HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_get_categories_local_cache(client_pytest):
+    """Проверяем, что без общего кеша (локальная память процесса) список не кешируется: изменение из другого
+    процесса, не увеличившее версию в памяти этого процесса, сразу видно"""
+
+    baker.make(Category, _quantity=3)
+    res = client_pytest.get(reverse('categories'))
+    assert (len(res.json()), res.has_header('ETag')) == (3, False)
+
+    with patch('backend.signals.bump_cache_version'):  # версия увеличена в памяти другого процесса
+        baker.make(Category)
+    assert len(client_pytest.get(reverse('categories')).json()) == 4
+
+
 # noinspection PyUnresolvedReferences
 @pytest.mark.django_db
 @pytest.mark.parametrize(
@@ -755,6 +1076,941 @@ def test_rate_product_sum(client_pytest, email, arg_1, value_1, arg_2, value_2,
         assert data_2['total_rating'] == exp_total_rating
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    ['ratings', 'exp_total_rating', 'exp_after_delete'],
+    (
+        (['4', '5'], 4.5, 5),         # пересчет после удаления первой оценки
+        (['2'], 2, ''),               # после удаления единственной оценки рейтинг пуст
+    )
+)
+def test_rating_aggregates(client_pytest, ratings, exp_total_rating, exp_after_delete):
+    """Проверяем, что сохраненные агрегаты рейтинга пересчитываются при создании/удалении оценок и отображаются
+    в каталоге товаров"""
+
+    good = make_productinfo(1)[0]
+    rates = [baker.make(RatingProduct, product=good, rating=i) for i in ratings]
+
+    good = ProductInfo.objects.get(id=good.id)
+    assert good.rating_count == len(ratings)
+    assert good.rating_sum == sum(int(i) for i in ratings)
+
+    res = client_pytest.get(reverse('products'))
+    assert res.json()['results'][0]['total_rating'] == exp_total_rating
+
+    rates[0].delete()
+    res = client_pytest.get(reverse('products'))
+    assert res.json()['results'][0]['total_rating'] == exp_after_delete
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    ['params', 'with_category', 'exp_res'],
+    (
+        ([], True, 5),                                      # без фильтра по характеристикам
+        (['Цвет:Синий'], True, 3),                          # фильтр по значению характеристики (индекс категории)
+        (['Цвет:Синий'], False, 3),                         # фильтр без категории (подзапросы)
+        (['Цвет:Синий', 'Цвет:Красный'], True, 5),          # значения одной характеристики по ИЛИ
+        (['Цвет:Синий', 'Длина шнура:1 м'], True, 1),       # разные характеристики по И
+        (['Цвет:Синий', 'Длина шнура:1 м'], False, 1),
+        (['Цвет:Зеленый'], True, 0),                        # несуществующее значение
+    )
+)
+def test_productinfo_get_parameter_filters(client_pytest, params, with_category, exp_res):
+    """Проверяем фильтры по характеристикам товаров и подсчет фасетов по выборке"""
+
+    goods = make_productinfo(5)
+    make_productinfo(3)  # товары другой категории без характеристик
+    color, length = baker.make(Parameter, name='Цвет'), baker.make(Parameter, name='Длина шнура')
+    for i, good in enumerate(goods):
+        baker.make(ProductParameter, product=good, parameter=color, value='Синий' if i < 3 else 'Красный')
+        ProductInfo.objects.filter(id=good.id).update(model=f'model-{good.id}')
+    baker.make(ProductParameter, product=goods[0], parameter=length, value='1 м')
+    baker.make(ProductParameter, product=goods[4], parameter=length, value='2 м')
+
+    category_id = goods[0].product.category_id
+    rebuild_parameter_index([category_id])
+    query = {'param': params, 'category_id': category_id} if with_category else {'param': params}
+    if not with_category:
+        make_productinfo(3)  # без фильтра по категории в выборку попадают и товары без характеристик
+
+    res = client_pytest.get(reverse('products'), query)
+    assert res.status_code == 200
+    data = res.json()
+    found = ProductInfo.objects.filter(model__in=[i['model'] for i in data['results']])
+    assert found.filter(id__in=[good.id for good in goods]).count() == exp_res
+
+    # фасеты считаются сгруппированным запросом по товарам выборки, с категорией и без
+    exp_facets = {}
+    for item in ProductParameter.objects.filter(product__in=found).select_related('parameter'):
+        values = exp_facets.setdefault(item.parameter.name, {})
+        values[item.value] = values.get(item.value, 0) + 1
+    assert data['facets'] == exp_facets
+
+
+@pytest.mark.django_db
+def test_partner_update_parameter_index_moved(client_pytest):
+    """Проверяем, что при переносе товара в другую категорию загрузкой прайса индекс характеристик пересобирается
+    и в категории, из которой товар ушел"""
+
+    shop_client(client_pytest)
+    load_price_list(client_pytest, 'post', {'file': make_price_list('Связной', 2), 'url': 'http://sv.ru'})
+    moved = ProductInfo.objects.get(external_id=1)
+
+    def indexed(category_id: int) -> bool:
+        return any(moved.id in ids for ids in ParameterValueIndex.objects.filter(category_id=category_id).
+                   values_list('product_infos', flat=True))
+
+    assert indexed(1)
+    categories = [{'id': 1, 'name': 'Смартфоны'}, {'id': 2, 'name': 'Аксессуары'}]  # товар 1 - во второй категории
+    load_price_list(client_pytest, 'post', {'file': make_price_list('Связной', 2, categories), 'url': 'http://sv.ru'})
+    assert (indexed(1), indexed(2)) == (False, True)
+
+
+@pytest.mark.django_db
+def test_update_parameter_index():
+    """Проверяем обновление индекса характеристик для отдельных товаров (правка в админке): результат совпадает
+    с пересборкой категорий, posting lists, в которых товаров нет, не перезаписываются"""
+
+    goods = make_productinfo(3)
+    color = baker.make(Parameter, name='Цвет')
+    for good, value in zip(goods, ('Синий', 'Синий', 'Красный')):
+        baker.make(ProductParameter, product=good, parameter=color, value=value)
+    category_id, other = goods[0].product.category_id, baker.make(Category)
+    rebuild_parameter_index([category_id])
+    red = ParameterValueIndex.objects.get(value='Красный')
+
+    ProductParameter.objects.filter(product=goods[0]).update(value='Зеленый')
+    ProductInfo.objects.filter(id=goods[1].id).update(product=baker.make(Product, category=other))
+    update_parameter_index([goods[0].id, goods[1].id], [category_id])
+
+    def index() -> list:
+        return sorted(ParameterValueIndex.objects.values_list('category_id', 'value', 'product_infos'))
+
+    assert index() == [(category_id, 'Зеленый', [goods[0].id]), (category_id, 'Красный', [goods[2].id]),
+                       (other.id, 'Синий', [goods[1].id])]
+    assert ParameterValueIndex.objects.get(value='Красный').id == red.id
+    updated = index()
+    rebuild_parameter_index([category_id, other.id])
+    assert index() == updated
+
+
+@pytest.mark.django_db
+def test_productinfo_get_parameter_filters_wrong(client_pytest):
+    """Проверяем ошибку при фильтре по характеристике без значения"""
+
+    res = client_pytest.get(reverse('products'), {'param': 'Цвет'})
+    assert res.status_code == 400
+    assert res.json() == {'param': ValidateError.PARAMETER_FILTER_WRONG.value}
+
+
+def shop_client(client_pytest, email: str = 'shop@m.ru') -> User:
+    """Авторизация клиента менеджером магазина"""
+    user = User.objects.create_user(email=email, is_active=True, type='shop')
+    client_pytest.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+    return user
+
+
+def load_price_list(client_pytest, method: str, data: dict) -> dict:
+    """Загрузка прайса с выполнением фоновой задачи в процессе теста, возвращает итог загрузки из прогресса задачи"""
+    with patch('backend.views.task_import_price_list.delay', side_effect=task_import_price_list):
+        res = getattr(client_pytest, method)(reverse('partner_update'), data=data, format='multipart')
+    assert res.status_code == 202
+    job = client_pytest.get(reverse('partner_update_job', args=[res.json()['job_id']])).json()
+    assert job['state'] == 'done'
+    return job['result']
+
+
+@pytest.mark.django_db
+def test_partner_update_post(client_pytest):
+    """Проверяем полную загрузку прайса: создание магазина, товаров, характеристик, поисковых документов и
+    агрегата предложений, ошибку товара с несуществующей категорией, обнуление товаров, отсутствующих в прайсе"""
+
+    shop_client(client_pytest)
+    file = make_price_list('Связной', 5, categories=[{'id': 1, 'name': 'Смартфоны'}, {'id': 2, 'name': 'Кабели'}])
+    res = load_price_list(client_pytest, 'post', {'file': file, 'url': 'http://sv.ru'})
+    assert res == {'Status': True, 'Загружено/обновлено товаров': 5,
+                   'Создано товаров': 5, 'Обновлено товаров': 0, 'Без изменений': 0}
+
+    goods = ProductInfo.objects.filter(shop__name='Связной').order_by('external_id')
+    assert [(i.external_id, i.quantity, i.product.category_id) for i in goods] == \
+           [(1, 10, 2), (2, 10, 1), (3, 10, 2), (4, 10, 1), (5, 10, 2)]
+    assert ProductParameter.objects.filter(product__in=goods).count() == 10
+    assert goods[0].search_document == 'товар 1 model-1 характеристика 0 значение 1 характеристика 1 значение 1'
+    assert goods[0].product.best_offer_id == goods[0].id
+
+    file = make_price_list('Связной', 3, start_id=3, quantity=4, price=90)
+    goods_yaml = yaml.safe_load(file.read())
+    goods_yaml['goods'].append(dict(goods_yaml['goods'][0], id=100, category=1222))
+    file = SimpleUploadedFile('price.yaml', yaml.dump(goods_yaml, allow_unicode=True).encode('utf-8'))
+    res = load_price_list(client_pytest, 'post', {'file': file})
+    assert res == {
+        'Status': True, 'Загружено/обновлено товаров': 3, 'Создано товаров': 0, 'Обновлено товаров': 3,
+        'Без изменений': 0, 'Не удалось добавить товаров на остатки/обновить': 1,
+        'Errors': [{'product_info_creation_failed':
+                    [100, 'Товар 3', f'{ValidateError.GOOD_CATEGORY_NOT_FOUND.value}: 1222']}]}
+    assert dict(goods.values_list('external_id', 'quantity')) == {1: 0, 2: 0, 3: 4, 4: 4, 5: 4}
+    assert goods.get(external_id=3).price == 90
+    assert goods.get(external_id=3).product.category_id == 1  # товар перенесен в продукт другой категории
+    assert ProductParameter.objects.filter(product__in=goods).count() == 10
+
+
+@pytest.mark.django_db
+def test_partner_update_patch(client_pytest):
+    """Проверяем поставку: количество суммируется с остатками, повторы артикула в накладной суммируются,
+    новые товары добавляются с количеством из накладной, характеристики товаров дополняются"""
+
+    user = shop_client(client_pytest)
+    baker.make(Category, id=1, name='Смартфоны')
+    shop = baker.make(Shop, name='Связной', user=user)
+    product = baker.make(Product, category_id=1, name='Товар 1')
+    good = baker.make(ProductInfo, shop=shop, product=product, external_id=1, quantity=3)
+    baker.make(ProductParameter, product=good, parameter=baker.make(Parameter, name='Вес'), value='5 г')
+
+    file = make_price_list('Связной', 2, quantity=5)
+    data = yaml.safe_load(file.read())
+    data['goods'].append(dict(data['goods'][0], quantity=2))
+    file = SimpleUploadedFile('price.yaml', yaml.dump(data, allow_unicode=True).encode('utf-8'))
+    res = load_price_list(client_pytest, 'patch', {'file': file})
+    assert res == {'Status': True, 'Загружено/обновлено товаров': 2,
+                   'Создано товаров': 1, 'Обновлено товаров': 1, 'Без изменений': 0}
+    assert dict(ProductInfo.objects.filter(shop=shop).values_list('external_id', 'quantity')) == {1: 10, 2: 5}
+    # характеристики, отсутствующие в накладной, сохраняются и остаются в поисковом документе
+    assert ProductInfo.objects.get(id=good.id).search_document == \
+           'товар 1 model-1 вес 5 г характеристика 0 значение 1 характеристика 1 значение 1'
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('upsert', (True, False))
+def test_partner_update_queries(client_pytest, upsert):
+    """Проверяем, что количество запросов загрузки прайса не зависит от количества товаров,
+    в том числе на БД без INSERT ... ON CONFLICT"""
+
+    shop_client(client_pytest)
+    load_price_list(client_pytest, 'post', {'file': make_price_list('Связной', 1), 'url': 'http://sv.ru'})
+    queries_count = []
+    with patch.object(connection.features, 'supports_update_conflicts_with_target', upsert):
+        for goods_quantity in (5, 50):
+            file = make_price_list('Связной', goods_quantity, start_id=goods_quantity)
+            with CaptureQueriesContext(connection) as queries:
+                res = load_price_list(client_pytest, 'post', {'file': file})
+            assert res['Загружено/обновлено товаров'] == goods_quantity
+            queries_count.append(len([i for i in queries if 'silk_' not in i['sql']]))
+
+    assert queries_count[0] == queries_count[1]
+    assert ProductInfo.objects.count() == 56
+    assert ProductParameter.objects.count() == 112
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('upsert', (True, False))
+def test_partner_update_unchanged(client_pytest, upsert):
+    """Проверяем, что повторная загрузка того же прайса не перезаписывает товары, у товара с изменившимся только
+    количеством обновляется одно поле, а правка товара в обход прайса сбрасывает хеш содержимого"""
+
+    shop_client(client_pytest)
+    load_price_list(client_pytest, 'post', {'file': make_price_list('Связной', 5), 'url': 'http://sv.ru'})
+    goods = ProductInfo.objects.filter(shop__name='Связной').order_by('external_id')
+    assert all(goods.values_list('content_hash', flat=True))
+
+    with CaptureQueriesContext(connection) as queries:
+        res = load_price_list(client_pytest, 'post', {'file': make_price_list('Связной', 5)})
+    assert res == {'Status': True, 'Загружено/обновлено товаров': 5,
+                   'Создано товаров': 0, 'Обновлено товаров': 0, 'Без изменений': 5}
+    writes = [i['sql'] for i in queries if i['sql'].startswith(('INSERT', 'UPDATE')) and 'silk_' not in i['sql']]
+    assert not [i for i in writes if 'backend_productinfo' in i.split('SET')[0] or 'backend_productparameter' in i]
+
+    file = make_price_list('Связной', 5)
+    data = yaml.safe_load(file.read())
+    data['goods'][0]['quantity'] = 7
+    data['goods'][1]['price'] = 150
+    data['goods'].pop()
+    content = yaml.dump(data, allow_unicode=True).encode('utf-8')
+    with patch.object(connection.features, 'supports_update_conflicts_with_target', upsert):
+        res = load_price_list(client_pytest, 'post', {'file': SimpleUploadedFile('price.yaml', content)})
+    assert res == {'Status': True, 'Загружено/обновлено товаров': 4,
+                   'Создано товаров': 0, 'Обновлено товаров': 2, 'Без изменений': 2}
+    assert list(goods.values_list('quantity', 'price')) == [(7, 100), (10, 150), (10, 100), (10, 100), (0, 100)]
+
+    # сброшенный хеш - товар перезаписывается при следующей загрузке
+    goods.filter(external_id=3).update(content_hash='')
+    res = load_price_list(client_pytest, 'post', {'file': SimpleUploadedFile('price.yaml', content)})
+    assert (res['Обновлено товаров'], res['Без изменений']) == (1, 3)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('upsert', (True, False))
+def test_partner_update_receipt_ledger(client_pytest, upsert):
+    """Проверяем журнал движения остатков: POST записывает изменения остатков, PATCH прибавляет поставку
+    атомарным UPDATE - поставка, записанная между чтением товаров и записью другой поставки, не теряется"""
+
+    shop_client(client_pytest)
+    load_price_list(client_pytest, 'post', {'file': make_price_list('Связной', 2, quantity=5), 'url': 'http://sv.ru'})
+    shop = Shop.objects.get(name='Связной')
+    goods = ProductInfo.objects.filter(shop=shop).order_by('external_id')
+    assert list(StockMovement.objects.order_by('product_info__external_id').values_list('kind', 'quantity')) == \
+           [('reset', 5), ('reset', 5)]
+
+    get_content_hash = bulk_import.get_content_hash
+    receipts = []
+
+    def concurrent_receipt(good):  # вызывается после чтения остатков пачки
+        if not receipts:
+            receipts.append(good['id'])
+            GoodsImporter(shop, 'PATCH').import_goods(iter_price_list_goods(make_price_list('Связной', 2, quantity=2)))
+        return get_content_hash(good)
+
+    with patch.object(connection.features, 'supports_update_conflicts_with_target', upsert), \
+            patch('backend.utils.bulk_import.get_content_hash', side_effect=concurrent_receipt):
+        GoodsImporter(shop, 'PATCH').import_goods(iter_price_list_goods(make_price_list('Связной', 3, quantity=4)))
+    assert list(goods.values_list('external_id', 'quantity')) == [(1, 11), (2, 11), (3, 4)]
+    assert list(StockMovement.objects.filter(kind='receipt', product_info__external_id=1).
+                order_by('quantity').values_list('quantity', flat=True)) == [2, 4]
+
+    load_price_list(client_pytest, 'post', {'file': make_price_list('Связной', 1, quantity=3)})
+    assert list(goods.values_list('quantity', flat=True)) == [3, 0, 0]
+    assert list(StockMovement.objects.filter(kind='reset').order_by('-id')[:3].
+                values_list('product_info__external_id', 'quantity')) == [(3, -4), (2, -11), (1, -8)]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('method, quantities', (('post', [4, 4, 0]), ('patch', [9, 9, 5])))
+def test_partner_update_copy(client_pytest, settings, method, quantities):
+    """Проверяем загрузку через COPY (IMPORT_COPY): на PostgreSQL товары и характеристики записываются через
+    временную таблицу, на остальных БД - через bulk_create с тем же результатом"""
+
+    settings.IMPORT_COPY = True
+    shop_client(client_pytest)
+    load_price_list(client_pytest, 'post', {'file': make_price_list('Связной', 3, quantity=5), 'url': 'http://sv.ru'})
+    file = make_price_list('Связной', 2, quantity=4, price=120)
+    with patch('backend.utils.bulk_import.copy_upsert', wraps=copy_upsert) as copy:
+        res = load_price_list(client_pytest, method, {'file': file})
+
+    assert copy.call_count == (2 if connection.vendor == 'postgresql' else 0)  # товары и характеристики пачки
+    assert res == {'Status': True, 'Загружено/обновлено товаров': 2,
+                   'Создано товаров': 0, 'Обновлено товаров': 2, 'Без изменений': 0}
+    goods = ProductInfo.objects.filter(shop__name='Связной').order_by('external_id')
+    assert list(goods.values_list('quantity', flat=True)) == quantities
+    assert list(goods.values_list('price', flat=True)) == [120, 120, 100]
+    assert ProductParameter.objects.filter(product__shop__name='Связной').count() == 6
+
+
+def test_copy_value():
+    """Проверяем представление значений в текстовом формате COPY"""
+
+    assert [copy_value(value) for value in (None, True, False, 5, '')] == ['\\N', 't', 'f', '5', '']
+    assert copy_value('а\tб\nв\\г\r') == 'а\\tб\\nв\\\\г\\r'
+
+
+@pytest.mark.django_db
+def test_admin_stock_correction(client_pytest):
+    """Проверяем, что изменение остатка в админке записывается в журнал разницей с текущим остатком"""
+
+    good = make_productinfo(1)[0]
+    ProductInfo.objects.filter(id=good.id).update(quantity=5)
+    model_admin = ProductInfoAdmin(ProductInfo, AdminSite())
+    form = modelform_factory(ProductInfo, fields=['quantity'])({'quantity': 2}, instance=good)
+    assert form.is_valid()
+
+    ProductInfo.objects.filter(id=good.id).update(quantity=6)  # поставка после открытия формы
+    model_admin.save_model(None, form.save(commit=False), form, True)
+    good.refresh_from_db()
+    assert good.quantity == 2
+    assert list(StockMovement.objects.values_list('kind', 'quantity')) == [('correction', -4)]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('method, quantities', (
+        ('post', {1: 2, 2: 10, 3: 10, 4: 10, 5: 10, 50: 0}),
+        ('patch', {1: 12, 2: 10, 3: 10, 4: 10, 5: 10, 50: 3}),
+))
+def test_partner_update_parallel(client_pytest, celery_eager, settings, method, quantities):
+    """Проверяем параллельную загрузку: пачки товаров записываются задачами chord, повтор артикула из уже
+    сформированной пачки записывается после всех пачек, итоги пачек объединяются в callback. Прайс читается
+    один раз при разбиении, каждая задача читает только файл своей пачки"""
+
+    settings.IMPORT_PARALLEL = True
+    user = shop_client(client_pytest)
+    shop = baker.make(Shop, name='Связной', user=user)
+    baker.make(ProductInfo, shop=shop, external_id=50, quantity=3,
+               product=baker.make(Product, category=baker.make(Category, name='Смартфоны'), name='Старый товар'))
+
+    file = make_price_list('Связной', 5)
+    data = yaml.safe_load(file.read())
+    data['goods'].append(dict(data['goods'][0], quantity=2))
+    file = SimpleUploadedFile('price.yaml', yaml.dump(data, allow_unicode=True).encode('utf-8'))
+    read_job_slice, slices = bulk_import.read_job_slice, []
+
+    def read_slice(job, name):
+        goods = read_job_slice(job, name)
+        slices.append([good['id'] for good in goods])
+        return goods
+
+    with patch('backend.utils.bulk_import.IMPORT_CHUNK_SIZE', 2), \
+            patch('backend.utils.bulk_import.iter_price_list_goods', wraps=iter_price_list_goods) as read_price, \
+            patch('backend.utils.bulk_import.read_job_slice', side_effect=read_slice):
+        res = load_price_list(client_pytest, method, {'file': file})
+
+    # пачки [1, 2], [3, 4], [5] читаются из своих файлов, повтор артикула 1 отложен после всех пачек
+    assert read_price.call_count == 1
+    assert slices == [[1, 2], [3, 4], [5], [1]]
+    assert not os.listdir(Path(settings.IMPORT_ROOT) / bulk_import.IMPORT_SLICE_DIR)
+    assert res == {'Status': True, 'Загружено/обновлено товаров': 6,
+                   'Создано товаров': 5, 'Обновлено товаров': 1, 'Без изменений': 0}
+    assert dict(ProductInfo.objects.filter(shop=shop).values_list('external_id', 'quantity')) == quantities
+    good = ProductInfo.objects.get(shop=shop, external_id=1)
+    assert (good.product.best_offer_id, good.product.offers_count) == (good.id, 1)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('method, writer, created, written, quantities', (
+        # POST пишет пачки в промежуточную таблицу: до применения остатки магазина не меняются
+        ('post', '_stage', 0, {50}, {1: 10, 2: 10, 3: 10, 4: 10, 5: 10, 50: 0}),
+        ('patch', '_write', 2, {1, 2, 50}, {1: 10, 2: 10, 3: 10, 4: 10, 5: 10, 50: 3}),
+))
+def test_partner_update_resume(client_pytest, method, writer, created, written, quantities):
+    """Проверяем возобновление прерванной загрузки: пачки до прерывания и контрольная точка записаны вместе,
+    возобновленная загрузка пропускает их без повторной записи, итог совпадает с непрерывной загрузкой"""
+
+    user = shop_client(client_pytest)
+    shop = baker.make(Shop, name='Связной', user=user)
+    baker.make(ProductInfo, shop=shop, external_id=50, quantity=3,
+               product=baker.make(Product, category=baker.make(Category, name='Смартфоны'), name='Старый товар'))
+    file = make_price_list('Связной', 5)
+    write = getattr(GoodsImporter, writer)
+
+    def interrupt(importer, goods):  # воркер прерывается на записи второй пачки
+        if 3 in goods:
+            raise ConnectionError('Воркер остановлен')
+        write(importer, goods)
+
+    with patch('backend.utils.bulk_import.IMPORT_CHUNK_SIZE', 2), \
+            patch('backend.views.task_import_price_list.delay', side_effect=task_import_price_list), \
+            patch.object(GoodsImporter, writer, interrupt), pytest.raises(ConnectionError):
+        getattr(client_pytest, method)(reverse('partner_update'), data={'file': file}, format='multipart')
+
+    job = ImportJob.objects.get()
+    assert (job.state, job.errors, job.resumable) == ('failed', {'Error': 'Воркер остановлен'}, True)
+    assert (job.checkpoint, job.checkpoint_id, job.loaded, job.created) == (2, 2, 2, created)
+    assert set(ProductInfo.objects.filter(shop=shop).values_list('external_id', flat=True)) == written
+
+    import_chunk = GoodsImporter.import_chunk
+    with patch('backend.utils.bulk_import.IMPORT_CHUNK_SIZE', 2), \
+            patch('backend.tasks.task_import_price_list.delay', side_effect=task_import_price_list), \
+            patch.object(GoodsImporter, 'import_chunk', autospec=True, side_effect=import_chunk) as mock_chunk:
+        call_command('resumeimports')
+
+    assert [[good['id'] for good in call.args[1]] for call in mock_chunk.call_args_list] == [[3, 4], [5]]
+    job.refresh_from_db()
+    assert (job.state, job.result) == ('done', {'Status': True, 'Загружено/обновлено товаров': 5,
+                                                'Создано товаров': 5, 'Обновлено товаров': 0, 'Без изменений': 0})
+    assert dict(ProductInfo.objects.filter(shop=shop).values_list('external_id', 'quantity')) == quantities
+    assert not job.file
+    assert not StagedGood.objects.exists()
+
+
+@pytest.mark.django_db
+def test_partner_update_staging(client_pytest):
+    """Проверяем POST через промежуточную таблицу: новые и изменившиеся товары готовятся пачками без изменения
+    остатков, разница применяется одной транзакцией: при ошибке ее применения товары, остатки и предложения остаются
+    прежними, после возобновления применяются без повторной подготовки и без двойного счета товаров в итогах"""
+
+    user = shop_client(client_pytest)
+    load_price_list(client_pytest, 'post', {'file': make_price_list('Связной', 5), 'url': 'http://sv.ru'})
+    shop = Shop.objects.get(user=user)
+    before = list(ProductInfo.objects.filter(shop=shop).order_by('external_id').values_list(
+        'external_id', 'quantity', 'price', 'product__offers_count'))
+
+    data = yaml.safe_load(make_price_list('Связной', 5).read())
+    data['goods'][1]['quantity'] = 4  # изменилось только количество
+    data['goods'][2]['price'] = 90  # изменилась цена
+    data['goods'][4].update(id=6, name='Товар 6')  # товара 5 нет в прайсе, товар 6 новый
+    file = SimpleUploadedFile('price.yaml', yaml.dump(data, allow_unicode=True).encode('utf-8'))
+    progress = []
+
+    def stop_on_offers(product_ids):  # применение прерывается в конце транзакции, на пересчете предложений
+        job = ImportJob.objects.get(state='running')
+        progress.append((job.processed, job.loaded))
+        raise ConnectionError('Воркер остановлен')
+
+    with patch('backend.views.task_import_price_list.delay', side_effect=task_import_price_list), \
+            patch('backend.models.Product.update_offers', side_effect=stop_on_offers), \
+            pytest.raises(ConnectionError):
+        client_pytest.post(reverse('partner_update'), data={'file': file}, format='multipart')
+
+    job = ImportJob.objects.get(state='failed')
+    assert progress == [(5, 5)]  # каждый товар учтен один раз
+    assert (job.checkpoint, job.resumable, StagedGood.objects.filter(job=job).count()) == (5, True, 5)
+    # подготовлены товары 3 и 6, в каталоге ничего не изменилось
+    assert StagedGood.objects.filter(job=job, product__isnull=False).count() == 2
+    assert list(ProductInfo.objects.filter(shop=shop).order_by('external_id').values_list(
+        'external_id', 'quantity', 'price', 'product__offers_count')) == before
+    assert not StockMovement.objects.filter(product_info__shop=shop, kind='reset', quantity__lt=10).exists()
+
+    with patch('backend.tasks.task_import_price_list.delay', side_effect=task_import_price_list):
+        call_command('resumeimports')
+    job.refresh_from_db()
+    assert job.result == {'Status': True, 'Загружено/обновлено товаров': 5,
+                          'Создано товаров': 1, 'Обновлено товаров': 2, 'Без изменений': 2}
+    assert list(ProductInfo.objects.filter(shop=shop).order_by('external_id').values_list(
+        'external_id', 'quantity', 'price', 'product__offers_count')) == \
+        [(1, 10, 100, 1), (2, 4, 100, 1), (3, 10, 90, 1), (4, 10, 100, 1), (5, 0, 100, 0), (6, 10, 100, 1)]
+    assert list(StockMovement.objects.filter(product_info__shop=shop).exclude(quantity=10).
+                order_by('product_info__external_id').values_list('product_info__external_id', 'quantity')) == \
+        [(2, -6), (5, -10)]
+    assert StockMovement.objects.filter(product_info__external_id=6).values_list('quantity', flat=True).get() == 10
+    assert ProductParameter.objects.filter(product__external_id=6).count() == \
+        ProductParameter.objects.filter(product__external_id=1).count() > 0
+    assert not StagedGood.objects.exists() and not StagedParameter.objects.exists()
+    # денормализованное наименование продукта записывается применением вместе с товаром
+    assert not ProductInfo.objects.exclude(name=F('product__name')).exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('fail', ('summary', 'import_chunk'))
+def test_import_shard_error(fail):
+    """Проверяем, что процесс шарда при ошибке разбирает очередь пачек только до конца шарда: ошибка после
+    получения конца шарда не ждет пачек из пустой очереди"""
+
+    class Chunks(list):  # очередь без ожидания: пустая очередь - IndexError вместо блокировки
+        def get(self):
+            return self.pop(0)
+
+    chunks, results = Chunks([[{'id': 1}], [{'id': 2}], None]), Chunks()
+    results.put = results.append
+    with patch.object(bulk_import.GoodsImporter, fail, side_effect=ValueError('ошибка записи')), \
+            patch('backend.utils.bulk_import.connections'):
+        bulk_import._import_shard(1, baker.make(Shop).id, 'POST', 10, chunks, results)
+    assert (chunks, results) == ([], [{'error': 'ValueError: ошибка записи'}])
+
+
+@pytest.mark.django_db
+def test_importshop(tmp_path):
+    """Проверяем загрузку прайса командой importshop: создание магазина и категорий, POST и PATCH с той же
+    семантикой, что и PartnerUpdate, объединение ошибок шардов; на SQLite загрузка идет в одном процессе"""
+
+    user = User.objects.create_user(email='shop@m.ru', is_active=True, type='shop')
+    baker.make(ProductInfo, external_id=50, quantity=3, shop=baker.make(Shop, name='Евросеть'),
+               product=baker.make(Product, category=baker.make(Category, name='Смартфоны')))
+    path = tmp_path / 'price.yaml'
+    path.write_bytes(make_price_list('Связной', 5).read())
+    with pytest.raises(CommandError, match='не найден'):
+        call_command('importshop', str(path))
+
+    call_command('importshop', str(path), '--user', 'shop@m.ru', '--url', 'http://sv.ru', stdout=StringIO())
+    shop = Shop.objects.get(name='Связной', user=user)
+    assert ImportJob.objects.get(shop=shop).result == {'Status': True, 'Загружено/обновлено товаров': 5,
+                                                       'Создано товаров': 5, 'Обновлено товаров': 0,
+                                                       'Без изменений': 0}
+
+    data = yaml.safe_load(make_price_list('Связной', 3, quantity=5, start_id=4).read())
+    data['goods'].append({'id': 8, 'category': 1})
+    path.write_bytes(yaml.dump(data, allow_unicode=True).encode('utf-8'))
+    out, err = StringIO(), StringIO()
+    call_command('importshop', str(path), '--method', 'PATCH', '--workers', '2', stdout=out, stderr=err)
+    assert err.getvalue() == 'SQLite: загрузка выполняется в одном процессе\n'
+    result = json.loads(out.getvalue())
+    assert result['Загружено/обновлено товаров'] == 3
+    assert result['Не удалось добавить товаров на остатки/обновить'] == 1
+    assert result['Errors'][0]['product_info_creation_failed'][0] == 8
+    assert dict(ProductInfo.objects.filter(shop=shop).values_list('external_id', 'quantity')) == \
+           {1: 10, 2: 10, 3: 10, 4: 15, 5: 15, 6: 5}
+    assert ProductInfo.objects.get(external_id=50).quantity == 3
+
+
+@pytest.mark.django_db
+def test_partner_update_resume_file_changed(client_pytest):
+    """Проверяем, что загрузка, прайс которой не совпадает с контрольной точкой, завершается ошибкой окончательно:
+    файл прайса и промежуточные товары удаляются, повторно загрузка не возобновляется; загрузка, пачки которой
+    записаны без контрольной точки, не возобновляется вовсе"""
+
+    user = shop_client(client_pytest)
+    shop = baker.make(Shop, name='Связной', user=user)
+    job = ImportJob.objects.create(shop=shop, method='PATCH', state='failed', loaded=2, checkpoint=2, checkpoint_id=7,
+                                   file=make_price_list('Связной', 5))
+    parallel = ImportJob.objects.create(shop=shop, method='PATCH', state='failed', loaded=2,
+                                        file=make_price_list('Связной', 5))
+    baker.make(StagedGood, job=job, _quantity=2)
+
+    with patch('backend.tasks.task_import_price_list.delay', side_effect=task_import_price_list), \
+            pytest.raises(ValueError, match='не совпадает с контрольной точкой'):
+        call_command('resumeimports', job.id)
+    job.refresh_from_db()
+    assert (job.state, job.attempts, job.file.name, job.resumable) == ('failed', 1, '', False)
+    assert not ProductInfo.objects.exists() and not StagedGood.objects.exists()
+    with patch('backend.tasks.task_import_price_list.delay') as mock_delay:
+        call_command('resumeimports', job.id)
+    mock_delay.assert_not_called()
+
+    with patch('backend.tasks.task_import_price_list.delay') as mock_delay:
+        call_command('resumeimports', parallel.id)
+    assert not parallel.resumable
+    mock_delay.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_resume_imports_stale(client_pytest):
+    """Проверяем, что возобновляются только загрузки с ошибкой и загрузки running без записи прогресса дольше
+    таймаута, а захваченная загрузка не ставится в очередь повторно"""
+
+    shop = baker.make(Shop, name='Связной', user=shop_client(client_pytest))
+    failed, fresh, stale = (ImportJob.objects.create(shop=shop, method='PATCH', state=state,
+                                                     file=make_price_list('Связной', 5))
+                            for state in ('failed', 'running', 'running'))
+    ImportJob.objects.filter(id=stale.id).update(updated_at=timezone.now() - timedelta(hours=1))
+
+    with patch('backend.tasks.task_import_price_list.delay') as mock_delay:
+        call_command('resumeimports', stdout=StringIO())
+        assert sorted(call.args[0] for call in mock_delay.call_args_list) == [failed.id, stale.id]
+        assert set(ImportJob.objects.values_list('state', flat=True)) == {'running'}
+
+        mock_delay.reset_mock()
+        call_command('resumeimports', stdout=StringIO())  # захваченные загрузки обновлены только что
+        mock_delay.assert_not_called()
+
+        call_command('resumeimports', fresh.id, '--timeout', '0', stdout=StringIO())
+        mock_delay.assert_called_once_with(fresh.id)
+
+
+@pytest.mark.django_db
+def test_resume_imports_attempts(client_pytest):
+    """Проверяем, что загрузка, прерванная на каждой из IMPORT_MAX_ATTEMPTS попыток, больше не возобновляется:
+    завершается ошибкой с удалением файла прайса и промежуточных товаров"""
+
+    shop = baker.make(Shop, name='Связной', user=shop_client(client_pytest))
+    failed, stale = (ImportJob.objects.create(shop=shop, method='POST', state=state, attempts=attempts,
+                                              file=make_price_list('Связной', 5))
+                     for state, attempts in (('failed', 2), ('running', 3)))
+    ImportJob.objects.filter(id=stale.id).update(updated_at=timezone.now() - timedelta(hours=1))
+    baker.make(StagedGood, job=stale, _quantity=2)
+
+    # последняя попытка загрузки прерывается ошибкой записи пачки
+    with patch('backend.tasks.task_import_price_list.delay', side_effect=task_import_price_list), \
+            patch.object(GoodsImporter, 'import_chunk', side_effect=ConnectionError('Воркер остановлен')), \
+            pytest.raises(ConnectionError):
+        call_command('resumeimports', failed.id, stdout=StringIO())
+    failed.refresh_from_db()
+    assert (failed.state, failed.attempts, failed.file.name) == ('failed', 3, '')
+    assert not StagedGood.objects.filter(job=failed).exists()
+
+    with patch('backend.tasks.task_import_price_list.delay') as mock_delay:
+        call_command('resumeimports', stdout=StringIO())
+    mock_delay.assert_not_called()
+    stale.refresh_from_db()
+    assert (stale.state, stale.errors, stale.file.name) == ('failed', {'Error': 'Загрузка прервана, попыток: 3'}, '')
+    assert not StagedGood.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('method', ('post', 'patch'))
+def test_partner_update_dry_run(client_pytest, method):
+    """Проверяем проверку прайса без загрузки: конфликты категорий, товары с несуществующей категорией и
+    некорректными полями попадают в отчет, запись в БД не выполняется, количество запросов не зависит от прайса"""
+
+    user = shop_client(client_pytest)
+    baker.make(Shop, name='Связной', user=user)
+    baker.make(Category, id=5, name='Кабели')
+    data = {
+        'shop': 'Связной',
+        'categories': [{'id': 1, 'name': 'Смартфоны'}, {'id': 2, 'name': 'Кабели'}, {'id': 1, 'name': 'Телефоны'},
+                       {'id': 3}],
+        'goods': [
+            {'id': 1, 'category': 1, 'name': 'Смартфон', 'price': 100, 'price_rrc': 110, 'quantity': 1},
+            {'id': 2, 'category': 18, 'name': 'Чехол', 'price': 100, 'price_rrc': 110, 'quantity': 1},
+            {'id': 3, 'category': 5, 'name': 'Кабель', 'price': 'дорого', 'price_rrc': 110, 'quantity': 1},
+            {'id': 4, 'category': 5, 'name': 'Кабель', 'price': 100, 'price_rrc': 110, 'quantity': 1},
+            {'id': 5, 'category': 2, 'name': 'Зарядка', 'price': 100, 'price_rrc': 110, 'quantity': 1},
+        ] * 20,
+    }
+    file = SimpleUploadedFile('price.yaml', yaml.dump(data, allow_unicode=True).encode('utf-8'))
+    with patch('backend.views.task_import_price_list.delay') as mock_delay, \
+            CaptureQueriesContext(connection) as queries:
+        res = getattr(client_pytest, method)(f'{reverse("partner_update")}?dry_run=1', data={'file': file},
+                                             format='multipart')
+    assert res.status_code == 200
+    report = res.json()
+    assert (report['Status'], report['Товаров в прайсе'], report['Товаров без ошибок']) == (False, 100, 40)
+    assert report['Не удалось создать категорий'] == 3
+    assert report['Не удалось добавить товаров на остатки/обновить'] == 60
+    assert report['Errors'][:6] == [
+        {'category_creation_failed': [2, 'Кабели', ValidateError.CATEGORY_NAME_TAKEN.value]},
+        {'category_creation_failed': [1, 'Телефоны', ValidateError.CATEGORY_ID_TAKEN.value]},
+        {'category_creation_failed': [3, None, ValidateError.CATEGORY_FORMAT_WRONG.value]},
+        {'product_info_creation_failed': [2, 'Чехол', f'{ValidateError.GOOD_CATEGORY_NOT_FOUND.value}: 18']},
+        {'product_info_creation_failed': [3, 'Кабель', f'{ValidateError.GOOD_FIELD_WRONG.value}: price']},
+        {'product_info_creation_failed': [5, 'Зарядка', f'{ValidateError.GOOD_CATEGORY_NOT_FOUND.value}: 2']},
+    ]
+    # категории прайса и категории товаров проверяются двумя запросами, ничего не записывается
+    assert len([i for i in queries if i['sql'].startswith('SELECT "backend_category"')]) == 2
+    assert not mock_delay.called
+    assert not [i for i in queries if i['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and 'silk_' not in i['sql']]
+    assert not ImportJob.objects.exists()
+    assert list(Category.objects.values_list('id', flat=True)) == [5]
+
+
+@pytest.mark.django_db
+def test_partner_update_dry_run_new_shop(client_pytest):
+    """Проверяем, что проверка прайса нового магазина не создает магазин"""
+
+    shop_client(client_pytest)
+    file = make_price_list('Новый магазин', 3, categories=[{'id': 1, 'name': 'Смартфоны'}])
+    res = client_pytest.post(f'{reverse("partner_update")}?dry_run=true', data={'file': file, 'url': 'http://n.ru'},
+                             format='multipart')
+    assert res.status_code == 200
+    assert res.json() == {'Status': True, 'Товаров в прайсе': 3, 'Товаров без ошибок': 3}
+    assert not Shop.objects.exists()
+    assert not Category.objects.exists()
+
+
+@pytest.mark.django_db
+def test_partner_update_job(client_pytest):
+    """Проверяем, что загрузка прайса возвращает id задачи сразу, а прогресс пишется воркером после каждой пачки
+    и доступен только менеджеру магазина"""
+
+    shop_client(client_pytest)
+    with patch('backend.views.task_import_price_list.delay') as mock_delay:
+        res = client_pytest.post(reverse('partner_update'),
+                                 data={'file': make_price_list('Связной', 5), 'url': 'http://sv.ru'},
+                                 format='multipart')
+    job_id = res.json()['job_id']
+    mock_delay.assert_called_once_with(job_id)
+    assert res.json()['url'].endswith(reverse('partner_update_job', args=[job_id]))
+
+    job = client_pytest.get(reverse('partner_update_job', args=[job_id])).json()
+    assert (job['state'], job['processed'], job['result']) == \
+           ('new', 0, {'Status': False, 'Загружено/обновлено товаров': 0,
+                       'Создано товаров': 0, 'Обновлено товаров': 0, 'Без изменений': 0})
+
+    progress = []
+    import_chunk = GoodsImporter.import_chunk
+
+    def import_chunk_spy(importer, goods):
+        result = import_chunk(importer, goods)
+        job_now = ImportJob.objects.get(id=job_id)
+        progress.append((job_now.state, job_now.processed, job_now.loaded))
+        return result
+
+    with patch('backend.utils.bulk_import.IMPORT_CHUNK_SIZE', 2), \
+            patch.object(GoodsImporter, 'import_chunk', import_chunk_spy):
+        task_import_price_list(job_id)
+    assert progress == [('running', 2, 2), ('running', 4, 4), ('running', 5, 5)]
+
+    job = client_pytest.get(reverse('partner_update_job', args=[job_id])).json()
+    assert (job['state'], job['total'], job['processed'], job['loaded'], job['failed']) == ('done', 5, 5, 5, 0)
+    assert job['finished_at']
+    assert not ImportJob.objects.get(id=job_id).file  # файл прайса удален после загрузки
+
+    shop_client(client_pytest, email='other@m.ru')
+    res = client_pytest.get(reverse('partner_update_job', args=[job_id]))
+    assert res.status_code == 404
+    assert res.json() == Error.IMPORT_JOB_NOT_EXIST.value
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('method, stages', (
+        ('post', {'header', 'categories', 'parse', 'clean', 'staging', 'apply', 'compare', 'products',
+                  'product_infos', 'parameters', 'stock', 'offers', 'index'}),
+        ('patch', {'header', 'categories', 'parse', 'clean', 'compare', 'products', 'product_infos', 'parameters',
+                   'stock', 'offers', 'index'}),
+))
+def test_partner_update_stats(client_pytest, settings, method, stages):
+    """Проверяем метрики загрузки: время, запросы к БД и пик памяти по этапам и пачкам в прогрессе задачи
+    и строки лога JSON по каждой пачке и по завершении загрузки"""
+
+    settings.IMPORT_TRACE_MEMORY = True
+    user = shop_client(client_pytest)
+    if method == 'patch':
+        baker.make(Shop, name='Связной', user=user)
+    with patch('backend.utils.bulk_import.IMPORT_CHUNK_SIZE', 2), \
+            patch('backend.utils.import_stats.logger') as logger, \
+            patch('backend.views.task_import_price_list.delay', side_effect=task_import_price_list):
+        res = getattr(client_pytest, method)(reverse('partner_update'), format='multipart',
+                                             data={'file': make_price_list('Связной', 5), 'url': 'http://sv.ru'})
+    job = client_pytest.get(reverse('partner_update_job', args=[res.json()['job_id']])).json()
+
+    assert set(job['stats']['stages']) == stages
+    for name, metrics in job['stats']['stages'].items():
+        assert metrics['calls'] >= 1 and metrics['time'] >= metrics['query_time'] >= 0
+        assert metrics['peak_memory_mb'] > 0
+    assert job['stats']['stages']['product_infos']['queries'] >= 2  # upsert и загрузка id новых товаров
+    assert job['stats']['stages']['parse']['calls'] == 4  # 3 пачки и конец прайса
+    assert [(batch['batch'], batch['goods']) for batch in job['stats']['batches']] == [(1, 2), (2, 2), (3, 1)]
+    assert all(batch['queries'] and batch['peak_memory_mb'] for batch in job['stats']['batches'])
+
+    lines = [json.loads(call.args[0]) for call in logger.info.call_args_list]
+    assert [line['event'] for line in lines] == ['import_batch'] * 3 + ['import_done']
+    assert {line['job_id'] for line in lines} == {job['id']}
+    assert (lines[-1]['loaded'], lines[-1]['batches'], lines[-1]['stages']) == (5, 3, job['stats']['stages'])
+
+
+@pytest.mark.parametrize('file_name', ('shop_post.yaml', 'shop_patch.yaml'))
+def test_price_list_parser(file_name):
+    """Проверяем, что потоковое чтение прайса дает те же магазин, категории и товары, что и yaml.safe_load"""
+
+    path = Path(__file__).parents[2] / file_name
+    data = yaml.safe_load(path.read_bytes())
+    with open(path, 'rb') as file:
+        assert read_price_list_header(file) == {'shop': data['shop'], 'categories': data['categories']}
+    with open(path, 'rb') as file:
+        assert list(iter_price_list_goods(file)) == data['goods']
+
+
+@pytest.mark.parametrize('price_format', ('csv', 'jsonl'))
+@pytest.mark.parametrize('file_name', ('shop_post.yaml', 'shop_patch.yaml'))
+def test_price_list_parser_formats(file_name, price_format):
+    """Проверяем, что прайс в csv и jsonl читается в те же магазин, категории и товары, что и в yaml
+    (значения csv - строки, поэтому товары сравниваются после проверки clean_good)"""
+
+    data = yaml.safe_load((Path(__file__).parents[2] / file_name).read_bytes())
+    content = dump_price_list(data, price_format)
+    header = read_price_list_header(BytesIO(content), price_format)
+    # в csv категории указываются в строках товаров: в заголовок попадают категории, на которые ссылаются товары
+    categories = [i for i in data['categories'] if i['id'] in {good['category'] for good in data['goods']}] \
+        if price_format == 'csv' else data['categories']
+    assert header['shop'] == data['shop']
+    assert sorted(header['categories'], key=lambda i: i['id']) == sorted(categories, key=lambda i: i['id'])
+    goods = list(iter_price_list_goods(BytesIO(content), price_format))
+    assert [clean_good(i, None) for i in goods] == [clean_good(i, None) for i in data['goods']]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('price_format', ('csv', 'jsonl'))
+def test_partner_update_formats(client_pytest, price_format):
+    """Проверяем, что прайс и накладная в csv и jsonl загружаются так же, как в yaml"""
+
+    results, states = [], []
+    for file_name, shop_name in (('price.yaml', 'Связной'), (f'price.{price_format}', 'Евросеть')):
+        shop_client(client_pytest, email=f'{shop_name}@m.ru')
+        file = make_price_list(shop_name, 5, file_name=file_name)
+        results.append(load_price_list(client_pytest, 'post', {'file': file, 'url': 'http://sv.ru'}))
+        file = make_price_list(shop_name, 3, quantity=5, price=90, start_id=4, file_name=file_name)
+        results.append(load_price_list(client_pytest, 'patch', {'file': file}))
+        states.append(list(ProductInfo.objects.filter(shop__name=shop_name).order_by('external_id').values_list(
+            'external_id', 'quantity', 'price', 'model', 'description', 'search_document', 'product__name')))
+
+    assert results[:2] == results[2:]
+    assert states[0] == states[1]
+
+
+@pytest.mark.django_db
+def test_partner_update_csv_header(client_pytest):
+    """Проверяем, что при запросе загрузки csv-прайса читается только начало файла с магазином, а категории
+    из строк товаров создает воркер перед загрузкой товаров"""
+
+    shop_client(client_pytest)
+    categories = [{'id': 1, 'name': 'Смартфоны'}, {'id': 2, 'name': 'Аксессуары'}]
+    file = make_price_list('Связной', 300, categories, file_name='price.csv')
+    iter_lines, lines = price_list._iter_lines, []
+
+    def read_lines(file):
+        for line in iter_lines(file):
+            lines.append(line)
+            yield line
+
+    with patch('backend.views.task_import_price_list.delay') as delay, \
+            patch('backend.utils.price_list._iter_lines', side_effect=read_lines):
+        res = client_pytest.post(reverse('partner_update'), data={'file': file, 'url': 'http://sv.ru'},
+                                 format='multipart')
+    assert res.status_code == 202
+    assert len(lines) < 5 and not Category.objects.exists()
+
+    task_import_price_list(*delay.call_args.args)
+    assert sorted(Category.objects.values_list('id', 'name')) == [(1, 'Смартфоны'), (2, 'Аксессуары')]
+    job = ImportJob.objects.get()
+    assert (job.state, job.created, job.failed) == ('done', 300, 0)
+    assert 'categories' in job.stats['stages']
+
+
+def test_price_list_parser_memory(tmp_path):
+    """Проверяем, что пиковая память потокового чтения товаров не растет с размером прайса"""
+
+    peaks = []
+    for goods_quantity in (200, 2000):
+        path = tmp_path / f'{goods_quantity}.yaml'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('shop: Связной\ncategories:\n  - id: 1\n    name: Смартфоны\ngoods:\n')
+            for i in range(goods_quantity):
+                file.write(f'  - id: {i}\n    category: 1\n    model: model-{i}\n    name: Товар {i}\n'
+                           f'    price: 100\n    price_rrc: 110\n    quantity: 5\n    description: Описание {i}\n'
+                           f'    parameters:\n      "Цвет": красный\n      "Длина": {i} м\n')
+
+        tracemalloc.start()
+        with open(path, 'rb') as file:
+            assert sum(1 for _ in iter_price_list_goods(file)) == goods_quantity
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    assert peaks[1] < peaks[0] * 1.5
+
+
+@pytest.mark.django_db
+def test_import_benchmark(celery_eager):
+    """Проверяем этапы бенчмарка загрузки на маленьком прайсе и сравнение с baseline"""
+
+    from benchmarks.import_price_list import make_stages, run_stages, compare
+    from benchmarks.parse_price_list import make_catalog
+
+    results = run_stages(make_stages(make_catalog(20)), 20)
+    assert list(results) == ['post_new', 'post_unchanged', 'post_price', 'post_quantity', 'patch']
+    assert [(i['created'], i['updated'], i['unchanged']) for i in results.values()] == \
+           [(20, 0, 0), (0, 0, 20), (0, 20, 0), (0, 20, 0), (0, 20, 0)]
+    assert all(i['import_queries'] < i['queries'] for i in results.values())
+    assert {'parse', 'product_infos', 'index'} <= results['post_new']['import_stages'].keys()
+
+    baseline = {'stages': {'post_new': dict(results['post_new'], queries=results['post_new']['queries'] - 1)}}
+    assert compare({'stages': results}, baseline, 0.25) == \
+           [f'post_new.queries: {results["post_new"]["queries"] - 1} -> {results["post_new"]["queries"]}']
+
+
+@pytest.mark.parametrize('file_name', ('shop_post.yaml', 'shop_patch.yaml'))
+def test_get_data_from_yaml_file(file_name):
+    """Проверяем, что однопроходный разбор прайса совпадает с yaml.safe_load, в том числе типы значений (дробные
+    числа, логические, пустые), а товар без характеристик и многострочное описание не теряются"""
+
+    content = (Path(__file__).parents[2] / file_name).read_bytes()
+    assert get_data_from_yaml_file(BytesIO(content)) == yaml.safe_load(content)
+
+    content = 'shop: Связной\ngoods:\n  - id: 1\n    name: Товар\n    description: Первая строка,\n' \
+              '      вторая строка\n    price: 99.90\n    parameters:\n      "Цвет": красный\n      Вес: 0.5\n' \
+              '      Влагозащита: yes\n  - id: 2\n    name: "Товар: без характеристик"\n    model:\n' \
+              '    description: 2023\n'.encode('utf-8')
+    assert get_data_from_yaml_file(BytesIO(content)) == yaml.safe_load(content)
+
+    # комментарии вне кавычек отбрасываются, '#' в кавычках и внутри слова - часть значения, пустой раздел - None
+    content = 'shop: A # магазин\ncategories:\ngoods: # товары\n# товар 1\n  - id: 1  # артикул\n' \
+              "    name: 'it''s # не комментарий'\n    model: \"a\\\"b # x\"\n    description: text#hash\n" \
+              '      продолжение # хвост\n    parameters:\n      "Диагональ: дюйм": 5.5 # дюймы\n' \
+              "      'Цвет': \"#fff\"\n  - id: 2\n    name: Товар\n".encode('utf-8')
+    assert get_data_from_yaml_file(BytesIO(content)) == yaml.safe_load(content)
+
+
+@pytest.mark.parametrize('file_name', ('shop_post.yaml', 'shop_patch.yaml'))
+def test_price_list_yaml_without_libyaml(file_name):
+    """Проверяем, что без C-парсера libyaml yaml-прайс читается однопроходным разбором с тем же результатом"""
+
+    content = (Path(__file__).parents[2] / file_name).read_bytes()
+    expected = read_price_list_header(BytesIO(content)), list(iter_price_list_goods(BytesIO(content)))
+    with patch('backend.utils.price_list.PriceListLoader', None), \
+            patch('backend.utils.price_list.iter_yaml_items', wraps=price_list.iter_yaml_items) as tokenizer:
+        assert (read_price_list_header(BytesIO(content)), list(iter_price_list_goods(BytesIO(content)))) == expected
+    assert tokenizer.call_count == 2
+
+
+@pytest.mark.django_db
+def test_partner_update_file_incorrect(client_pytest):
+    """Проверяем, что прайс с некорректной структурой отклоняется до постановки загрузки в очередь"""
+
+    shop_client(client_pytest)
+    with patch('backend.views.task_import_price_list.delay') as mock_delay:
+        for name, content in (('price.yaml', b'shop: [\n'), ('price.yaml', b'- 1\n- 2\n'), ('price.txt', b'shop: 1'),
+                              ('price.jsonl', b'[1, 2]\n'), ('price.jsonl', b'{"shop": \n'),
+                              ('price.csv', 'shop\nСвязной\n'.encode('cp1251'))):
+            res = client_pytest.post(reverse('partner_update'), format='multipart',
+                                     data={'file': SimpleUploadedFile(name, content), 'url': 'http://sv.ru'})
+            assert res.status_code == 400
+            assert res.json() == Error.FILE_INCORRECT.value
+    mock_delay.assert_not_called()
+
 # noinspection PyUnresolvedReferences
 @pytest.mark.django_db
 @pytest.mark.parametrize(
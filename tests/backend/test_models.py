@@ -3,7 +3,8 @@ from django.db import transaction, IntegrityError
 from django.urls import reverse
 from model_bakery import baker
 
-from backend.models import Shop, Category, Product, ProductInfo, User
+from backend.models import Shop, Category, Product, ProductInfo, User, ProductInfoPhoto, Parameter, ProductParameter
+from backend.utils.search import update_search_documents
 
 
 # noinspection PyUnresolvedReferences
@@ -143,3 +144,38 @@ def test_not_duplicate_user(first_name, last_name, email, password):
         check = True
 
     assert check is True
+
+
+@pytest.mark.django_db
+def test_productinfo_main_photo(make_product, make_shop):
+    """Проверяем, что ссылка на главное изображение товара поддерживается при добавлении и удалении изображений"""
+    good = baker.make(ProductInfo, product=make_product, shop=make_shop)
+
+    first = ProductInfoPhoto.objects.create(product=good, is_main=True)
+    good.refresh_from_db()
+    assert good.main_photo == first
+
+    ProductInfoPhoto.objects.create(product=good, is_main=False)
+    good.refresh_from_db()
+    assert good.main_photo == first
+
+    second = ProductInfoPhoto.objects.create(product=good, is_main='True')
+    good.refresh_from_db()
+    first.refresh_from_db()
+    assert good.main_photo == second
+    assert first.is_main is False
+
+    second.delete()
+    good.refresh_from_db()
+    assert good.main_photo is None
+
+
+@pytest.mark.django_db
+def test_productinfo_search_document(make_product, make_shop):
+    """Проверяем, что поисковый документ товара содержит название, модель, характеристики и их значения"""
+    good = baker.make(ProductInfo, product=make_product, shop=make_shop, model='Apple-iPhone-13')
+    baker.make(ProductParameter, product=good, parameter=baker.make(Parameter, name='Цвет'), value='Синий')
+
+    assert update_search_documents([good.id]) == 1
+    good.refresh_from_db()
+    assert good.search_document == f'{make_product.name.lower()} apple-iphone-13 цвет синий'